@@ -16,4 +16,12 @@ user_collection    = database.get_collection("users")
 product_collection = database.get_collection("products")
 order_collection   = database.get_collection("orders")
 cart_collection    = database.get_collection("carts")
-review_collection = database.get_collection("reviews")
\ No newline at end of file
+review_collection = database.get_collection("reviews")
+email_outbox_collection = database.get_collection("email_outbox")
+library_collection = database.get_collection("library_images")
+blob_collection = database.get_collection("blobs")
+settings_collection = database.get_collection("settings")
+sales_rollup_collection = database.get_collection("sales_rollups")
+sales_product_collection = database.get_collection("sales_products")
+guest_cart_collection = database.get_collection("guest_carts")
+idempotency_collection = database.get_collection("idempotency_keys")
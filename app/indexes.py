@@ -0,0 +1,158 @@
+import os
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from app.database import database
+
+
+# ─────────────────────────────────────────────
+# REGISTRO DE ÍNDICES
+# colección → lista de (nombre, claves, opciones)
+# ─────────────────────────────────────────────
+
+GUEST_CART_TTL_DAYS = int(os.getenv("GUEST_CART_TTL_DAYS", "7"))
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+
+INDEXES = {
+    "users": [
+        ("email_unique",        [("email", ASCENDING)], {"unique": True}),
+        ("created_at_id",       [("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+        ("role_created_at",     [("role", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+        ("name_key_id",         [("name_key", ASCENDING), ("_id", ASCENDING)], {}),
+        ("email_key_id",        [("email_key", ASCENDING), ("_id", ASCENDING)], {}),
+    ],
+    "products": [
+        ("created_at_id",       [("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+        ("category_created_at", [("category", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+    ],
+    "carts": [
+        ("user_id_unique",      [("user_id", ASCENDING)], {"unique": True}),
+    ],
+    "guest_carts": [
+        ("user_id_unique",      [("user_id", ASCENDING)], {"unique": True}),
+        # cada cambio actualiza updated_at: el carrito expira tras N días sin uso
+        ("updated_at_ttl",      [("updated_at", ASCENDING)], {"expireAfterSeconds": GUEST_CART_TTL_DAYS * 24 * 3600}),
+    ],
+    "idempotency_keys": [
+        # la respuesta guardada solo se repite durante IDEMPOTENCY_TTL_HOURS
+        ("created_at_ttl",      [("created_at", ASCENDING)], {"expireAfterSeconds": IDEMPOTENCY_TTL_HOURS * 3600}),
+    ],
+    "orders": [
+        ("user_id_created_at_id", [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+        ("created_at_id",       [("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+        ("status_created_at",   [("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+    ],
+    "reviews": [
+        ("product_user_unique", [("product_id", ASCENDING), ("user_id", ASCENDING)], {"unique": True}),
+        ("product_created_at",  [("product_id", ASCENDING), ("created_at", DESCENDING)], {}),
+    ],
+    "reset_tokens": [
+        ("token",               [("token", ASCENDING)], {}),
+        ("email",               [("email", ASCENDING)], {}),
+        # TTL: Mongo borra el token cuando pasa la fecha de "expires"
+        ("expires_ttl",         [("expires", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+    "settings": [
+        ("key_unique",          [("key", ASCENDING)], {"unique": True}),
+    ],
+    "email_outbox": [
+        ("status_next_attempt", [("status", ASCENDING), ("next_attempt_at", ASCENDING)], {}),
+        # los enviados se conservan 7 días: ventana de deduplicación por _id
+        ("sent_ttl",            [("sent_at", ASCENDING)], {"expireAfterSeconds": 7 * 24 * 3600}),
+        # los fallidos definitivos se conservan 30 días para revisarlos
+        ("failed_ttl",          [("failed_at", ASCENDING)], {"expireAfterSeconds": 30 * 24 * 3600}),
+    ],
+    "library_images": [
+        ("filename_unique",     [("filename", ASCENDING)], {"unique": True}),
+        ("created_at_id",       [("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+        ("type_created_at",     [("type", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+    ],
+    "sales_products": [
+        ("units",               [("units", DESCENDING)], {}),
+    ],
+    "blobs": [
+        ("url",                 [("url", ASCENDING)], {"sparse": True}),
+    ],
+}
+
+
+# Índices que existieron en versiones anteriores y que un índice del registro
+# ya cubre; create_indexes los borra si siguen en la base
+DROPPED_INDEXES = {
+    # reemplazado por user_id_created_at_id (mismo prefijo + _id para los cursores)
+    "orders": ["user_id_created_at"],
+}
+
+
+async def _drop_obsolete(db):
+    dropped = []
+    for collection_name, names in DROPPED_INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        for name in names:
+            if name not in existing:
+                continue
+            try:
+                await collection.drop_index(name)
+                dropped.append(f"{collection_name}.{name}")
+            except OperationFailure as e:
+                print(f"[INDEX WARN] no se pudo borrar {collection_name}.{name}: {e}")
+    return dropped
+
+
+async def create_indexes(db=database):
+    """
+    Crea todos los índices del registro. Es idempotente: create_index no hace
+    nada si el índice ya existe con la misma definición. Un índice que falla
+    (p. ej. duplicados previos en un índice único) se reporta y no detiene el arranque.
+    Los índices de DROPPED_INDEXES se borran después de crear sus reemplazos.
+    """
+    ensured, failed = [], []
+    for collection_name, specs in INDEXES.items():
+        collection = db[collection_name]
+        for name, keys, options in specs:
+            try:
+                await collection.create_index(keys, name=name, **options)
+                ensured.append(f"{collection_name}.{name}")
+            except OperationFailure as e:
+                failed.append(f"{collection_name}.{name}")
+                print(f"[INDEX WARN] {collection_name}.{name}: {e}")
+
+    dropped = await _drop_obsolete(db)
+    print(f"[INDEX] {len(ensured)} índices verificados, {len(failed)} con error, {len(dropped)} obsoletos borrados")
+    return {"ensured": ensured, "failed": failed, "dropped": dropped}
+
+
+async def _index_usage(collection):
+    """Accesos por índice desde el último reinicio de mongod ({} si el servidor no soporta $indexStats)."""
+    try:
+        stats = await collection.aggregate([{"$indexStats": {}}]).to_list(None)
+    except Exception:
+        return {}
+    return {s["name"]: s.get("accesses", {}).get("ops", 0) for s in stats}
+
+
+async def index_report(db=database):
+    """
+    missing:    declarados en el registro pero ausentes en la base
+    undeclared: presentes en la base pero fuera del registro
+    unused:     índices sin ningún acceso según $indexStats
+    """
+    report = {"missing": [], "undeclared": [], "unused": []}
+
+    for collection_name, specs in INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        declared = {name for name, _, _ in specs}
+
+        for name in sorted(declared - set(existing)):
+            report["missing"].append(f"{collection_name}.{name}")
+        for name in sorted(set(existing) - declared - {"_id_"}):
+            report["undeclared"].append(f"{collection_name}.{name}")
+
+        for name, ops in (await _index_usage(collection)).items():
+            if name != "_id_" and ops == 0:
+                report["unused"].append(f"{collection_name}.{name}")
+
+    return report
@@ -1,5 +1,10 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from pymongo.errors import PyMongoError
+from app.indexes import create_indexes
+from app.services.email_outbox import start_email_worker, stop_email_worker
+from app.services.image_variants import shutdown_variant_pool
 from app.routes.auth_routes import router as auth_router
 from app.routes.product_routes import router as product_router
 from app.routes.order_routes import router as order_router
@@ -10,8 +15,23 @@ from app.routes.banner_routes import router as banner_router
 from app.routes.settings_routes      import router as settings_router
 from app.routes.image_library_routes import router as library_router
 from app.routes.user_routes import router as user_router
+from app.routes.analytics_routes import router as analytics_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await create_indexes()
+    except PyMongoError as e:
+        print(f"[INDEX WARN] no se pudieron crear los índices: {e}")
+    start_email_worker()
+    yield
+    await stop_email_worker()
+    shutdown_variant_pool()
+
 
 app = FastAPI(
+    lifespan=lifespan,
     title="TechStore API",
     version="1.0.0",
     description="""
@@ -100,4 +120,5 @@ app.include_router(payment_router)
 app.include_router(banner_router)
 app.include_router(settings_router)
 app.include_router(library_router)
-app.include_router(user_router)
\ No newline at end of file
+app.include_router(user_router)
+app.include_router(analytics_router)
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""
+Comandos de mantenimiento.
+
+    python -m app.manage create-indexes
+    python -m app.manage index-report
+    python -m app.manage reconcile-reviews [--product-id ID]
+    python -m app.manage rebuild-library
+    python -m app.manage backfill-user-keys
+    python -m app.manage rebuild-analytics
+"""
+import argparse
+import asyncio
+import json
+
+from app.indexes import create_indexes, index_report
+from app.services.review_service import reconcile_review_aggregates
+from app.services.library_service import rebuild_library_index
+from app.services.user_service import backfill_user_keys
+from app.services.analytics_service import rebuild_sales_rollups
+
+
+async def _create_indexes(args):
+    return await create_indexes()
+
+
+async def _index_report(args):
+    return await index_report()
+
+
+async def _reconcile_reviews(args):
+    return await reconcile_review_aggregates(args.product_id)
+
+
+async def _rebuild_library(args):
+    return await rebuild_library_index()
+
+
+async def _backfill_user_keys(args):
+    return await backfill_user_keys()
+
+
+async def _rebuild_analytics(args):
+    return await rebuild_sales_rollups()
+
+
+COMMANDS = {
+    "create-indexes":    (_create_indexes,    "Crea los índices declarados en app/indexes.py"),
+    "index-report":      (_index_report,      "Lista índices faltantes, no declarados y sin uso"),
+    "reconcile-reviews": (_reconcile_reviews, "Recalcula los agregados de rating de los productos"),
+    "rebuild-library":   (_rebuild_library,   "Reconcilia el índice de la biblioteca de imágenes con el disco"),
+    "backfill-user-keys": (_backfill_user_keys, "Agrega name_key y email_key a los usuarios antiguos (búsqueda por nombre y email)"),
+    "rebuild-analytics": (_rebuild_analytics, "Recalcula los rollups de ventas desde las órdenes"),
+}
+
+ARGUMENTS = {
+    "reconcile-reviews": [("--product-id", {"default": None, "help": "Solo este producto"})],
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        command = sub.add_parser(name, help=help_text)
+        for flag, options in ARGUMENTS.get(name, []):
+            command.add_argument(flag, **options)
+
+    args = parser.parse_args(argv)
+    handler, _ = COMMANDS[args.command]
+    result = asyncio.run(handler(args))
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List, Literal
 
 class CartItemAdd(BaseModel):
     product_id: str
@@ -6,4 +7,12 @@ class CartItemAdd(BaseModel):
 
 class CartItemUpdate(BaseModel):
     product_id: str
-    quantity: int  # si mandas 0 elimina el ítem
\ No newline at end of file
+    quantity: int  # si mandas 0 elimina el ítem
+
+class CartBatchOp(BaseModel):
+    op: Literal["add", "update", "remove"]
+    product_id: str
+    quantity: int = 1
+
+class CartBatch(BaseModel):
+    ops: List[CartBatchOp] = Field(..., min_length=1, max_length=50)
@@ -1,11 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List
 from datetime import datetime
 
 
 class OrderItem(BaseModel):
     product_id: str
-    quantity: int
+    quantity: int = Field(..., gt=0, description="Cantidad, mayor a 0")
 
 
 class OrderCreate(BaseModel):
@@ -0,0 +1,57 @@
+from datetime import date, datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.services.analytics_service import (
+    MAX_DAYS,
+    daily_sales,
+    hourly_sales,
+    top_products,
+    status_totals,
+)
+from app.utils.dependencies import get_current_admin
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+
+def _as_datetime(d: date) -> datetime:
+    return datetime(d.year, d.month, d.day)
+
+
+@router.get(
+    "/daily",
+    summary="Ventas por día (Admin)",
+    description="Órdenes, ingresos, unidades, estados y unidades por producto de cada día (UTC). Por defecto, los últimos 30 días."
+)
+async def get_daily(
+    date_from: Optional[date] = Query(None, alias="from", description="Primer día (YYYY-MM-DD)"),
+    date_to: Optional[date] = Query(None, alias="to", description="Último día, incluido"),
+    admin_user: dict = Depends(get_current_admin)
+):
+    end   = date_to or datetime.utcnow().date()
+    start = date_from or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' debe ser anterior a 'to'")
+    if (end - start).days >= MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"El rango máximo es de {MAX_DAYS} días")
+    return await daily_sales(_as_datetime(start), _as_datetime(end))
+
+
+@router.get("/hourly", summary="Ventas por hora de un día (Admin)")
+async def get_hourly(
+    day: Optional[date] = Query(None, description="Día (YYYY-MM-DD), por defecto hoy"),
+    admin_user: dict = Depends(get_current_admin)
+):
+    return await hourly_sales(_as_datetime(day or datetime.utcnow().date()))
+
+
+@router.get("/top-products", summary="Productos más vendidos (Admin)")
+async def get_top_products(
+    limit: int = Query(10, ge=1, le=100),
+    admin_user: dict = Depends(get_current_admin)
+):
+    return await top_products(limit)
+
+
+@router.get("/status", summary="Órdenes por estado (Admin)")
+async def get_status_totals(admin_user: dict = Depends(get_current_admin)):
+    return await status_totals()
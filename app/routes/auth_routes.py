@@ -1,17 +1,25 @@
 import secrets
 from datetime import datetime, timedelta
 
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
+from typing import Optional
 from bson import ObjectId
-from passlib.context import CryptContext
 
 from app.models.user_model import UserCreate
 from app.models.token_model import RefreshTokenRequest
 from app.services.auth_service import register_user, authenticate_user
-from app.utils.auth_utils import decode_token, create_access_token, create_refresh_token
-from app.utils.dependencies import get_current_admin, get_current_user
+from app.services.cart_service import merge_guest_cart_service
+from app.utils.auth_utils import (
+    decode_token,
+    guest_id_from_token,
+    create_access_token,
+    create_refresh_token,
+    hash_password_async,
+    password_hash_stats,
+)
+from app.utils.dependencies import get_current_admin, get_current_user, invalidate_user
 from app.database import user_collection, database
 from app.services.email_service import (
     send_welcome_email,
@@ -20,7 +28,6 @@ from app.services.email_service import (
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
-pwd_context       = CryptContext(schemes=["bcrypt"], deprecated="auto")
 reset_tokens_col  = database["reset_tokens"]
 
 
@@ -32,18 +39,30 @@ async def register(user: UserCreate):
 
     # Email de bienvenida (no bloquea si falla)
     try:
-        send_welcome_email(user.email, user.name)
+        await send_welcome_email(user.email, user.name)
     except Exception as e:
         print(f"[EMAIL WARN] welcome: {e}")
 
     return {"message": "Usuario creado correctamente"}
 
 
-@router.post("/login", summary="Iniciar sesión")
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+@router.post(
+    "/login",
+    summary="Iniciar sesión",
+    description="Con el header `X-Guest-Token` el carrito de invitado se fusiona con el del usuario."
+)
+async def login(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    x_guest_token: Optional[str] = Header(None, alias="X-Guest-Token"),
+):
     token = await authenticate_user(form_data.username, form_data.password)
     if not token:
         raise HTTPException(status_code=401, detail="Credenciales incorrectas")
+
+    guest_id = guest_id_from_token(x_guest_token)
+    if guest_id:
+        user_id = decode_token(token["access_token"])["user_id"]
+        token["cart_merge"] = await merge_guest_cart_service(guest_id, user_id)
     return token
 
 
@@ -93,9 +112,15 @@ async def update_user_role(body: RoleUpdate, admin: dict = Depends(get_current_a
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
+    invalidate_user(body.user_id)
     return {"message": f"Rol actualizado a '{body.role}' correctamente"}
 
 
+@router.get("/hash-stats", summary="Métricas del pool de hashing (Admin)")
+async def hash_stats(admin: dict = Depends(get_current_admin)):
+    return password_hash_stats()
+
+
 # ── RECUPERACIÓN DE CONTRASEÑA ────────────────────────────────────────────────
 
 @router.post("/forgot-password", summary="Solicitar recuperación de contraseña")
@@ -122,7 +147,7 @@ async def forgot_password(request: Request):
     )
 
     try:
-        send_password_reset(
+        await send_password_reset(
             user_email=email,
             user_name=user.get("name", "Usuario"),
             reset_token=token,
@@ -153,11 +178,11 @@ async def reset_password(body: ResetPasswordBody):
     if datetime.utcnow() > record["expires"]:
         raise HTTPException(status_code=400, detail="Token expirado — solicita uno nuevo")
 
-    hashed = pwd_context.hash(body.new_password)
+    hashed = await hash_password_async(body.new_password)
 
     await user_collection.update_one(
         {"email": record["email"]},
-        {"$set": {"password": hashed}}
+        {"$set": {"hashed_password": hashed}}
     )
     await reset_tokens_col.update_one(
         {"token": body.token},
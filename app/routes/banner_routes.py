@@ -1,10 +1,13 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Request, Response
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import os, shutil, json
+import os, json, hashlib, tempfile, fcntl
 from pathlib import Path
 from typing import Optional
 from app.utils.dependencies import get_current_moderator
+from app.services.blob_store import store_file, release_file
+from app.services.image_variants import generate_variants, remove_variants, build_srcset
+from app.utils.etag import etag_matches
 
 router = APIRouter(prefix="/banners", tags=["Banners"])
 
@@ -14,6 +17,13 @@ META_FILE   = BANNERS_DIR / "_meta.json"
 def ensure_dir():
     BANNERS_DIR.mkdir(parents=True, exist_ok=True)
 
+VALID_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.webp', '.gif']
+BANNERS_CACHE_CONTROL = "public, max-age=60"
+
+# Catálogo en memoria: se reconstruye solo si cambia el mtime del directorio
+# (altas/bajas de archivos) o de _meta.json, o si un endpoint lo invalida.
+_catalog = {"stamp": None, "items": [], "etag": None}
+
 def read_meta() -> dict:
     if META_FILE.exists():
         try:
@@ -23,16 +33,56 @@ def read_meta() -> dict:
     return {}
 
 def write_meta(data: dict):
-    META_FILE.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-
-@router.get("/", summary="Listar banners")
-async def list_banners():
+    """Escritura atómica: archivo temporal en el mismo directorio + os.replace."""
+    fd, tmp_path = tempfile.mkstemp(dir=BANNERS_DIR, prefix=".meta_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp:
+            json.dump(data, tmp, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, META_FILE)
+    except:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+def update_meta(filename: str, change) -> dict:
+    """
+    Lee, modifica y escribe _meta.json con flock sobre _meta.lock, así no se
+    pisan ediciones concurrentes aunque haya varios workers. change recibe la
+    entrada actual ({} si no existe) y devuelve la nueva, o None para eliminarla.
+    Devuelve el contenido de _meta.json tal como estaba antes del cambio.
+    """
+    with open(META_FILE.with_suffix(".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            meta = read_meta()
+            before = dict(meta)
+            info = change(meta.get(filename, {}))
+            if info is None:
+                meta.pop(filename, None)
+            else:
+                meta[filename] = info
+            write_meta(meta)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    invalidate_catalog()
+    return before
+
+def invalidate_catalog():
+    _catalog["stamp"] = None
+
+def _stamp():
+    meta_mtime = META_FILE.stat().st_mtime_ns if META_FILE.exists() else 0
+    return (BANNERS_DIR.stat().st_mtime_ns, meta_mtime)
+
+def load_catalog():
     ensure_dir()
+    stamp = _stamp()
+    if _catalog["stamp"] == stamp:
+        return _catalog["items"], _catalog["etag"]
+
     meta = read_meta()
     files = []
-    valid = ['.png', '.jpg', '.jpeg', '.webp', '.gif']
     for f in sorted(BANNERS_DIR.iterdir()):
-        if f.is_file() and f.suffix.lower() in valid and f.name != "_meta.json":
+        if f.is_file() and f.suffix.lower() in VALID_EXTENSIONS and f.name != "_meta.json":
             info = meta.get(f.name, {})
             files.append({
                 "filename": f.name,
@@ -40,8 +90,24 @@ async def list_banners():
                 "size":     f.stat().st_size,
                 "link":     info.get("link", ""),
                 "alt":      info.get("alt", f.name),
+                "srcset":   build_srcset("/banners", info.get("sha256"), info.get("variants")),
             })
-    return files
+
+    raw = json.dumps(files, ensure_ascii=False, sort_keys=True).encode()
+    _catalog.update({
+        "stamp": stamp,
+        "items": files,
+        "etag":  f'"{hashlib.sha1(raw).hexdigest()[:16]}"',
+    })
+    return files, _catalog["etag"]
+
+@router.get("/", summary="Listar banners")
+async def list_banners(request: Request):
+    files, etag = load_catalog()
+    headers = {"ETag": etag, "Cache-Control": BANNERS_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=files, headers=headers)
 
 @router.post("/upload", summary="Subir banner")
 async def upload_banner(
@@ -54,27 +120,22 @@ async def upload_banner(
     if file.content_type not in ["image/jpeg", "image/png", "image/webp", "image/gif"]:
         raise HTTPException(status_code=400, detail="Solo JPG, PNG, WEBP o GIF")
 
-    safe_name = file.filename.replace(" ", "_")
-    dest = BANNERS_DIR / safe_name
-    counter = 1
-    stem, suffix = Path(safe_name).stem, Path(safe_name).suffix
-    while dest.exists():
-        safe_name = f"{stem}_{counter}{suffix}"
-        dest = BANNERS_DIR / safe_name
-        counter += 1
-
-    with open(dest, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    meta = read_meta()
-    meta[safe_name] = {"link": link, "alt": alt or safe_name}
-    write_meta(meta)
+    stored = await store_file(file.file, BANNERS_DIR, file.filename.replace(" ", "_"))
+    safe_name = stored["filename"]
+    variants = await generate_variants(BANNERS_DIR / safe_name, stored["sha256"])
+    update_meta(safe_name, lambda _: {
+        "link": link,
+        "alt": alt or safe_name,
+        "sha256": stored["sha256"],
+        "variants": variants,
+    })
 
     return {
         "filename": safe_name,
         "url":  f"/banners/{safe_name}",
         "link": link,
         "alt":  alt or safe_name,
+        "srcset": build_srcset("/banners", stored["sha256"], variants),
         "message": "Banner guardado"
     }
 
@@ -90,13 +151,18 @@ async def update_banner(
 ):
     if ".." in filename or "/" in filename:
         raise HTTPException(status_code=400, detail="Nombre inválido")
-    meta = read_meta()
-    meta[filename] = {
+    ensure_dir()
+    info = {
         "link": body.link or "",
         "alt":  body.alt  or filename,
     }
-    write_meta(meta)
-    return {"message": "Metadatos actualizados", "filename": filename, **meta[filename]}
+    # el hash y los derivados son del archivo, no de los metadatos editables;
+    # se leen dentro del lock para no perder los de una subida concurrente
+    def keep_file_fields(previous: dict) -> dict:
+        kept = {k: previous[k] for k in ("sha256", "variants") if k in previous}
+        return {**info, **kept}
+    update_meta(filename, keep_file_fields)
+    return {"message": "Metadatos actualizados", "filename": filename, **info}
 
 @router.delete("/{filename}", summary="Eliminar banner")
 async def delete_banner(
@@ -110,8 +176,9 @@ async def delete_banner(
     if not dest.exists():
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
 
-    dest.unlink()
-    meta = read_meta()
-    meta.pop(filename, None)
-    write_meta(meta)
+    meta = update_meta(filename, lambda _: None)
+    sha256 = meta.get(filename, {}).get("sha256")
+    await release_file(dest, sha256)
+    if not any(i.get("sha256") == sha256 for name, i in meta.items() if name != filename):
+        remove_variants(BANNERS_DIR, sha256)
     return {"message": f"{filename} eliminado"}
\ No newline at end of file
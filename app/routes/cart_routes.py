@@ -1,13 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends
-from app.models.cart_model import CartItemAdd, CartItemUpdate
+from fastapi import APIRouter, HTTPException, Depends, Query
+from app.models.cart_model import CartItemAdd, CartItemUpdate, CartBatch
 from app.services.cart_service import (
     get_cart_service,
+    refresh_cart_service,
     add_to_cart_service,
     update_cart_item_service,
     remove_from_cart_service,
     clear_cart_service,
+    batch_cart_service,
 )
-from app.utils.dependencies import get_current_user
+from app.utils.auth_utils import create_guest_token, GUEST_TOKEN_EXPIRE_DAYS
+from app.utils.dependencies import get_current_user, get_guest_id
 
 router = APIRouter(prefix="/cart", tags=["Cart"])
 
@@ -21,9 +24,17 @@ def _check(result: dict):
 @router.get(
     "/",
     summary="Ver mi carrito",
-    description="Obtiene el carrito actual del usuario con todos los productos y el total."
+    description=(
+        "Obtiene el carrito actual del usuario con todos los productos y el total. "
+        "Con `refresh=true` revalida precios y stock y devuelve `alerts` con los cambios."
+    )
 )
-async def view_cart(current_user: dict = Depends(get_current_user)):
+async def view_cart(
+    refresh: bool = Query(False, description="Revalidar precios y stock"),
+    current_user: dict = Depends(get_current_user)
+):
+    if refresh:
+        return await refresh_cart_service(str(current_user["_id"]))
     return await get_cart_service(str(current_user["_id"]))
 
 
@@ -57,10 +68,75 @@ async def remove_item(product_id: str, current_user: dict = Depends(get_current_
     return _check(result)
 
 
+@router.post(
+    "/batch",
+    summary="Varias operaciones sobre el carrito",
+    description=(
+        "Aplica en orden una lista de operaciones `add`, `update` y `remove` con una sola "
+        "lectura de productos y una sola escritura del carrito. Devuelve el carrito y el "
+        "resultado de cada operación."
+    )
+)
+async def batch(body: CartBatch, current_user: dict = Depends(get_current_user)):
+    ops = [op.model_dump() for op in body.ops]
+    return _check(await batch_cart_service(str(current_user["_id"]), ops))
+
+
 @router.delete(
     "/clear",
     summary="Vaciar carrito",
     description="Elimina todos los productos del carrito."
 )
 async def clear(current_user: dict = Depends(get_current_user)):
-    return await clear_cart_service(str(current_user["_id"]))
\ No newline at end of file
+    return await clear_cart_service(str(current_user["_id"]))
+
+
+# ─────────────────────────────────────────────
+# CARRITO DE INVITADO
+# Se identifica con el header X-Guest-Token. Al iniciar sesión con ese
+# header el carrito se fusiona con el del usuario.
+# ─────────────────────────────────────────────
+
+@router.post(
+    "/guest/token",
+    summary="Crear carrito de invitado",
+    description="Devuelve un token firmado para usar en el header `X-Guest-Token`."
+)
+async def create_guest_cart_token():
+    return {"guest_token": create_guest_token(), "expires_in_days": GUEST_TOKEN_EXPIRE_DAYS}
+
+
+@router.get("/guest", summary="Ver carrito de invitado")
+async def view_guest_cart(
+    refresh: bool = Query(False, description="Revalidar precios y stock"),
+    guest_id: str = Depends(get_guest_id)
+):
+    if refresh:
+        return await refresh_cart_service(guest_id, guest=True)
+    return await get_cart_service(guest_id, guest=True)
+
+
+@router.post("/guest/add", summary="Agregar producto al carrito de invitado")
+async def add_guest_item(item: CartItemAdd, guest_id: str = Depends(get_guest_id)):
+    return _check(await add_to_cart_service(guest_id, item.product_id, item.quantity, guest=True))
+
+
+@router.put("/guest/update", summary="Actualizar cantidad en el carrito de invitado")
+async def update_guest_item(item: CartItemUpdate, guest_id: str = Depends(get_guest_id)):
+    return _check(await update_cart_item_service(guest_id, item.product_id, item.quantity, guest=True))
+
+
+@router.delete("/guest/remove/{product_id}", summary="Eliminar producto del carrito de invitado")
+async def remove_guest_item(product_id: str, guest_id: str = Depends(get_guest_id)):
+    return _check(await remove_from_cart_service(guest_id, product_id, guest=True))
+
+
+@router.post("/guest/batch", summary="Varias operaciones sobre el carrito de invitado")
+async def batch_guest(body: CartBatch, guest_id: str = Depends(get_guest_id)):
+    ops = [op.model_dump() for op in body.ops]
+    return _check(await batch_cart_service(guest_id, ops, guest=True))
+
+
+@router.delete("/guest/clear", summary="Vaciar carrito de invitado")
+async def clear_guest(guest_id: str = Depends(get_guest_id)):
+    return await clear_cart_service(guest_id, guest=True)
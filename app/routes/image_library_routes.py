@@ -1,28 +1,40 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-import shutil
-from pathlib import Path
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
+from typing import Optional
 from app.utils.dependencies import get_current_moderator
+from app.utils.pagination import DEFAULT_LIMIT, MAX_LIMIT
+from app.services.blob_store import store_file, release_file, blob_stats
+from app.services.image_variants import generate_variants, remove_variants, build_srcset
+from app.services.library_service import (
+    LIBRARY_DIR,
+    record_image,
+    remove_image,
+    sha_in_use,
+    list_library_service,
+    list_library_page_service,
+)
 
 router = APIRouter(prefix="/library", tags=["Image Library"])
 
-LIBRARY_DIR = Path(__file__).resolve().parents[3] / "frontend" / "public" / "library"
-
 def ensure_dir():
     LIBRARY_DIR.mkdir(parents=True, exist_ok=True)
 
-@router.get("/", summary="Listar imágenes de la biblioteca")
-async def list_images():
-    ensure_dir()
-    files = []
-    valid = ['.png', '.jpg', '.jpeg', '.webp', '.gif']
-    for f in sorted(LIBRARY_DIR.iterdir(), key=lambda x: x.stat().st_mtime, reverse=True):
-        if f.is_file() and f.suffix.lower() in valid:
-            files.append({
-                "filename": f.name,
-                "url": f"/library/{f.name}",
-                "size": f.stat().st_size
-            })
-    return files
+@router.get(
+    "/",
+    summary="Listar imágenes de la biblioteca",
+    description=(
+        "Lista desde el índice de la biblioteca (más recientes primero), sin recorrer el disco. "
+        "Con `limit` devuelve `{items, next_cursor}`."
+    )
+)
+async def list_images(
+    prefix: Optional[str] = Query(None, description="Filtrar por inicio del nombre"),
+    type: Optional[str] = Query(None, description="png, jpg, webp o gif"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT, description="Imágenes por página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en next_cursor"),
+):
+    if limit is None and not cursor:
+        return await list_library_service(prefix, type)
+    return await list_library_page_service(limit or DEFAULT_LIMIT, cursor, prefix, type)
 
 @router.post("/upload", summary="Subir imagen a la biblioteca")
 async def upload_image(
@@ -33,23 +45,21 @@ async def upload_image(
     if file.content_type not in ["image/jpeg", "image/png", "image/webp", "image/gif"]:
         raise HTTPException(status_code=400, detail="Solo JPG, PNG, WEBP o GIF")
 
-    safe_name = file.filename.replace(" ", "_")
-    dest = LIBRARY_DIR / safe_name
-
-    counter = 1
-    stem = Path(safe_name).stem
-    suffix = Path(safe_name).suffix
-    while dest.exists():
-        safe_name = f"{stem}_{counter}{suffix}"
-        dest = LIBRARY_DIR / safe_name
-        counter += 1
-
-    with open(dest, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # content-addressed: si el mismo contenido ya existe no ocupa disco extra;
+    # si el nombre está tomado por otra imagen se desambigua con el hash
+    stored = await store_file(file.file, LIBRARY_DIR, file.filename.replace(" ", "_"))
+    safe_name = stored["filename"]
+    variants = await generate_variants(LIBRARY_DIR / safe_name, stored["sha256"])
+    doc = await record_image(LIBRARY_DIR / safe_name, stored["sha256"], stored["size"], variants=variants)
 
     return {
         "filename": safe_name,
         "url": f"/library/{safe_name}",
+        "width": doc["width"],
+        "height": doc["height"],
+        "sha256": stored["sha256"],
+        "srcset": build_srcset("/library", stored["sha256"], variants),
+        "deduplicated": stored["deduplicated"],
         "message": "Imagen guardada en biblioteca"
     }
 
@@ -65,5 +75,13 @@ async def delete_image(
     if not dest.exists():
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
 
-    dest.unlink()
-    return {"message": f"{filename} eliminado"}
\ No newline at end of file
+    doc = await remove_image(filename)
+    sha256 = doc.get("sha256") if doc else None
+    await release_file(dest, sha256)
+    if not await sha_in_use(sha256):
+        remove_variants(LIBRARY_DIR, sha256)
+    return {"message": f"{filename} eliminado"}
+
+@router.get("/storage-stats", summary="Estadísticas de deduplicación de imágenes")
+async def storage_stats(current_user: dict = Depends(get_current_moderator)):
+    return await blob_stats()
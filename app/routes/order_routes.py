@@ -1,12 +1,23 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
 from app.models.order_model import OrderCreate, OrderStatusUpdate
 from app.services.order_services import (
     create_order_service,
     create_order_from_cart_service,
     get_user_orders_service,
+    get_user_orders_page_service,
+    get_order_service,
+    reorder_service,
     get_all_orders_service,
+    get_all_orders_page_service,
+    orders_query,
     update_order_status_service,
 )
+from app.services.idempotency import run_idempotent
+from app.services.order_export import stream_orders_ndjson, stream_orders_csv
+from app.utils.pagination import DEFAULT_LIMIT, MAX_LIMIT
 from app.utils.dependencies import get_current_user, get_current_admin
 from app.database import user_collection, order_collection
 from app.services.email_service import (
@@ -19,44 +30,174 @@ from bson import ObjectId
 router = APIRouter(prefix="/orders", tags=["Orders"])
 
 
-@router.post("/from-cart", summary="Confirmar compra desde el carrito")
-async def create_from_cart(current_user: dict = Depends(get_current_user)):
-    order = await create_order_from_cart_service(str(current_user["_id"]))
+IDEMPOTENCY_DESCRIPTION = (
+    "Con el header `Idempotency-Key` los reintentos con la misma clave devuelven la "
+    "respuesta de la primera ejecución (con `Idempotent-Replayed: true`) sin crear otra orden."
+)
 
-    # Emails de confirmación
-    try:
-        send_order_confirmation(order, current_user["email"], current_user.get("name", "Cliente"))
-        send_admin_new_order(order,    current_user["email"], current_user.get("name", "Cliente"))
-    except Exception as e:
-        print(f"[EMAIL WARN] from_cart: {e}")
 
+@router.post(
+    "/from-cart",
+    summary="Confirmar compra desde el carrito",
+    description=IDEMPOTENCY_DESCRIPTION
+)
+async def create_from_cart(
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: dict = Depends(get_current_user)
+):
+    async def place():
+        order = await create_order_from_cart_service(str(current_user["_id"]))
+
+        # Emails de confirmación
+        try:
+            await send_order_confirmation(order, current_user["email"], current_user.get("name", "Cliente"))
+            await send_admin_new_order(order,    current_user["email"], current_user.get("name", "Cliente"))
+        except Exception as e:
+            print(f"[EMAIL WARN] from_cart: {e}")
+
+        return order
+
+    order, replayed = await run_idempotent(
+        idempotency_key, "orders.from_cart", str(current_user["_id"]), {}, place
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
     return order
 
 
-@router.post("/", summary="Crear orden manual")
+@router.post("/", summary="Crear orden manual", description=IDEMPOTENCY_DESCRIPTION)
 async def create_order(
     order: OrderCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: dict = Depends(get_current_user)
 ):
-    created = await create_order_service(str(current_user["_id"]), order)
+    async def place():
+        created = await create_order_service(str(current_user["_id"]), order)
+
+        try:
+            await send_order_confirmation(created, current_user["email"], current_user.get("name", "Cliente"))
+            await send_admin_new_order(created,    current_user["email"], current_user.get("name", "Cliente"))
+        except Exception as e:
+            print(f"[EMAIL WARN] create_order: {e}")
+
+        return created
+
+    created, replayed = await run_idempotent(
+        idempotency_key, "orders.create", str(current_user["_id"]), order.model_dump(), place
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return created
 
-    try:
-        send_order_confirmation(created, current_user["email"], current_user.get("name", "Cliente"))
-        send_admin_new_order(created,    current_user["email"], current_user.get("name", "Cliente"))
-    except Exception as e:
-        print(f"[EMAIL WARN] create_order: {e}")
 
-    return created
+@router.get(
+    "/my-orders",
+    summary="Mis órdenes",
+    description=(
+        "Con `limit` o `cursor` devuelve `{items, next_cursor}` con un resumen por orden "
+        "(total, estado, fecha, cantidad de ítems y primera imagen). El detalle está en `/orders/{order_id}`."
+    )
+)
+async def get_my_orders(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT, description="Órdenes por página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en next_cursor"),
+    current_user: dict = Depends(get_current_user)
+):
+    if limit is None and not cursor:
+        return await get_user_orders_service(str(current_user["_id"]))
+    return await get_user_orders_page_service(str(current_user["_id"]), limit or DEFAULT_LIMIT, cursor)
+
 
+@router.get(
+    "/all",
+    summary="Todas las órdenes (Admin)",
+    description="Con `limit` o `cursor` devuelve `{items, next_cursor}` (más recientes primero)."
+)
+async def get_all_orders(
+    status: Optional[str] = Query(None, description="Filtrar por estado"),
+    date_from: Optional[datetime] = Query(None, alias="from", description="Desde (incluido)"),
+    date_to: Optional[datetime] = Query(None, alias="to", description="Hasta (excluido)"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT, description="Órdenes por página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en next_cursor"),
+    admin_user: dict = Depends(get_current_admin)
+):
+    query = orders_query(status, date_from, date_to)
+    if limit is None and not cursor:
+        return await get_all_orders_service(query)
+    return await get_all_orders_page_service(limit or DEFAULT_LIMIT, cursor, query)
+
+
+EXPORT_FORMATS = {
+    "ndjson": (stream_orders_ndjson, "application/x-ndjson"),
+    "csv":    (stream_orders_csv,    "text/csv; charset=utf-8"),
+}
+
+
+@router.get(
+    "/export",
+    summary="Exportar órdenes (Admin)",
+    description="Descarga las órdenes en NDJSON o CSV, generadas en streaming desde la base."
+)
+async def export_orders(
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    status: Optional[str] = Query(None, description="Filtrar por estado"),
+    date_from: Optional[datetime] = Query(None, alias="from", description="Desde (incluido)"),
+    date_to: Optional[datetime] = Query(None, alias="to", description="Hasta (excluido)"),
+    admin_user: dict = Depends(get_current_admin)
+):
+    query = orders_query(status, date_from, date_to)
+    stream, media_type = EXPORT_FORMATS[format]
+    filename = f"orders_{datetime.utcnow():%Y%m%d_%H%M%S}.{format}"
+    return StreamingResponse(
+        stream(query),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/{order_id}", summary="Detalle de una orden")
+async def get_order(order_id: str, current_user: dict = Depends(get_current_user)):
+    return await get_order_service(order_id, current_user)
+
+
+@router.post(
+    "/{order_id}/reorder",
+    summary="Volver a pedir una orden",
+    description=(
+        "Revalida precio y stock de los ítems de una orden propia. Con `mode=cart` los agrega "
+        "al carrito; con `mode=order` crea la orden directamente. Informa los ítems no "
+        "disponibles, las cantidades recortadas al stock y los cambios de precio. "
+        + IDEMPOTENCY_DESCRIPTION
+    )
+)
+async def reorder(
+    order_id: str,
+    response: Response,
+    mode: Literal["cart", "order"] = Query("cart"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: dict = Depends(get_current_user)
+):
+    async def place():
+        result = await reorder_service(order_id, str(current_user["_id"]), mode)
 
-@router.get("/my-orders", summary="Mis órdenes")
-async def get_my_orders(current_user: dict = Depends(get_current_user)):
-    return await get_user_orders_service(str(current_user["_id"]))
+        if mode == "order":
+            try:
+                await send_order_confirmation(result["order"], current_user["email"], current_user.get("name", "Cliente"))
+                await send_admin_new_order(result["order"],    current_user["email"], current_user.get("name", "Cliente"))
+            except Exception as e:
+                print(f"[EMAIL WARN] reorder: {e}")
 
+        return result
 
-@router.get("/all", summary="Todas las órdenes (Admin)")
-async def get_all_orders(admin_user: dict = Depends(get_current_admin)):
-    return await get_all_orders_service()
+    result, replayed = await run_idempotent(
+        idempotency_key, "orders.reorder", str(current_user["_id"]),
+        {"order_id": order_id, "mode": mode}, place
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
 
 
 @router.put("/{order_id}/status", summary="Actualizar estado de orden (Admin)")
@@ -73,7 +214,7 @@ async def update_status(
         if order and order.get("user_id"):
             user = await user_collection.find_one({"_id": ObjectId(order["user_id"])})
             if user:
-                send_order_status_update(
+                await send_order_status_update(
                     order=order,
                     user_email=user["email"],
                     user_name=user.get("name", "Cliente"),
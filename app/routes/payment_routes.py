@@ -1,9 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
 from pydantic import BaseModel
 import stripe
 import os
 from app.utils.dependencies import get_current_user
 from app.database import order_collection
+from app.services.idempotency import run_idempotent
 from bson import ObjectId
 
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
@@ -23,39 +25,58 @@ class ConfirmPayment(BaseModel):
 @router.post(
     "/create-payment-intent",
     summary="Crear intención de pago",
-    description="Crea un PaymentIntent de Stripe para procesar el pago de una orden."
+    description=(
+        "Crea un PaymentIntent de Stripe para procesar el pago de una orden. Con el header "
+        "`Idempotency-Key` los reintentos devuelven el mismo PaymentIntent."
+    )
 )
 async def create_payment_intent(
     body: PaymentIntent,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: dict = Depends(get_current_user)
 ):
-    try:
-        order = await order_collection.find_one({"_id": ObjectId(body.order_id)})
-        if not order:
-            raise HTTPException(status_code=404, detail="Orden no encontrada")
-
-        if str(order["user_id"]) != str(current_user["_id"]):
-            raise HTTPException(status_code=403, detail="No autorizado")
-
-        amount = int(order["total"] * 100)
+    user_id = str(current_user["_id"])
+
+    async def create_intent():
+        try:
+            order = await order_collection.find_one({"_id": ObjectId(body.order_id)})
+            if not order:
+                raise HTTPException(status_code=404, detail="Orden no encontrada")
+
+            if str(order["user_id"]) != user_id:
+                raise HTTPException(status_code=403, detail="No autorizado")
+
+            amount = int(order["total"] * 100)
+
+            # Stripe también deduplica: cubre el caso en que nuestra respuesta
+            # no llegó a guardarse pero el PaymentIntent sí se creó
+            options = {"idempotency_key": f"pi:{user_id}:{idempotency_key}"} if idempotency_key else {}
+            intent = stripe.PaymentIntent.create(
+                amount=amount,
+                currency="pen",
+                metadata={
+                    "order_id": body.order_id,
+                    "user_id": user_id
+                },
+                **options
+            )
 
-        intent = stripe.PaymentIntent.create(
-            amount=amount,
-            currency="pen",
-            metadata={
-                "order_id": body.order_id,
-                "user_id": str(current_user["_id"])
+            return {
+                "client_secret": intent.client_secret,
+                "payment_intent_id": intent.id,
+                "amount": order["total"]
             }
-        )
 
-        return {
-            "client_secret": intent.client_secret,
-            "payment_intent_id": intent.id,
-            "amount": order["total"]
-        }
+        except stripe.error.StripeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-    except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    result, replayed = await run_idempotent(
+        idempotency_key, "payments.intent", user_id, body.model_dump(), create_intent
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
 
 
 @router.post(
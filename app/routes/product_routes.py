@@ -1,22 +1,48 @@
 from fastapi import APIRouter, HTTPException, Query, Depends, status, UploadFile, File
-from typing import Optional
-import cloudinary
-import cloudinary.uploader
-import time
+from typing import List, Optional
 from bson import ObjectId
 
-from app.cloudinary_config import *
 from app.utils.dependencies import get_current_moderator
 from app.models.product_model import ProductCreate
 from app.database import product_collection
+from app.services.search_service import product_search
+from app.services.stock_service import invalidate_product_snapshots
+from app.utils.pagination import parse_fields, DEFAULT_LIMIT, MAX_LIMIT
 from app.services.product_service import (
     create_product_service,
     get_products_service,
+    get_products_page_service,
+    search_products_service,
+    search_products_page_service,
     get_product_by_id_service,
     delete_product_service,
     update_product_images_service,
+    add_product_images_service,
     delete_product_image_service
 )
+from app.services.image_storage import (
+    ALLOWED_IMAGE_TYPES,
+    new_public_id,
+    upload_image as store_image,
+    upload_images as store_images,
+    release_image,
+    delete_image as remove_stored_image,
+)
+
+PRODUCT_IMAGES_FOLDER = "techstore/products"
+MAX_IMAGES_PER_UPLOAD = 10
+
+
+async def _release_repeated(current_images: list, new_urls: list):
+    """
+    Con deduplicación, subir una imagen que el producto ya tiene devuelve la
+    misma URL: esa referencia extra se suelta porque la galería no la agrega.
+    """
+    seen = set(current_images)
+    for url in new_urls:
+        if url in seen:
+            await release_image(url)
+        seen.add(url)
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
@@ -57,13 +83,21 @@ async def update_product(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
 
-    return await get_product_by_id_service(product_id)
+    invalidate_product_snapshots([product_id])
+    updated = await get_product_by_id_service(product_id)
+    if not updated:
+        # se borró entre la actualización y la relectura
+        product_search.remove(product_id)
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    if "name" in update_data or "description" in update_data:
+        product_search.add(updated)
+    return updated
 
 
 @router.post(
     "/{product_id}/upload-image",
     summary="Subir imagen del producto",
-    description="Sube una imagen a Cloudinary y la agrega a la galería del producto."
+    description="Sube una imagen al almacenamiento de imágenes (Cloudinary) y la agrega a la galería del producto."
 )
 async def upload_image(
     product_id: str,
@@ -74,20 +108,11 @@ async def upload_image(
     if not product:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
 
-    if file.content_type not in ["image/jpeg", "image/png", "image/webp"]:
+    if file.content_type not in ALLOWED_IMAGE_TYPES:
         raise HTTPException(status_code=400, detail="Solo se permiten imágenes JPG, PNG o WEBP")
 
-    unique_id = f"product_{product_id}_{int(time.time())}"
-
-    contents = await file.read()
-    result = cloudinary.uploader.upload(
-        contents,
-        folder="techstore/products",
-        public_id=unique_id,
-        resource_type="image"
-    )
-
-    image_url = result["secure_url"]
+    image_url = await store_image(file, PRODUCT_IMAGES_FOLDER, new_public_id(f"product_{product_id}"))
+    await _release_repeated(product.get("images", []), [image_url])
     updated = await update_product_images_service(product_id, image_url)
 
     return {
@@ -98,6 +123,37 @@ async def upload_image(
     }
 
 
+@router.post(
+    "/{product_id}/upload-images",
+    summary="Subir varias imágenes del producto",
+    description=f"Sube hasta {MAX_IMAGES_PER_UPLOAD} imágenes en paralelo y las agrega a la galería en una sola escritura."
+)
+async def upload_images(
+    product_id: str,
+    files: List[UploadFile] = File(...),
+    current_user: dict = Depends(get_current_moderator)
+):
+    product = await get_product_by_id_service(product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+
+    if len(files) > MAX_IMAGES_PER_UPLOAD:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_IMAGES_PER_UPLOAD} imágenes por subida")
+    if any(f.content_type not in ALLOWED_IMAGE_TYPES for f in files):
+        raise HTTPException(status_code=400, detail="Solo se permiten imágenes JPG, PNG o WEBP")
+
+    image_urls = await store_images(files, PRODUCT_IMAGES_FOLDER, f"product_{product_id}")
+    await _release_repeated(product.get("images", []), image_urls)
+    updated = await add_product_images_service(product_id, image_urls)
+
+    return {
+        "message": f"{len(image_urls)} imágenes agregadas a la galería",
+        "image_urls": image_urls,
+        "total_imagenes": len(updated["images"]),
+        "product": updated
+    }
+
+
 @router.delete(
     "/{product_id}/delete-image",
     summary="Eliminar imagen del producto",
@@ -115,8 +171,7 @@ async def delete_image(
     if image_url not in product["images"]:
         raise HTTPException(status_code=404, detail="Imagen no encontrada en el producto")
 
-    public_id = image_url.split("/")[-1].split(".")[0]
-    cloudinary.uploader.destroy(f"techstore/products/{public_id}")
+    await remove_stored_image(PRODUCT_IMAGES_FOLDER, image_url)
 
     updated = await delete_product_image_service(product_id, image_url)
 
@@ -130,13 +185,21 @@ async def delete_image(
 @router.get(
     "/",
     summary="Listar productos",
-    description="Obtiene todos los productos. Puedes filtrar por categoría, precio y buscar por nombre."
+    description=(
+        "Obtiene todos los productos. Puedes filtrar por categoría, precio y buscar por nombre. "
+        "Si envías `limit` la respuesta se pagina: `{items, next_cursor}`; pasa `next_cursor` "
+        "como `cursor` para la siguiente página. `fields` limita los campos devueltos. "
+        "Con `search` los resultados se ordenan por relevancia y el cursor avanza en ese orden."
+    )
 )
 async def get_products(
     category: Optional[str] = Query(None, description="Categoría: smartphones, laptops, gaming, audio, cameras, components"),
     min_price: Optional[float] = Query(None, description="Precio mínimo"),
     max_price: Optional[float] = Query(None, description="Precio máximo"),
-    search: Optional[str] = Query(None, description="Buscar por nombre o descripción"),
+    search: Optional[str] = Query(None, description="Buscar por nombre o descripción (sin tildes, admite prefijos)"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT, description="Productos por página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en next_cursor"),
+    fields: Optional[str] = Query(None, description="Campos a devolver, separados por coma: name,price,images"),
 ):
     query = {}
     if category:
@@ -147,12 +210,16 @@ async def get_products(
             query["price"]["$gte"] = min_price
         if max_price is not None:
             query["price"]["$lte"] = max_price
+
+    projection = parse_fields(fields)
     if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}}
-        ]
-    return await get_products_service(query)
+        if limit is not None or cursor:
+            return await search_products_page_service(query, search, limit or DEFAULT_LIMIT, cursor, projection)
+        return await search_products_service(query, search, projection)
+
+    if limit is not None or cursor:
+        return await get_products_page_service(query, limit or DEFAULT_LIMIT, cursor, projection)
+    return await get_products_service(query, projection)
 
 
 @router.get(
@@ -178,6 +245,14 @@ async def delete_product(
     current_user: dict = Depends(get_current_moderator)
 ):
     deleted = await delete_product_service(product_id)
-    if deleted == 0:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
+
+    # cada imagen suelta su referencia; se borra si ningún otro producto la usa.
+    # El producto ya no existe: un fallo aquí no debe convertir el borrado en 500.
+    for image_url in set(deleted.get("images", [])):
+        try:
+            await remove_stored_image(PRODUCT_IMAGES_FOLDER, image_url)
+        except Exception as e:
+            print(f"[IMAGES WARN] no se pudo liberar {image_url}: {e}")
     return {"message": "Producto eliminado correctamente"}
\ No newline at end of file
@@ -1,11 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
+import hashlib
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
 from app.models.review_model import ReviewCreate
 from app.services.review_service import (
     create_review_service,
     get_product_reviews_service,
+    get_product_reviews_page_service,
+    get_review_summary_service,
     delete_review_service
 )
 from app.utils.dependencies import get_current_user
+from app.utils.etag import etag_matches
+from app.utils.pagination import DEFAULT_LIMIT, MAX_LIMIT
 
 router = APIRouter(prefix="/reviews", tags=["Reviews"])
 
@@ -35,10 +41,33 @@ async def create_review(
 @router.get(
     "/{product_id}",
     summary="Ver reviews de un producto",
-    description="Obtiene todas las reviews de un producto."
+    description=(
+        "Obtiene todas las reviews de un producto. Con `limit` devuelve una página "
+        "`{summary, items, next_cursor}`. Responde con ETag y acepta If-None-Match (304)."
+    )
 )
-async def get_reviews(product_id: str):
-    return await get_product_reviews_service(product_id)
+async def get_reviews(
+    product_id: str,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT, description="Reviews por página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en next_cursor"),
+):
+    cached = await get_review_summary_service(product_id)
+
+    raw_tag = f"{product_id}:{cached['version']}:{limit}:{cursor}"
+    etag = f'W/"{hashlib.sha1(raw_tag.encode()).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    if limit is None and not cursor:
+        return await get_product_reviews_service(product_id)
+
+    page = await get_product_reviews_page_service(product_id, limit or DEFAULT_LIMIT, cursor)
+    return {"summary": cached["summary"], **page}
 
 
 @router.delete(
@@ -1,11 +1,19 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from pydantic import BaseModel
 from typing import List, Optional
-from app.database import database
+from app.services.settings_service import get_setting, save_setting
+from app.utils.etag import etag_matches
 from app.utils.dependencies import get_current_moderator
 
 router = APIRouter(prefix="/settings", tags=["Settings"])
-settings_col = database["settings"]
+
+SETTINGS_CACHE_CONTROL = "public, no-cache"
+
+def cached_response(request: Request, entry: dict) -> Response:
+    headers = {"ETag": entry["etag"], "Cache-Control": SETTINGS_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
 
 # ── CATEGORÍAS ──
 class Category(BaseModel):
@@ -26,24 +34,22 @@ DEFAULT_CATEGORIES = [
     {"id": "components",  "label": "Componentes", "emoji": "🔌", "color": "#ec4899"},
 ]
 
-@router.get("/categories", summary="Obtener categorías")
-async def get_categories():
-    doc = await settings_col.find_one({"key": "categories"})
+def categories_value(doc):
     if not doc:
         return {"categories": DEFAULT_CATEGORIES}
     return {"categories": doc["categories"]}
 
+@router.get("/categories", summary="Obtener categorías")
+async def get_categories(request: Request):
+    return cached_response(request, await get_setting("categories", categories_value))
+
 @router.put("/categories", summary="Actualizar categorías (Admin)")
 async def update_categories(
     body: CategoriesUpdate,
     current_user: dict = Depends(get_current_moderator)
 ):
     cats = [c.dict() for c in body.categories]
-    await settings_col.update_one(
-        {"key": "categories"},
-        {"$set": {"categories": cats}},
-        upsert=True
-    )
+    await save_setting("categories", {"categories": cats})
     return {"message": "Categorías actualizadas", "categories": cats}
 
 # ── CONFIGURACIÓN DE TIENDA ──
@@ -64,12 +70,14 @@ DEFAULT_STORE = {
     "welcome_message": "¡Hola! 👋 Bienvenido a TechStore. ¿En qué puedo ayudarte hoy?"
 }
 
-@router.get("/store", summary="Obtener configuración de tienda")
-async def get_store():
-    doc = await settings_col.find_one({"key": "store"})
+def store_value(doc):
     if not doc:
         return DEFAULT_STORE
-    return {k: v for k, v in doc.items() if k not in ["_id", "key"]}
+    return {k: v for k, v in doc.items() if k not in ["_id", "key", "version"]}
+
+@router.get("/store", summary="Obtener configuración de tienda")
+async def get_store(request: Request):
+    return cached_response(request, await get_setting("store", store_value))
 
 @router.put("/store", summary="Actualizar configuración de tienda (Admin)")
 async def update_store(
@@ -77,9 +85,5 @@ async def update_store(
     current_user: dict = Depends(get_current_moderator)
 ):
     update_data = {k: v for k, v in body.dict().items() if v is not None}
-    await settings_col.update_one(
-        {"key": "store"},
-        {"$set": update_data},
-        upsert=True
-    )
+    await save_setting("store", update_data)
     return {"message": "Configuración actualizada", **update_data}
\ No newline at end of file
@@ -1,25 +1,48 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel
 from bson import ObjectId
-from app.database import database
-from app.utils.dependencies import get_current_admin
+from typing import Optional
+from app.database import user_collection
+from app.services.user_service import (
+    list_users_service,
+    list_users_page_service,
+    count_users_service,
+)
+from app.utils.dependencies import get_current_admin, invalidate_user
+from app.utils.pagination import DEFAULT_LIMIT, MAX_LIMIT
 
 router = APIRouter(prefix="/users", tags=["Users"])
-user_collection = database["users"]
-
-def serialize_user(u):
-    return {
-        "id":         str(u["_id"]),
-        "name":       u.get("name", ""),
-        "email":      u.get("email", ""),
-        "role":       u.get("role", "customer"),
-        "created_at": str(u.get("created_at", "")),
-    }
-
-@router.get("/", summary="Listar usuarios (Admin)")
-async def get_users(admin: dict = Depends(get_current_admin)):
-    users = await user_collection.find().to_list(1000)
-    return [serialize_user(u) for u in users]
+
+VALID_ROLES = ["customer", "admin", "moderator"]
+
+@router.get(
+    "/",
+    summary="Listar usuarios (Admin)",
+    description=(
+        "Filtra por rol y por prefijo de email o de nombre (sin tildes ni mayúsculas). "
+        "Con `limit` o `count` devuelve `{items, next_cursor}` y, con `count=true`, "
+        "también `total` (estimado si no hay filtros). Sin paginar devuelve como máximo 1000 usuarios."
+    )
+)
+async def get_users(
+    role: Optional[str] = Query(None, description="customer, admin o moderator"),
+    email: Optional[str] = Query(None, description="Prefijo del email"),
+    name: Optional[str] = Query(None, description="Prefijo del nombre"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT, description="Usuarios por página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en next_cursor"),
+    count: bool = Query(False, description="Incluir el total de usuarios"),
+    admin: dict = Depends(get_current_admin)
+):
+    if role and role not in VALID_ROLES:
+        raise HTTPException(status_code=400, detail=f"Rol inválido. Opciones: {VALID_ROLES}")
+
+    if limit is None and not cursor and not count:
+        return await list_users_service(role, email, name)
+
+    page = await list_users_page_service(limit or DEFAULT_LIMIT, cursor, role, email, name)
+    if count:
+        page.update(await count_users_service(role, email, name))
+    return page
 
 class RoleUpdate(BaseModel):
     role: str
@@ -30,9 +53,8 @@ async def update_role(
     body: RoleUpdate,
     admin: dict = Depends(get_current_admin)
 ):
-    valid = ["customer", "admin", "moderator"]
-    if body.role not in valid:
-        raise HTTPException(status_code=400, detail=f"Rol inválido. Opciones: {valid}")
+    if body.role not in VALID_ROLES:
+        raise HTTPException(status_code=400, detail=f"Rol inválido. Opciones: {VALID_ROLES}")
 
     result = await user_collection.update_one(
         {"_id": ObjectId(user_id)},
@@ -41,6 +63,7 @@ async def update_role(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
+    invalidate_user(user_id)
     return {"message": f"Rol actualizado a '{body.role}'"}
 
 @router.delete("/{user_id}", summary="Eliminar usuario (Admin)")
@@ -51,4 +74,6 @@ async def delete_user(
     result = await user_collection.delete_one({"_id": ObjectId(user_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+
+    invalidate_user(user_id)
     return {"message": "Usuario eliminado"}
\ No newline at end of file
@@ -0,0 +1,248 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from pymongo import DESCENDING
+from pymongo.errors import PyMongoError
+
+from app.database import order_collection, sales_rollup_collection, sales_product_collection
+from app.indexes import INDEXES
+
+
+# Rollups que se actualizan con $inc al crear una orden o cambiar su estado,
+# para que los paneles lean unos pocos documentos en vez de recorrer orders:
+#   sales_rollups   _id "day:YYYY-MM-DD"      orders, revenue, units, by_status, products.<id>
+#                   _id "hour:YYYY-MM-DDTHH"  orders, revenue, units
+#                   _id "total"               orders, revenue, units, by_status
+#   sales_products  _id product_id            name, orders, units, revenue
+# revenue y units excluyen las órdenes canceladas; by_status cuenta todas.
+
+TOTAL_KEY    = "total"
+MAX_DAYS     = 366
+CANCELLED    = "cancelled"
+
+
+def day_key(moment: datetime) -> str:
+    return f"day:{moment:%Y-%m-%d}"
+
+
+def hour_key(moment: datetime) -> str:
+    return f"hour:{moment:%Y-%m-%dT%H}"
+
+
+def _units(order: dict) -> int:
+    return sum(item["quantity"] for item in order.get("items", []))
+
+
+def _by_product(order: dict) -> dict:
+    """{product_id: {name, units, revenue}}: varias líneas del mismo producto se suman."""
+    products = {}
+    for item in order.get("items", []):
+        p = products.setdefault(item["product_id"], {"name": item.get("name", ""), "units": 0, "revenue": 0})
+        p["units"]   += item["quantity"]
+        p["revenue"] += item["price"] * item["quantity"]
+    return products
+
+
+def _sales_inc(order: dict, sign: int, with_products: bool) -> dict:
+    inc = {
+        "revenue": sign * order.get("total", 0),
+        "units":   sign * _units(order),
+    }
+    if with_products:
+        for pid, p in _by_product(order).items():
+            inc[f"products.{pid}.units"]   = sign * p["units"]
+            inc[f"products.{pid}.revenue"] = sign * p["revenue"]
+    return inc
+
+
+async def _apply(
+    order: dict,
+    sales_sign: int = 0,
+    orders: int = 0,
+    statuses: dict = None,
+    rollups=None,
+    products=None,
+):
+    """
+    Aplica un delta a los rollups del día/hora de la orden, al total y a sus
+    productos. rollups/products permiten escribir en las colecciones temporales
+    de una reconstrucción.
+    """
+    rollups  = rollups if rollups is not None else sales_rollup_collection
+    products = products if products is not None else sales_product_collection
+    created_at = order["created_at"]
+    by_status  = {f"by_status.{s}": n for s, n in (statuses or {}).items()}
+
+    day   = {"orders": orders, **by_status}
+    hour  = {"orders": orders}
+    total = {"orders": orders, **by_status}
+    if sales_sign:
+        day.update(_sales_inc(order, sales_sign, with_products=True))
+        hour.update(_sales_inc(order, sales_sign, with_products=False))
+        total.update(_sales_inc(order, sales_sign, with_products=False))
+
+    writes = [
+        rollups.update_one({"_id": day_key(created_at)}, {"$inc": day}, upsert=True),
+        rollups.update_one({"_id": hour_key(created_at)}, {"$inc": hour}, upsert=True),
+        rollups.update_one({"_id": TOTAL_KEY}, {"$inc": total}, upsert=True),
+    ]
+    if sales_sign:
+        # orders cuenta una vez por orden aunque el producto aparezca en varias líneas
+        for pid, p in _by_product(order).items():
+            writes.append(products.update_one(
+                {"_id": pid},
+                {
+                    "$inc": {
+                        "orders":  sales_sign,
+                        "units":   sales_sign * p["units"],
+                        "revenue": sales_sign * p["revenue"],
+                    },
+                    "$set": {"name": p["name"]},
+                },
+                upsert=True
+            ))
+    await asyncio.gather(*writes)
+
+
+# ─────────────────────────────────────────────
+# ACTUALIZACIÓN INCREMENTAL
+# ─────────────────────────────────────────────
+
+async def _add_order(order: dict, rollups=None, products=None):
+    status = order.get("status", "pending")
+    await _apply(
+        order,
+        sales_sign=0 if status == CANCELLED else 1,
+        orders=1,
+        statuses={status: 1},
+        rollups=rollups,
+        products=products,
+    )
+
+
+async def record_order(order: dict):
+    """Suma una orden recién creada. Un fallo aquí no debe tumbar el checkout."""
+    try:
+        await _add_order(order)
+    except PyMongoError as e:
+        print(f"[ANALYTICS WARN] orden {order.get('_id')}: {e}")
+
+
+async def record_status_change(order: dict, old_status: str, new_status: str):
+    """
+    Mueve la orden de un estado a otro en el embudo. Al cancelar se descuentan
+    sus ventas; al salir de cancelada se vuelven a sumar.
+    """
+    if old_status == new_status:
+        return
+    sales_sign = 0
+    if new_status == CANCELLED:
+        sales_sign = -1
+    elif old_status == CANCELLED:
+        sales_sign = 1
+    try:
+        await _apply(order, sales_sign=sales_sign, statuses={old_status: -1, new_status: 1})
+    except PyMongoError as e:
+        print(f"[ANALYTICS WARN] estado de orden {order.get('_id')}: {e}")
+
+
+# ─────────────────────────────────────────────
+# CONSULTAS
+# ─────────────────────────────────────────────
+
+def _round(doc: dict) -> dict:
+    return {
+        "orders":  doc.get("orders", 0),
+        "revenue": round(doc.get("revenue", 0), 2),
+        "units":   doc.get("units", 0),
+    }
+
+
+async def daily_sales(date_from: datetime, date_to: datetime) -> list:
+    """Un documento por día del rango [date_from, date_to], días sin ventas en cero."""
+    days = min((date_to - date_from).days + 1, MAX_DAYS)
+    keys = [day_key(date_from + timedelta(days=i)) for i in range(max(days, 0))]
+    docs = {d["_id"]: d async for d in sales_rollup_collection.find({"_id": {"$in": keys}})}
+
+    result = []
+    for key in keys:
+        doc = docs.get(key, {})
+        products = doc.get("products", {})
+        result.append({
+            "date":      key.split(":", 1)[1],
+            **_round(doc),
+            "by_status": doc.get("by_status", {}),
+            "products":  {
+                pid: {"units": p.get("units", 0), "revenue": round(p.get("revenue", 0), 2)}
+                for pid, p in products.items() if p.get("units")
+            },
+        })
+    return result
+
+
+async def hourly_sales(day: datetime) -> list:
+    keys = [hour_key(day.replace(hour=h, minute=0, second=0, microsecond=0)) for h in range(24)]
+    docs = {d["_id"]: d async for d in sales_rollup_collection.find({"_id": {"$in": keys}})}
+    return [{"hour": key.split(":", 1)[1], **_round(docs.get(key, {}))} for key in keys]
+
+
+async def top_products(limit: int = 10) -> list:
+    cursor = sales_product_collection.find({"units": {"$gt": 0}}).sort("units", DESCENDING).limit(limit)
+    return [
+        {"product_id": d["_id"], "name": d.get("name", ""), **_round(d)}
+        async for d in cursor
+    ]
+
+
+async def status_totals() -> dict:
+    doc = await sales_rollup_collection.find_one({"_id": TOTAL_KEY}) or {}
+    return {**_round(doc), "by_status": doc.get("by_status", {})}
+
+
+# ─────────────────────────────────────────────
+# RECONSTRUIR DESDE CERO
+# ─────────────────────────────────────────────
+
+# Se construye en colecciones temporales y se renombran sobre las reales al
+# final: los paneles nunca ven rollups a medio calcular y las escrituras en
+# vivo siguen yendo a las colecciones actuales mientras tanto. Las órdenes
+# creadas durante la reconstrucción se vuelven a sumar justo antes del cambio.
+# Límite: un cambio de estado de una orden ya leída que ocurra durante la
+# reconstrucción queda en las colecciones reemplazadas; conviene correrla con
+# poco tráfico.
+REBUILD_SUFFIX = "_rebuild"
+
+_ORDER_ROLLUP_PROJECTION = {"items": 1, "total": 1, "status": 1, "created_at": 1}
+
+
+async def _fill(query: dict, rollups, products) -> int:
+    count = 0
+    async for order in order_collection.find(query, _ORDER_ROLLUP_PROJECTION):
+        await _add_order(order, rollups, products)
+        count += 1
+    return count
+
+
+async def rebuild_sales_rollups():
+    """Recalcula todos los rollups recorriendo orders (para backfill o corrección)."""
+    db = sales_rollup_collection.database
+    targets = [sales_rollup_collection, sales_product_collection]
+    temp_rollups, temp_products = [db[c.name + REBUILD_SUFFIX] for c in targets]
+    for temp in (temp_rollups, temp_products):
+        await temp.drop()
+        await db.create_collection(temp.name)     # rename necesita que exista aunque quede vacía
+
+    started = datetime.utcnow()
+    count = await _fill({"created_at": {"$lt": started}}, temp_rollups, temp_products)
+
+    # órdenes creadas mientras se recorría: sus $inc fueron a las colecciones viejas
+    swapped_at = datetime.utcnow()
+    count += await _fill({"created_at": {"$gte": started, "$lt": swapped_at}}, temp_rollups, temp_products)
+
+    # rename conserva los índices de la temporal, no los de la colección reemplazada
+    for target, temp in zip(targets, (temp_rollups, temp_products)):
+        for name, keys, options in INDEXES.get(target.name, []):
+            await temp.create_index(keys, name=name, **options)
+        await temp.rename(target.name, dropTarget=True)
+
+    return {"orders": count}
@@ -1,12 +1,14 @@
 from app.database import user_collection
 from app.utils.auth_utils import (
-    hash_password,
-    verify_password,
+    hash_password_async,
+    verify_password_async,
     create_access_token,
     create_refresh_token  # ← NUEVO
 )
 from datetime import datetime
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from app.services.user_service import name_key, email_key
 
 
 def serialize_user(user):
@@ -23,13 +25,19 @@ async def register_user(user_data):
 
     user_dict = {
         "name": user_data.name,
+        "name_key": name_key(user_data.name),
         "email": user_data.email,
-        "hashed_password": hash_password(user_data.password),
+        "email_key": email_key(user_data.email),
+        "hashed_password": await hash_password_async(user_data.password),
         "role": "admin" if user_data.email.endswith("@admin.com") else "customer",
         "created_at": datetime.utcnow()
     }
 
-    result = await user_collection.insert_one(user_dict)
+    try:
+        result = await user_collection.insert_one(user_dict)
+    except DuplicateKeyError:
+        # registro concurrente con el mismo email (índice único users.email)
+        return None
     created_user = await user_collection.find_one({"_id": result.inserted_id})
     return serialize_user(created_user)
 
@@ -38,7 +46,7 @@ async def authenticate_user(email: str, password: str):
     user = await user_collection.find_one({"email": email})
     if not user:
         return None
-    if not verify_password(password, user["hashed_password"]):
+    if not await verify_password_async(password, user["hashed_password"]):
         return None
 
     token_data = {
@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from pymongo import ReturnDocument
+
+from app.database import blob_collection
+
+
+# Los blobs viven fuera de public/ y cada archivo publicado (banner o imagen
+# de la biblioteca) es un hard link al blob: dos subidas idénticas ocupan
+# disco una sola vez y las URLs públicas no cambian.
+BLOBS_DIR  = Path(os.getenv("BLOB_STORE_DIR", Path(__file__).resolve().parents[3] / "frontend" / ".blobs"))
+CHUNK_SIZE = 1024 * 1024
+
+DISK   = "disk"       # archivos locales (banners, biblioteca)
+REMOTE = "products"   # imágenes de productos en el almacenamiento externo
+
+
+def _blob_id(store: str, sha256: str) -> str:
+    return sha256 if store == DISK else f"{store}:{sha256}"
+
+
+def blob_path(sha256: str) -> Path:
+    return BLOBS_DIR / sha256[:2] / sha256
+
+
+def hash_fileobj(fileobj) -> tuple:
+    """sha256 y tamaño de un archivo abierto; lo deja al inicio."""
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+        size += len(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+def _stream_to_temp(source):
+    """Copia el stream a un temporal dentro de BLOBS_DIR calculando sha256 en la misma pasada."""
+    BLOBS_DIR.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(dir=BLOBS_DIR, suffix=".upload")
+    with os.fdopen(fd, "wb") as out:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return Path(tmp), digest.hexdigest(), size
+
+
+def _same_file(a: Path, b: Path) -> bool:
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def _publish(blob: Path, dest_dir: Path, filename: str, sha256: str):
+    """
+    Elige el nombre público y lo enlaza al blob. Devuelve (nombre, nuevo_enlace).
+    Si el nombre ya apunta a este mismo contenido se reutiliza; si lo ocupa
+    otro contenido se desambigua con el hash (sin sondear en bucle).
+    """
+    stem, suffix = Path(filename).stem, Path(filename).suffix
+    for name in (filename, f"{stem}_{sha256[:8]}{suffix}", f"{stem}_{sha256[:16]}{suffix}"):
+        dest = dest_dir / name
+        if not dest.exists():
+            try:
+                os.link(blob, dest)
+            except OSError:
+                shutil.copyfile(blob, dest)   # otro filesystem: sin ahorro, pero correcto
+            return name, True
+        if _same_file(dest, blob):
+            return name, False
+    raise FileExistsError(filename)
+
+
+# ─────────────────────────────────────────────
+# BLOBS EN DISCO
+# ─────────────────────────────────────────────
+
+async def store_file(source, dest_dir: Path, filename: str) -> dict:
+    """
+    Guarda el stream de forma content-addressed y lo publica en dest_dir.
+    Devuelve {filename, sha256, size, deduplicated}.
+    """
+    tmp, sha256, size = await asyncio.to_thread(_stream_to_temp, source)
+    blob = blob_path(sha256)
+    deduplicated = blob.exists()
+    if deduplicated:
+        tmp.unlink()
+    else:
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, blob)
+
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    name, linked = _publish(blob, dest_dir, filename, sha256)
+
+    await blob_collection.update_one(
+        {"_id": _blob_id(DISK, sha256)},
+        {
+            "$inc": {"refs": 1 if linked else 0, "hits": 1 if deduplicated else 0},
+            "$setOnInsert": {"store": DISK, "size": size, "created_at": datetime.utcnow()},
+        },
+        upsert=True
+    )
+    return {"filename": name, "sha256": sha256, "size": size, "deduplicated": deduplicated}
+
+
+async def release_file(path: Path, sha256: str = None):
+    """Borra el archivo publicado y libera el blob si ya nadie lo referencia."""
+    path.unlink(missing_ok=True)
+    if not sha256:
+        return
+
+    doc = await blob_collection.find_one_and_update(
+        {"_id": _blob_id(DISK, sha256)},
+        {"$inc": {"refs": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if doc and doc["refs"] <= 0:
+        result = await blob_collection.delete_one({"_id": doc["_id"], "refs": {"$lte": 0}})
+        if result.deleted_count:
+            blob_path(sha256).unlink(missing_ok=True)
+
+
+# ─────────────────────────────────────────────
+# BLOBS REMOTOS (imágenes de productos)
+# ─────────────────────────────────────────────
+
+async def acquire_remote(sha256: str):
+    """Si ese contenido ya está subido, suma una referencia y devuelve su URL."""
+    doc = await blob_collection.find_one_and_update(
+        {"_id": _blob_id(REMOTE, sha256), "url": {"$exists": True}},
+        {"$inc": {"refs": 1, "hits": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    return doc["url"] if doc else None
+
+
+async def register_remote(sha256: str, size: int, url: str) -> str:
+    """
+    Registra una subida nueva. Si otra subida concurrente del mismo contenido
+    ganó, devuelve la URL de esa (el llamador debe borrar la suya).
+    """
+    doc = await blob_collection.find_one_and_update(
+        {"_id": _blob_id(REMOTE, sha256)},
+        {
+            "$inc": {"refs": 1},
+            "$setOnInsert": {"store": REMOTE, "size": size, "url": url, "created_at": datetime.utcnow()},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc["url"]
+
+
+async def release_remote(url: str, count: int = 1) -> bool:
+    """Resta referencias a la imagen. True si ya no la usa nadie y se puede borrar."""
+    doc = await blob_collection.find_one_and_update(
+        {"store": REMOTE, "url": url},
+        {"$inc": {"refs": -count}},
+        return_document=ReturnDocument.AFTER
+    )
+    if doc is None:
+        return True   # imagen anterior al blob store: no se comparte
+    if doc["refs"] > 0:
+        return False
+    result = await blob_collection.delete_one({"_id": doc["_id"], "refs": {"$lte": 0}})
+    return result.deleted_count == 1
+
+
+# ─────────────────────────────────────────────
+# ESTADÍSTICAS
+# ─────────────────────────────────────────────
+
+async def blob_stats():
+    """Bytes físicos (una copia por contenido) vs lógicos (una por referencia)."""
+    stats = {}
+    async for doc in blob_collection.find({}, {"store": 1, "size": 1, "refs": 1, "hits": 1}):
+        s = stats.setdefault(doc.get("store", DISK), {
+            "blobs": 0, "references": 0, "stored_bytes": 0,
+            "logical_bytes": 0, "saved_bytes": 0, "dedup_hits": 0,
+        })
+        refs = max(doc.get("refs", 0), 0)
+        s["blobs"] += 1
+        s["references"] += refs
+        s["stored_bytes"] += doc["size"]
+        s["logical_bytes"] += doc["size"] * refs
+        s["dedup_hits"] += doc.get("hits", 0)
+
+    for s in stats.values():
+        s["saved_bytes"] = s["logical_bytes"] - s["stored_bytes"]
+    return stats
@@ -1,6 +1,9 @@
-from app.database import cart_collection, product_collection
+from app.database import cart_collection, guest_cart_collection, product_collection
 from bson import ObjectId
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from app.services.stock_service import fetch_products, fetch_product_snapshots
 
 
 def _serialize_cart(cart: dict) -> dict:
@@ -12,124 +15,375 @@ def _serialize_cart(cart: dict) -> dict:
     return cart
 
 
+CART_PRODUCT_PROJECTION = {"name": 1, "price": 1, "original_price": 1, "images": 1, "stock": 1}
+
+# Reintentos cuando otra pestaña cambia el carrito entre dos operaciones atómicas
+CART_RETRIES = 3
+
+# Un carrito de invitado reclamado para fusionar y no borrado en este plazo
+# (el proceso murió a mitad) se puede volver a reclamar
+GUEST_MERGE_LOCK_SECONDS = 60
+
+
+def _carts(guest: bool):
+    """Los carritos de invitado viven en guest_carts (con TTL) y usan el mismo esquema."""
+    return guest_cart_collection if guest else cart_collection
+
+
 async def _get_product(product_id: str):
     try:
-        return await product_collection.find_one({"_id": ObjectId(product_id)})
+        return await product_collection.find_one({"_id": ObjectId(product_id)}, CART_PRODUCT_PROJECTION)
     except Exception:
         return None
 
 
-async def get_cart_service(user_id: str):
-    cart = await cart_collection.find_one({"user_id": user_id})
-    if not cart:
-        return {"user_id": user_id, "items": [], "total": 0.0, "total_items": 0}
-    return _serialize_cart(cart)
-
+# Campos del ítem que son copia del producto y se actualizan al revalidar
+_SNAPSHOT_FIELDS = ("name", "price", "original_price", "image", "stock")
 
-async def add_to_cart_service(user_id: str, product_id: str, quantity: int):
-    product = await _get_product(product_id)
-    if not product:
-        return {"error": "Producto no encontrado"}
 
-    if product["stock"] < quantity:
-        return {"error": f"Stock insuficiente. Disponible: {product['stock']}"}
-
-    nuevo_item = {
-        "product_id": product_id,
+def _snapshot_fields(product: dict) -> dict:
+    return {
         "name": product["name"],
         "price": product["price"],
         "original_price": product.get("original_price"),
-        "quantity": quantity,
         "image": product["images"][0] if product.get("images") else None,
         "stock": product["stock"],
     }
 
-    cart = await cart_collection.find_one({"user_id": user_id})
 
+def _cart_item(product: dict, product_id: str, quantity: int) -> dict:
+    return {"product_id": product_id, "quantity": quantity, **_snapshot_fields(product)}
+
+
+async def get_cart_service(user_id: str, guest: bool = False):
+    cart = await _carts(guest).find_one({"user_id": user_id})
     if not cart:
-        doc = {
-            "user_id": user_id,
-            "items": [nuevo_item],
-            "updated_at": datetime.utcnow()
+        return {"user_id": user_id, "items": [], "total": 0.0, "total_items": 0}
+    return _serialize_cart(cart)
+
+
+# ─────────────────────────────────────────────
+# REVALIDAR CARRITO
+# ─────────────────────────────────────────────
+
+async def refresh_cart_service(user_id: str, guest: bool = False):
+    """
+    Revalida todos los ítems contra los productos con un solo $in (o ninguno si
+    están en caché), marca cambios de precio y falta de stock, y guarda los
+    datos frescos con una sola escritura solo si algo cambió.
+    """
+    cart = await _carts(guest).find_one({"user_id": user_id})
+    if not cart or not cart.get("items"):
+        return {
+            "user_id": user_id, "items": [], "total": 0.0, "total_items": 0,
+            "alerts": {"price_changed": [], "out_of_stock": [], "unavailable": []},
         }
-        await cart_collection.insert_one(doc)
-        return _serialize_cart(doc)
 
-    items = cart.get("items", [])
-    encontrado = False
+    products = await fetch_product_snapshots([i["product_id"] for i in cart["items"]])
 
-    for item in items:
-        if item["product_id"] == product_id:
-            nueva_cantidad = item["quantity"] + quantity
-            if nueva_cantidad > product["stock"]:
-                return {"error": f"Stock insuficiente. Máximo: {product['stock']}"}
-            item["quantity"] = nueva_cantidad
-            encontrado = True
-            break
+    stored, shown = [], []
+    alerts = {"price_changed": [], "out_of_stock": [], "unavailable": []}
+    changed = False
+    for item in cart["items"]:
+        product_id = item["product_id"]
+        product = products.get(product_id)
+        if not product:
+            stored.append(item)
+            shown.append({**item, "unavailable": True})
+            alerts["unavailable"].append(product_id)
+            continue
 
-    if not encontrado:
-        items.append(nuevo_item)
+        fresh = {**item, **_snapshot_fields(product)}
+        changed = changed or any(item.get(k) != fresh[k] for k in _SNAPSHOT_FIELDS)
+        stored.append(fresh)
 
-    await cart_collection.update_one(
-        {"user_id": user_id},
-        {"$set": {"items": items, "updated_at": datetime.utcnow()}}
+        line = dict(fresh)
+        if fresh["price"] != item["price"]:
+            line["previous_price"] = item["price"]
+            alerts["price_changed"].append(product_id)
+        if fresh["stock"] < item["quantity"]:
+            line["out_of_stock"] = True
+            alerts["out_of_stock"].append(product_id)
+        shown.append(line)
+
+    if changed:
+        # si otra pestaña modificó el carrito mientras tanto no se pisa su cambio:
+        # la próxima vista vuelve a revalidar
+        await _carts(guest).update_one(
+            {"user_id": user_id, "rev": cart.get("rev")},
+            {"$set": {"items": stored, "updated_at": datetime.utcnow()}, "$inc": {"rev": 1}}
+        )
+
+    result = _serialize_cart({**cart, "items": shown})
+    result["alerts"] = alerts
+    return result
+
+
+# ─────────────────────────────────────────────
+# MUTACIONES ATÓMICAS
+# Cada una es un solo find_one_and_update: el filtro lleva la condición
+# (stock, presencia del ítem) y Mongo la evalúa junto con la escritura.
+# Todas incrementan "rev", la versión que usan /cart/batch y el refresh
+# para escribir el arreglo completo sin pisar cambios concurrentes.
+# ─────────────────────────────────────────────
+
+async def _increment_item(user_id: str, product_id: str, quantity: int, stock: int, guest: bool = False):
+    """Suma al ítem existente solo si la nueva cantidad no supera el stock."""
+    return await _carts(guest).find_one_and_update(
+        {
+            "user_id": user_id,
+            "items": {"$elemMatch": {"product_id": product_id, "quantity": {"$lte": stock - quantity}}},
+        },
+        {
+            "$inc": {"items.$.quantity": quantity, "rev": 1},
+            "$set": {"items.$.stock": stock, "updated_at": datetime.utcnow()},
+        },
+        return_document=ReturnDocument.AFTER
     )
-    cart["items"] = items
-    return _serialize_cart(cart)
 
 
-async def update_cart_item_service(user_id: str, product_id: str, quantity: int):
-    cart = await cart_collection.find_one({"user_id": user_id})
-    if not cart:
-        return {"error": "Carrito no encontrado"}
+async def _push_item(user_id: str, item: dict, guest: bool = False):
+    """Agrega el ítem solo si el carrito todavía no lo tiene."""
+    return await _carts(guest).find_one_and_update(
+        {"user_id": user_id, "items.product_id": {"$ne": item["product_id"]}},
+        {"$push": {"items": item}, "$set": {"updated_at": datetime.utcnow()}, "$inc": {"rev": 1}},
+        return_document=ReturnDocument.AFTER
+    )
 
-    items = cart.get("items", [])
 
-    if quantity == 0:
-        items = [i for i in items if i["product_id"] != product_id]
-    else:
-        product = await _get_product(product_id)
-        if not product:
-            return {"error": "Producto no encontrado"}
-        if quantity > product["stock"]:
-            return {"error": f"Stock insuficiente. Disponible: {product['stock']}"}
-
-        encontrado = False
-        for item in items:
-            if item["product_id"] == product_id:
-                item["quantity"] = quantity
-                item["stock"] = product["stock"]
-                encontrado = True
-                break
-
-        if not encontrado:
-            return {"error": "El producto no está en el carrito"}
-
-    await cart_collection.update_one(
+async def _create_cart(user_id: str, item: dict, guest: bool = False):
+    """Crea el carrito con el ítem si no existe. None si ya existía."""
+    fields = {"items": [item], "updated_at": datetime.utcnow(), "rev": 1}
+    result = await _carts(guest).update_one(
         {"user_id": user_id},
-        {"$set": {"items": items, "updated_at": datetime.utcnow()}}
+        {"$setOnInsert": fields},
+        upsert=True
     )
-    cart["items"] = items
-    return _serialize_cart(cart)
+    return {"user_id": user_id, **fields} if result.upserted_id else None
 
 
-async def remove_from_cart_service(user_id: str, product_id: str):
-    cart = await cart_collection.find_one({"user_id": user_id})
-    if not cart:
+async def add_to_cart_service(user_id: str, product_id: str, quantity: int, guest: bool = False):
+    if quantity < 1:
+        return {"error": "La cantidad debe ser mayor a 0"}
+
+    product = await _get_product(product_id)
+    if not product:
+        return {"error": "Producto no encontrado"}
+
+    if product["stock"] < quantity:
+        return {"error": f"Stock insuficiente. Disponible: {product['stock']}"}
+
+    item = _cart_item(product, product_id, quantity)
+    for _ in range(CART_RETRIES):
+        cart = (
+            await _increment_item(user_id, product_id, quantity, product["stock"], guest)
+            or await _push_item(user_id, item, guest)
+            or await _create_cart(user_id, item, guest)
+        )
+        if cart:
+            return _serialize_cart(cart)
+
+        # el carrito tiene el ítem pero el $inc no pasó el filtro: falta stock
+        # (si no lo tiene, otra pestaña lo quitó entre medio y se reintenta)
+        if await _carts(guest).find_one({"user_id": user_id, "items.product_id": product_id}, {"_id": 1}):
+            return {"error": f"Stock insuficiente. Máximo: {product['stock']}"}
+
+    return {"error": "El carrito cambió mientras se actualizaba, intenta de nuevo"}
+
+
+async def update_cart_item_service(user_id: str, product_id: str, quantity: int, guest: bool = False):
+    if quantity == 0:
+        return await remove_from_cart_service(user_id, product_id, guest)
+    if quantity < 0:
+        return {"error": "La cantidad no puede ser negativa"}
+
+    product = await _get_product(product_id)
+    if not product:
+        return {"error": "Producto no encontrado"}
+    if quantity > product["stock"]:
+        return {"error": f"Stock insuficiente. Disponible: {product['stock']}"}
+
+    cart = await _carts(guest).find_one_and_update(
+        {"user_id": user_id, "items.product_id": product_id},
+        {"$set": {
+            "items.$.quantity": quantity,
+            "items.$.stock": product["stock"],
+            "updated_at": datetime.utcnow(),
+        }, "$inc": {"rev": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if cart:
+        return _serialize_cart(cart)
+
+    if not await _carts(guest).find_one({"user_id": user_id}, {"_id": 1}):
         return {"error": "Carrito no encontrado"}
+    return {"error": "El producto no está en el carrito"}
 
-    items = [i for i in cart.get("items", []) if i["product_id"] != product_id]
-    await cart_collection.update_one(
+
+async def remove_from_cart_service(user_id: str, product_id: str, guest: bool = False):
+    cart = await _carts(guest).find_one_and_update(
         {"user_id": user_id},
-        {"$set": {"items": items, "updated_at": datetime.utcnow()}}
+        {
+            "$pull": {"items": {"product_id": product_id}},
+            "$set": {"updated_at": datetime.utcnow()},
+            "$inc": {"rev": 1},
+        },
+        return_document=ReturnDocument.AFTER
     )
-    cart["items"] = items
+    if not cart:
+        return {"error": "Carrito no encontrado"}
     return _serialize_cart(cart)
 
 
-async def clear_cart_service(user_id: str):
-    await cart_collection.update_one(
+async def clear_cart_service(user_id: str, guest: bool = False):
+    await _carts(guest).update_one(
         {"user_id": user_id},
-        {"$set": {"items": [], "updated_at": datetime.utcnow()}}
+        {"$set": {"items": [], "updated_at": datetime.utcnow()}, "$inc": {"rev": 1}}
+    )
+    return {"user_id": user_id, "items": [], "total": 0.0, "total_items": 0}
+
+
+# ─────────────────────────────────────────────
+# OPERACIONES EN LOTE
+# ─────────────────────────────────────────────
+
+def _apply_op(items: list, op: dict, product) -> str:
+    """Aplica una operación sobre la lista en memoria. Devuelve el error o None."""
+    product_id, quantity = op["product_id"], op.get("quantity", 1)
+    line = next((i for i in items if i["product_id"] == product_id), None)
+
+    if op["op"] == "remove" or (op["op"] == "update" and quantity == 0):
+        if line:
+            items.remove(line)
+        return None
+
+    if quantity < 1:
+        return "La cantidad debe ser mayor a 0"
+    if not product:
+        return "Producto no encontrado"
+
+    if op["op"] == "add":
+        total = quantity + (line["quantity"] if line else 0)
+        if total > product["stock"]:
+            return f"Stock insuficiente. Disponible: {product['stock']}"
+        if line:
+            line.update(_snapshot_fields(product), quantity=total)
+        else:
+            items.append(_cart_item(product, product_id, quantity))
+        return None
+
+    # update
+    if not line:
+        return "El producto no está en el carrito"
+    if quantity > product["stock"]:
+        return f"Stock insuficiente. Disponible: {product['stock']}"
+    line.update(_snapshot_fields(product), quantity=quantity)
+    return None
+
+
+async def _save_items(user_id: str, cart, items: list, guest: bool) -> bool:
+    """Escribe el arreglo completo solo si nadie cambió el carrito desde que se leyó."""
+    now = datetime.utcnow()
+    if cart is None:
+        result = await _carts(guest).update_one(
+            {"user_id": user_id},
+            {"$setOnInsert": {"items": items, "updated_at": now, "rev": 1}},
+            upsert=True
+        )
+        return result.upserted_id is not None
+
+    result = await _carts(guest).update_one(
+        {"user_id": user_id, "rev": cart.get("rev")},
+        {"$set": {"items": items, "updated_at": now}, "$inc": {"rev": 1}}
+    )
+    return result.modified_count == 1
+
+
+async def batch_cart_service(user_id: str, ops: list, guest: bool = False, products: dict = None):
+    """
+    ops: [{"op": "add" | "update" | "remove", "product_id", "quantity"}].
+    Lee el carrito y todos los productos en paralelo (un $in), aplica las
+    operaciones en orden y guarda con una sola escritura condicionada a "rev".
+    Una operación inválida no frena a las demás: cada una trae su resultado.
+    Si el llamador ya leyó los productos (con CART_PRODUCT_PROJECTION) se
+    pasan en products y solo se lee el carrito.
+    """
+    product_ids = list({op["product_id"] for op in ops if op["op"] != "remove"})
+    prefetched = products
+
+    for _ in range(CART_RETRIES):
+        if prefetched is None:
+            cart, products = await asyncio.gather(
+                _carts(guest).find_one({"user_id": user_id}),
+                fetch_products(product_ids, CART_PRODUCT_PROJECTION),
+            )
+        else:
+            cart = await _carts(guest).find_one({"user_id": user_id})
+        items = [dict(i) for i in (cart or {}).get("items", [])]
+
+        results = []
+        for index, op in enumerate(ops):
+            error = _apply_op(items, op, products.get(op["product_id"]))
+            result = {"index": index, "op": op["op"], "product_id": op["product_id"], "ok": error is None}
+            if error:
+                result["error"] = error
+            results.append(result)
+
+        if not any(r["ok"] for r in results) or await _save_items(user_id, cart, items, guest):
+            saved = {**(cart or {"user_id": user_id}), "items": items}
+            return {"cart": _serialize_cart(saved), "results": results}
+
+    return {"error": "El carrito cambió mientras se actualizaba, intenta de nuevo"}
+
+
+# ─────────────────────────────────────────────
+# CARRITO DE INVITADO → USUARIO
+# ─────────────────────────────────────────────
+
+async def _release_guest_cart(cart_id, claimed_at):
+    await guest_cart_collection.update_one(
+        {"_id": cart_id, "merging_at": claimed_at},
+        {"$unset": {"merging_at": ""}}
+    )
+
+
+async def merge_guest_cart_service(guest_id: str, user_id: str):
+    """
+    Pasa el carrito de invitado al del usuario. Se reclama de forma atómica
+    marcándolo con merging_at, así un doble login no lo fusiona dos veces, y
+    los ítems entran con una sola escritura de /cart/batch (mismas validaciones
+    de stock). Solo se borra cuando el lote se guardó; si no, se libera la marca
+    y el carrito de invitado queda para el próximo login.
+    """
+    now = datetime.utcnow()
+    guest_cart = await guest_cart_collection.find_one_and_update(
+        {"user_id": guest_id, "$or": [
+            {"merging_at": {"$exists": False}},
+            {"merging_at": {"$lt": now - timedelta(seconds=GUEST_MERGE_LOCK_SECONDS)}},
+        ]},
+        {"$set": {"merging_at": now}},
+        return_document=ReturnDocument.AFTER
     )
-    return {"user_id": user_id, "items": [], "total": 0.0, "total_items": 0}
\ No newline at end of file
+    items = (guest_cart or {}).get("items", [])
+    if not items:
+        if guest_cart:
+            await guest_cart_collection.delete_one({"_id": guest_cart["_id"], "merging_at": now})
+        return {"merged": [], "skipped": []}
+
+    ops = [{"op": "add", "product_id": i["product_id"], "quantity": i["quantity"]} for i in items]
+    try:
+        batch = await batch_cart_service(user_id, ops)
+    except BaseException:
+        await _release_guest_cart(guest_cart["_id"], now)
+        raise
+
+    if "error" in batch:
+        await _release_guest_cart(guest_cart["_id"], now)
+        return {"merged": [], "skipped": [{"product_id": i["product_id"], "error": batch["error"]} for i in items]}
+
+    await guest_cart_collection.delete_one({"_id": guest_cart["_id"], "merging_at": now})
+
+    return {
+        "merged":  [r["product_id"] for r in batch["results"] if r["ok"]],
+        "skipped": [{"product_id": r["product_id"], "error": r["error"]} for r in batch["results"] if not r["ok"]],
+    }
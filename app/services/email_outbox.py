@@ -0,0 +1,230 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import resend
+
+from app.database import email_outbox_collection
+
+
+EMAIL_TRANSPORT      = os.getenv("EMAIL_TRANSPORT", "resend")      # resend | file | memory
+EMAIL_FILE_DIR       = os.getenv("EMAIL_FILE_DIR", "sent_emails")
+EMAIL_BATCH_SIZE     = int(os.getenv("EMAIL_BATCH_SIZE", "50"))    # Resend acepta hasta 100 por lote
+EMAIL_MAX_ATTEMPTS   = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+EMAIL_POLL_SECONDS   = float(os.getenv("EMAIL_POLL_SECONDS", "5"))
+EMAIL_RETRY_BASE     = 30            # segundos; se duplica en cada intento
+EMAIL_RETRY_MAX      = 3600
+EMAIL_STUCK_AFTER    = timedelta(minutes=10)
+
+
+# ─────────────────────────────────────────────
+# TRANSPORTES
+# send_batch devuelve una lista con None (enviado) o el error de cada mensaje
+# ─────────────────────────────────────────────
+
+class ResendTransport:
+    def send_batch(self, messages):
+        if len(messages) == 1:
+            resend.Emails.send(messages[0])
+        else:
+            resend.Batch.send(messages)
+        return [None] * len(messages)
+
+
+class FileTransport:
+    """Escribe cada correo como JSON en un directorio (desarrollo local)."""
+
+    def __init__(self, directory=EMAIL_FILE_DIR):
+        self.directory = Path(directory)
+
+    def send_batch(self, messages):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        for i, message in enumerate(messages):
+            path = self.directory / f"{stamp}_{i}.json"
+            path.write_text(json.dumps(message, ensure_ascii=False, indent=2), encoding="utf-8")
+        return [None] * len(messages)
+
+
+class MemoryTransport:
+    """Guarda los correos en memoria (tests)."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_batch(self, messages):
+        self.sent.extend(messages)
+        return [None] * len(messages)
+
+
+_TRANSPORTS = {"resend": ResendTransport, "file": FileTransport, "memory": MemoryTransport}
+_transport = None
+
+
+def get_transport():
+    global _transport
+    if _transport is None:
+        _transport = _TRANSPORTS.get(EMAIL_TRANSPORT, ResendTransport)()
+    return _transport
+
+
+def set_transport(transport):
+    global _transport
+    _transport = transport
+
+
+# ─────────────────────────────────────────────
+# ENCOLAR
+# ─────────────────────────────────────────────
+
+_wakeup = asyncio.Event()
+
+
+async def enqueue_email(key: str, message: dict, tag: str) -> bool:
+    """
+    Guarda el correo en el outbox y vuelve de inmediato. La clave de
+    idempotencia es el _id: encolar dos veces la misma clave no duplica el envío.
+    """
+    now = datetime.utcnow()
+    result = await email_outbox_collection.update_one(
+        {"_id": key},
+        {"$setOnInsert": {
+            "message":         message,
+            "tag":             tag,
+            "status":          "pending",
+            "attempts":        0,
+            "created_at":      now,
+            "next_attempt_at": now,
+        }},
+        upsert=True
+    )
+
+    if result.upserted_id is None:
+        print(f"[EMAIL] {tag} ya estaba encolado ({key})")
+        return False
+
+    _wakeup.set()
+    return True
+
+
+# ─────────────────────────────────────────────
+# DESPACHAR
+# ─────────────────────────────────────────────
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(EMAIL_RETRY_BASE * 2 ** (attempts - 1), EMAIL_RETRY_MAX))
+
+
+async def _claim_batch(limit: int):
+    now = datetime.utcnow()
+
+    # correos que quedaron en "sending" por un worker caído vuelven a la cola
+    await email_outbox_collection.update_many(
+        {"status": "sending", "claimed_at": {"$lt": now - EMAIL_STUCK_AFTER}},
+        {"$set": {"status": "pending"}}
+    )
+
+    candidates = await email_outbox_collection.find(
+        {"status": "pending", "next_attempt_at": {"$lte": now}},
+        {"_id": 1}
+    ).sort("next_attempt_at", 1).limit(limit).to_list(limit)
+    if not candidates:
+        return []
+
+    claim = f"{os.getpid()}:{now.isoformat()}"
+    await email_outbox_collection.update_many(
+        {"_id": {"$in": [c["_id"] for c in candidates]}, "status": "pending"},
+        {"$set": {"status": "sending", "claimed_at": now, "claim": claim}}
+    )
+    return await email_outbox_collection.find({"claim": claim, "status": "sending"}).to_list(limit)
+
+
+async def dispatch_pending(limit: int = EMAIL_BATCH_SIZE) -> int:
+    """Envía un lote de correos pendientes. Devuelve cuántos se procesaron."""
+    batch = await _claim_batch(limit)
+    if not batch:
+        return 0
+
+    transport = get_transport()
+    try:
+        errors = await asyncio.to_thread(transport.send_batch, [doc["message"] for doc in batch])
+    except Exception as e:
+        errors = [e] * len(batch)
+
+    now = datetime.utcnow()
+    sent_ids = []
+    for doc, error in zip(batch, errors):
+        if error is None:
+            sent_ids.append(doc["_id"])
+            print(f"[EMAIL] {doc['tag']} enviado a {', '.join(doc['message']['to'])}")
+            continue
+
+        attempts = doc.get("attempts", 0) + 1
+        failed = attempts >= EMAIL_MAX_ATTEMPTS
+        fields = {
+            "status":          "failed" if failed else "pending",
+            "attempts":        attempts,
+            "last_error":      str(error),
+            "next_attempt_at": now + _retry_delay(attempts),
+        }
+        if failed:
+            fields["failed_at"] = now      # lo borra el índice TTL failed_ttl
+        await email_outbox_collection.update_one(
+            {"_id": doc["_id"]},
+            {"$set": fields, "$unset": {"claim": ""}}
+        )
+        print(f"[EMAIL ERROR] {doc['tag']} intento {attempts}: {error}")
+
+    if sent_ids:
+        await email_outbox_collection.update_many(
+            {"_id": {"$in": sent_ids}},
+            {"$set": {"status": "sent", "sent_at": now}, "$unset": {"claim": ""}}
+        )
+    return len(batch)
+
+
+# ─────────────────────────────────────────────
+# WORKER EN SEGUNDO PLANO
+# ─────────────────────────────────────────────
+
+_worker_task = None
+
+
+async def _run_worker():
+    while True:
+        _wakeup.clear()
+        try:
+            processed = await dispatch_pending()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[EMAIL ERROR] worker: {e}")
+            processed = 0
+
+        if processed >= EMAIL_BATCH_SIZE:
+            continue   # probablemente quedan más, no esperar
+
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=EMAIL_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_email_worker():
+    global _worker_task
+    if _worker_task is None or _worker_task.done():
+        _worker_task = asyncio.create_task(_run_worker())
+
+
+async def stop_email_worker():
+    global _worker_task
+    if _worker_task is None:
+        return
+    _worker_task.cancel()
+    try:
+        await _worker_task
+    except asyncio.CancelledError:
+        pass
+    _worker_task = None
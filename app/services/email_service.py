@@ -1,13 +1,20 @@
 import resend
 import os
 from dotenv import load_dotenv
+from app.services.email_outbox import enqueue_email
 
 load_dotenv()
 
+# Los correos no se envían dentro del request: se encolan en el outbox
+# (app/services/email_outbox.py) y un worker en segundo plano los despacha.
 resend.api_key = os.getenv("RESEND_API_KEY", "")
 FROM_EMAIL     = os.getenv("RESEND_FROM",    "onboarding@resend.dev")
 ADMIN_EMAIL    = os.getenv("ADMIN_EMAIL",    "alexanderberaun18@gmail.com")
 
+def _order_key(order: dict) -> str:
+    return str(order.get("id", order.get("_id", "N/A")))
+
+
 def _base_template(content: str) -> str:
     return f"""
     <!DOCTYPE html>
@@ -83,7 +90,7 @@ def _base_template(content: str) -> str:
     """
 
 # ── 1. Bienvenida al registrarse ──────────────────────────────────────────────
-def send_welcome_email(user_email: str, user_name: str):
+async def send_welcome_email(user_email: str, user_name: str):
     content = f"""
     <h1>¡Bienvenido a TechStore! 👋</h1>
     <p>Hola <strong style="color:#ffffff">{user_name}</strong>,
@@ -105,20 +112,16 @@ def send_welcome_email(user_email: str, user_name: str):
     <div class="divider"></div>
     <p>Si tienes alguna duda estamos disponibles por WhatsApp 📱</p>
     """
-    try:
-        resend.Emails.send({
-            "from":    FROM_EMAIL,
-            "to":      [user_email],
-            "subject": "🎉 ¡Bienvenido a TechStore!",
-            "html":    _base_template(content),
-        })
-        print(f"[EMAIL] Bienvenida enviada a {user_email}")
-    except Exception as e:
-        print(f"[EMAIL ERROR] welcome: {e}")
+    await enqueue_email(f"welcome:{user_email}", {
+        "from":    FROM_EMAIL,
+        "to":      [user_email],
+        "subject": "🎉 ¡Bienvenido a TechStore!",
+        "html":    _base_template(content),
+    }, tag="welcome")
 
 
 # ── 2. Confirmación de orden ──────────────────────────────────────────────────
-def send_order_confirmation(order: dict, user_email: str, user_name: str):
+async def send_order_confirmation(order: dict, user_email: str, user_name: str):
     items_html = ""
     for item in order.get("items", []):
         items_html += f"""
@@ -177,16 +180,12 @@ def send_order_confirmation(order: dict, user_email: str, user_name: str):
     <div class="divider"></div>
     <p>Te notificaremos cuando tu pedido sea enviado. Si tienes dudas escríbenos por WhatsApp 📱</p>
     """
-    try:
-        resend.Emails.send({
-            "from":    FROM_EMAIL,
-            "to":      [user_email],
-            "subject": f"✅ Pedido #{order_id} confirmado — TechStore",
-            "html":    _base_template(content),
-        })
-        print(f"[EMAIL] Confirmación de orden enviada a {user_email}")
-    except Exception as e:
-        print(f"[EMAIL ERROR] order_confirmation: {e}")
+    await enqueue_email(f"order_confirmation:{_order_key(order)}", {
+        "from":    FROM_EMAIL,
+        "to":      [user_email],
+        "subject": f"✅ Pedido #{order_id} confirmado — TechStore",
+        "html":    _base_template(content),
+    }, tag="order_confirmation")
 
 
 # ── 3. Cambio de estado de orden ──────────────────────────────────────────────
@@ -197,7 +196,7 @@ STATUS_CONFIG = {
     "cancelled": ("❌ Tu pedido fue cancelado",    "badge-orange", "cancelado"),
 }
 
-def send_order_status_update(order: dict, user_email: str, user_name: str, new_status: str):
+async def send_order_status_update(order: dict, user_email: str, user_name: str, new_status: str):
     cfg = STATUS_CONFIG.get(new_status)
     if not cfg:
         return
@@ -222,20 +221,17 @@ def send_order_status_update(order: dict, user_email: str, user_name: str, new_s
     <p>Total de tu pedido: <strong style="color:#00d4ff">S/ {total:.2f}</strong></p>
     {extra}
     """
-    try:
-        resend.Emails.send({
-            "from":    FROM_EMAIL,
-            "to":      [user_email],
-            "subject": f"{title} — TechStore #{order_id}",
-            "html":    _base_template(content),
-        })
-        print(f"[EMAIL] Estado actualizado enviado a {user_email}: {new_status}")
-    except Exception as e:
-        print(f"[EMAIL ERROR] status_update: {e}")
+    # status_version distingue shipped → pending → shipped: cada cambio real envía su correo
+    await enqueue_email(f"order_status:{_order_key(order)}:{order.get('status_version', 0)}:{new_status}", {
+        "from":    FROM_EMAIL,
+        "to":      [user_email],
+        "subject": f"{title} — TechStore #{order_id}",
+        "html":    _base_template(content),
+    }, tag="status_update")
 
 
 # ── 4. Notificación al admin de nueva orden ───────────────────────────────────
-def send_admin_new_order(order: dict, user_email: str, user_name: str):
+async def send_admin_new_order(order: dict, user_email: str, user_name: str):
     items_html = ""
     for item in order.get("items", []):
         items_html += f"""
@@ -271,20 +267,16 @@ def send_admin_new_order(order: dict, user_email: str, user_name: str):
       </tbody>
     </table>
     """
-    try:
-        resend.Emails.send({
-            "from":    FROM_EMAIL,
-            "to":      [ADMIN_EMAIL],
-            "subject": f"🛒 Nueva orden #{order_id} — S/ {total:.2f}",
-            "html":    _base_template(content),
-        })
-        print(f"[EMAIL] Admin notificado de nueva orden #{order_id}")
-    except Exception as e:
-        print(f"[EMAIL ERROR] admin_new_order: {e}")
+    await enqueue_email(f"admin_new_order:{_order_key(order)}", {
+        "from":    FROM_EMAIL,
+        "to":      [ADMIN_EMAIL],
+        "subject": f"🛒 Nueva orden #{order_id} — S/ {total:.2f}",
+        "html":    _base_template(content),
+    }, tag="admin_new_order")
 
 
 # ── 5. Recuperación de contraseña ─────────────────────────────────────────────
-def send_password_reset(user_email: str, user_name: str, reset_token: str,
+async def send_password_reset(user_email: str, user_name: str, reset_token: str,
                          base_url: str = "http://localhost:5173"):
     reset_url = f"{base_url}/reset-password?token={reset_token}"
     content   = f"""
@@ -307,13 +299,9 @@ def send_password_reset(user_email: str, user_name: str, reset_token: str,
       <span style="color:#00d4ff;word-break:break-all">{reset_url}</span>
     </p>
     """
-    try:
-        resend.Emails.send({
-            "from":    FROM_EMAIL,
-            "to":      [user_email],
-            "subject": "🔑 Restablecer contraseña — TechStore",
-            "html":    _base_template(content),
-        })
-        print(f"[EMAIL] Reset de contraseña enviado a {user_email}")
-    except Exception as e:
-        print(f"[EMAIL ERROR] password_reset: {e}")
\ No newline at end of file
+    await enqueue_email(f"password_reset:{reset_token}", {
+        "from":    FROM_EMAIL,
+        "to":      [user_email],
+        "subject": "🔑 Restablecer contraseña — TechStore",
+        "html":    _base_template(content),
+    }, tag="password_reset")
\ No newline at end of file
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from app.database import idempotency_collection
+
+
+# Idempotency-Key: la primera ejecución guarda su respuesta y los reintentos
+# con la misma clave la reciben tal cual. Dentro del proceso los duplicados
+# simultáneos esperan el futuro de la primera ejecución; entre workers esperan
+# sondeando el documento hasta que pasa a "done". Mientras el handler corre se
+# renueva locked_until cada tercio de IDEMPOTENCY_LOCK_SECONDS. Un lock vencido
+# (worker muerto, o no se pudo guardar la respuesta) no se vuelve a ejecutar:
+# la orden pudo haberse creado, así que la clave responde 409 hasta su TTL.
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_POLL_INTERVAL = 0.2
+IDEMPOTENCY_SAVE_RETRIES = 3
+MAX_KEY_LENGTH = 255
+
+IN_PROGRESS = "in_progress"
+DONE = "done"
+
+_inflight = {}
+
+
+def fingerprint(payload) -> str:
+    raw = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _uncertain():
+    return HTTPException(
+        status_code=409,
+        detail="No se sabe si la petición con esta Idempotency-Key se completó; "
+               "revisa tus órdenes antes de reintentar con una clave nueva"
+    )
+
+
+def _check_same_request(doc: dict, request_hash: str):
+    if doc.get("fingerprint") != request_hash:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key ya usada con otra petición"
+        )
+
+
+async def _claim(doc_id: str, request_hash: str):
+    """
+    Intenta ser la ejecución dueña de la clave. Devuelve None si la reclamó o
+    el documento existente (en curso o terminado) si otra ejecución la tiene.
+    """
+    now = datetime.utcnow()
+    try:
+        await idempotency_collection.insert_one({
+            "_id": doc_id,
+            "fingerprint": request_hash,
+            "created_at": now,
+            "status": IN_PROGRESS,
+            "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+    return await idempotency_collection.find_one({"_id": doc_id}) or {"status": IN_PROGRESS, "fingerprint": request_hash}
+
+
+def _lock_expired(doc: dict) -> bool:
+    locked_until = doc.get("locked_until")
+    return doc["status"] == IN_PROGRESS and locked_until is not None and locked_until < datetime.utcnow()
+
+
+async def _keep_locked(doc_id: str):
+    """Renueva el lock mientras el handler siga corriendo (se cancela al terminar)."""
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_LOCK_SECONDS / 3)
+        try:
+            await idempotency_collection.update_one(
+                {"_id": doc_id, "status": IN_PROGRESS},
+                {"$set": {"locked_until": datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}}
+            )
+        except PyMongoError as e:
+            print(f"[IDEMPOTENCY WARN] no se pudo renovar {doc_id}: {e}")
+
+
+async def _wait_for(doc_id: str, request_hash: str):
+    """Otra ejecución (quizás en otro worker) tiene la clave: espera su respuesta."""
+    deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+    while asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+        doc = await idempotency_collection.find_one({"_id": doc_id})
+        if doc is None:
+            return None                     # la primera falló y liberó la clave
+        _check_same_request(doc, request_hash)
+        if doc["status"] == DONE:
+            return doc["response"]
+        if _lock_expired(doc):
+            raise _uncertain()
+    raise HTTPException(
+        status_code=409,
+        detail="Hay una petición con esta Idempotency-Key en curso",
+        headers={"Retry-After": "1"}
+    )
+
+
+async def _execute(doc_id: str, request_hash: str, handler):
+    while True:
+        existing = await _claim(doc_id, request_hash)
+        if existing is not None:
+            _check_same_request(existing, request_hash)
+            if existing["status"] == DONE:
+                return existing["response"], True
+            if _lock_expired(existing):
+                raise _uncertain()
+            response = await _wait_for(doc_id, request_hash)
+            if response is not None:
+                return response, True
+            continue
+
+        heartbeat = asyncio.create_task(_keep_locked(doc_id))
+        try:
+            response = jsonable_encoder(await handler())
+        except BaseException:
+            heartbeat.cancel()
+            await idempotency_collection.delete_one({"_id": doc_id, "status": IN_PROGRESS})
+            raise
+
+        try:
+            await _save_response(doc_id, response)
+        finally:
+            heartbeat.cancel()
+        return response, False
+
+
+async def _save_response(doc_id: str, response):
+    """
+    La orden ya se creó: guardar la respuesta se reintenta y, si aun así falla,
+    la clave queda "in_progress" hasta vencer y después responde 409 (nunca se
+    libera para volver a ejecutar). El cliente recibe la respuesta igual.
+    """
+    for attempt in range(IDEMPOTENCY_SAVE_RETRIES):
+        try:
+            await idempotency_collection.update_one(
+                {"_id": doc_id},
+                {"$set": {"status": DONE, "response": response, "completed_at": datetime.utcnow()},
+                 "$unset": {"locked_until": ""}}
+            )
+            return
+        except PyMongoError as e:
+            print(f"[IDEMPOTENCY WARN] guardar {doc_id} intento {attempt + 1}: {e}")
+            await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL * 2 ** attempt)
+    print(f"[IDEMPOTENCY ERROR] no se guardó la respuesta de {doc_id}; la clave no se reejecutará")
+
+
+async def _join(future, request_hash: str):
+    """Duplicado en el mismo proceso: espera el resultado (o el error) de la primera."""
+    try:
+        response, first_hash = await asyncio.shield(future)
+    except asyncio.CancelledError:
+        if not future.cancelled():
+            raise
+        raise HTTPException(
+            status_code=409,
+            detail="Hay una petición con esta Idempotency-Key en curso",
+            headers={"Retry-After": "1"}
+        )
+    if first_hash != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key ya usada con otra petición")
+    return response, True
+
+
+async def run_idempotent(key, scope: str, user_id: str, payload, handler):
+    """
+    Ejecuta handler() una sola vez por (scope, usuario, clave). Devuelve
+    (respuesta, replayed). Sin clave ejecuta directo. Si handler falla la clave
+    se libera, para que un reintento posterior vuelva a ejecutar.
+    """
+    if not key:
+        return await handler(), False
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key demasiado larga")
+
+    doc_id = f"{scope}:{user_id}:{key}"
+    request_hash = fingerprint(payload)
+
+    future = _inflight.get(doc_id)
+    if future is not None:
+        return await _join(future, request_hash)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[doc_id] = future
+    try:
+        response, replayed = await _execute(doc_id, request_hash, handler)
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()                  # evita el aviso si nadie esperaba
+        raise
+    except BaseException:
+        future.cancel()
+        raise
+    finally:
+        _inflight.pop(doc_id, None)
+
+    future.set_result((response, request_hash))
+    return response, replayed
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import cloudinary
+import cloudinary.uploader
+
+from app.cloudinary_config import *
+from app.services.blob_store import hash_fileobj, acquire_remote, register_remote, release_remote
+
+
+IMAGE_STORAGE            = os.getenv("IMAGE_STORAGE", "cloudinary")     # cloudinary | local
+IMAGE_UPLOAD_CONCURRENCY = int(os.getenv("IMAGE_UPLOAD_CONCURRENCY", "4"))
+LOCAL_MEDIA_DIR          = os.getenv("LOCAL_MEDIA_DIR", "media")
+LOCAL_MEDIA_URL          = os.getenv("LOCAL_MEDIA_URL", "/media")
+
+ALLOWED_IMAGE_TYPES = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
+
+
+# ─────────────────────────────────────────────
+# BACKENDS (síncronos: se ejecutan fuera del event loop)
+# ─────────────────────────────────────────────
+
+class CloudinaryStorage:
+    def upload(self, fileobj, folder: str, public_id: str, suffix: str) -> str:
+        # cloudinary acepta el archivo abierto y lo sube por partes: no se copia a memoria
+        result = cloudinary.uploader.upload(
+            fileobj,
+            folder=folder,
+            public_id=public_id,
+            resource_type="image"
+        )
+        return result["secure_url"]
+
+    def delete(self, folder: str, url: str):
+        public_id = url.split("/")[-1].split(".")[0]
+        cloudinary.uploader.destroy(f"{folder}/{public_id}")
+
+
+class LocalStorage:
+    """Guarda en disco local. Para desarrollo y tests."""
+
+    def __init__(self, root=LOCAL_MEDIA_DIR, base_url=LOCAL_MEDIA_URL):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+
+    def upload(self, fileobj, folder: str, public_id: str, suffix: str) -> str:
+        dest_dir = self.root / folder
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        name = f"{public_id}{suffix}"
+        with open(dest_dir / name, "wb") as out:
+            shutil.copyfileobj(fileobj, out)
+        return f"{self.base_url}/{folder}/{name}"
+
+    def delete(self, folder: str, url: str):
+        (self.root / folder / url.split("/")[-1]).unlink(missing_ok=True)
+
+
+_BACKENDS = {"cloudinary": CloudinaryStorage, "local": LocalStorage}
+_storage = None
+_upload_slots = asyncio.Semaphore(IMAGE_UPLOAD_CONCURRENCY)
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        _storage = _BACKENDS.get(IMAGE_STORAGE, CloudinaryStorage)()
+    return _storage
+
+
+def set_storage(storage):
+    global _storage
+    _storage = storage
+
+
+# ─────────────────────────────────────────────
+# API ASYNC
+# ─────────────────────────────────────────────
+
+def new_public_id(prefix: str) -> str:
+    return f"{prefix}_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+
+
+async def upload_image(file, folder: str, public_id: str) -> str:
+    """
+    Sube el UploadFile directamente desde su archivo temporal (SpooledTemporaryFile)
+    en un hilo aparte. Como máximo IMAGE_UPLOAD_CONCURRENCY subidas a la vez.
+
+    Antes de subir se calcula el sha256 del temporal local: si ese contenido ya
+    está en el almacenamiento se reutiliza su URL y no se sube nada. Esto lee el
+    temporal dos veces cuando sí hay que subir; es intencional, porque el hash
+    decide si la subida ocurre y no puede calcularse durante ella. La lectura
+    extra es local (disco o memoria), mucho más barata que la subida remota.
+    """
+    suffix = ALLOWED_IMAGE_TYPES.get(file.content_type, Path(file.filename or "").suffix)
+    sha256, size = await asyncio.to_thread(hash_fileobj, file.file)
+
+    existing = await acquire_remote(sha256)
+    if existing:
+        return existing
+
+    async with _upload_slots:
+        url = await asyncio.to_thread(get_storage().upload, file.file, folder, public_id, suffix)
+
+    winner = await register_remote(sha256, size, url)
+    if winner != url:
+        # otra subida concurrente del mismo contenido llegó primero
+        await asyncio.to_thread(get_storage().delete, folder, url)
+    return winner
+
+
+async def upload_images(files, folder: str, prefix: str):
+    return await asyncio.gather(*[
+        upload_image(f, folder, new_public_id(prefix)) for f in files
+    ])
+
+
+async def release_image(url: str, count: int = 1):
+    """Suelta referencias sin borrar (p. ej. la misma imagen subida dos veces al mismo producto)."""
+    await release_remote(url, count)
+
+
+async def delete_image(folder: str, url: str):
+    """Quita una referencia y borra del almacenamiento solo si ya nadie la usa."""
+    if not await release_remote(url):
+        return
+    async with _upload_slots:
+        await asyncio.to_thread(get_storage().delete, folder, url)
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+
+# Derivados WebP redimensionados para srcset. Se nombran por el sha256 del
+# original (un mismo contenido publicado con dos nombres los comparte) y se
+# guardan en _derived/ junto a los originales para que el frontend los sirva.
+VARIANT_WIDTHS  = tuple(int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "320,640,1024,1600").split(","))
+VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", "2"))
+DERIVED_DIR     = "_derived"
+
+_pool = None
+
+
+def variant_name(sha256: str, width: int) -> str:
+    return f"{sha256[:16]}_{width}.webp"
+
+
+def build_srcset(base_url: str, sha256: str, widths) -> str:
+    """Valor listo para <img srcset>, o None si la imagen no tiene derivados."""
+    if not sha256 or not widths:
+        return None
+    return ", ".join(
+        f"{base_url}/{DERIVED_DIR}/{variant_name(sha256, w)} {w}w" for w in widths
+    )
+
+
+# ─────────────────────────────────────────────
+# GENERACIÓN (corre en un proceso aparte)
+# ─────────────────────────────────────────────
+
+def _render_variants(source: str, out_dir: str, sha256: str, widths: tuple, quality: int) -> list:
+    """
+    Genera los WebP que falten y devuelve los anchos disponibles. Nunca agranda:
+    si el original es más angosto que un ancho, ese ancho se reemplaza por el
+    del original. Los GIF animados y los archivos ilegibles no tienen derivados.
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        print("[IMAGES WARN] Pillow no está instalado: no se generan derivados")
+        return []
+
+    out = Path(out_dir)
+    try:
+        with Image.open(source) as img:
+            if getattr(img, "is_animated", False):
+                return []
+            img = ImageOps.exif_transpose(img)
+            targets = sorted({min(w, img.width) for w in widths})
+            pending = [w for w in targets if not (out / variant_name(sha256, w)).exists()]
+            if pending:
+                out.mkdir(parents=True, exist_ok=True)
+                if img.mode not in ("RGB", "RGBA"):
+                    img = img.convert("RGBA" if "transparency" in img.info or "A" in img.mode else "RGB")
+            for width in pending:
+                height = max(1, round(img.height * width / img.width))
+                resized = img.resize((width, height), Image.LANCZOS) if width != img.width else img
+                fd, tmp = tempfile.mkstemp(dir=out, suffix=".webp.tmp")
+                with os.fdopen(fd, "wb") as f:
+                    resized.save(f, "WEBP", quality=quality, method=4)
+                os.replace(tmp, out / variant_name(sha256, width))
+            return targets
+    except (OSError, ValueError) as e:
+        print(f"[IMAGES WARN] no se pudieron generar derivados de {source}: {e}")
+        return []
+
+
+# ─────────────────────────────────────────────
+# API ASYNC
+# ─────────────────────────────────────────────
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=VARIANT_WORKERS)
+    return _pool
+
+
+async def generate_variants(source: Path, sha256: str) -> list:
+    """Genera (o reutiliza del disco) los derivados de source. Devuelve sus anchos."""
+    out_dir = source.parent / DERIVED_DIR
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_pool(), _render_variants,
+        str(source), str(out_dir), sha256, VARIANT_WIDTHS, VARIANT_QUALITY
+    )
+
+
+def remove_variants(directory: Path, sha256: str):
+    """Borra los derivados de un contenido que ya no se publica en directory."""
+    if not sha256:
+        return
+    for f in (directory / DERIVED_DIR).glob(f"{sha256[:16]}_*.webp"):
+        f.unlink(missing_ok=True)
+
+
+def shutdown_variant_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,145 @@
+import hashlib
+import re
+from datetime import datetime
+from pathlib import Path
+
+from app.database import library_collection
+from app.services.image_variants import generate_variants, build_srcset
+from app.utils.image_info import image_dimensions
+from app.utils.pagination import paginate
+
+
+LIBRARY_DIR = Path(__file__).resolve().parents[3] / "frontend" / "public" / "library"
+VALID_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.webp', '.gif']
+CHUNK_SIZE = 1024 * 1024
+
+
+def image_type(filename: str) -> str:
+    ext = Path(filename).suffix.lower().lstrip(".")
+    return "jpg" if ext == "jpeg" else ext
+
+
+def serialize_library_image(doc: dict) -> dict:
+    return {
+        "filename":   doc["filename"],
+        "url":        f"/library/{doc['filename']}",
+        "size":       doc.get("size"),
+        "type":       doc.get("type"),
+        "width":      doc.get("width"),
+        "height":     doc.get("height"),
+        "sha256":     doc.get("sha256"),
+        "srcset":     build_srcset("/library", doc.get("sha256"), doc.get("variants")),
+        "created_at": doc.get("created_at"),
+    }
+
+
+# ─────────────────────────────────────────────
+# ESCRITURA
+# ─────────────────────────────────────────────
+
+async def record_image(path: Path, sha256: str, size: int, created_at: datetime = None, variants: list = None):
+    width, height = image_dimensions(path)
+    doc = {
+        "filename":   path.name,
+        "type":       image_type(path.name),
+        "size":       size,
+        "width":      width,
+        "height":     height,
+        "sha256":     sha256,
+        "variants":   variants or [],
+        "created_at": created_at or datetime.utcnow(),
+    }
+    await library_collection.update_one(
+        {"filename": path.name},
+        {"$set": doc},
+        upsert=True
+    )
+    return doc
+
+
+async def remove_image(filename: str):
+    """Quita la imagen del índice y devuelve su entrada (con sha256) o None."""
+    return await library_collection.find_one_and_delete({"filename": filename})
+
+
+async def sha_in_use(sha256: str) -> bool:
+    return bool(sha256) and await library_collection.count_documents({"sha256": sha256}, limit=1) > 0
+
+
+# ─────────────────────────────────────────────
+# CONSULTA
+# ─────────────────────────────────────────────
+
+def _library_query(prefix=None, type_=None) -> dict:
+    query = {}
+    if prefix:
+        # regex anclado al inicio: usa el índice sobre filename
+        query["filename"] = {"$regex": f"^{re.escape(prefix)}"}
+    if type_:
+        query["type"] = image_type(f"x.{type_}")
+    return query
+
+
+async def list_library_service(prefix=None, type_=None):
+    docs = await library_collection.find(_library_query(prefix, type_)).sort(
+        [("created_at", -1), ("_id", -1)]
+    ).to_list(None)
+    return [serialize_library_image(d) for d in docs]
+
+
+async def list_library_page_service(limit: int, cursor=None, prefix=None, type_=None):
+    return await paginate(
+        library_collection,
+        _library_query(prefix, type_),
+        limit=limit,
+        cursor=cursor,
+        serializer=serialize_library_image,
+    )
+
+
+# ─────────────────────────────────────────────
+# RECONSTRUIR ÍNDICE
+# ─────────────────────────────────────────────
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def rebuild_library_index(directory: Path = None):
+    """
+    Reconcilia el índice con el disco: agrega los archivos que faltan (o cuyo
+    tamaño cambió), generando sus derivados, y elimina las entradas de
+    archivos que ya no existen.
+    """
+    directory = directory or LIBRARY_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+
+    indexed = {
+        d["filename"]: d
+        async for d in library_collection.find({}, {"filename": 1, "size": 1})
+    }
+    on_disk = {
+        f.name: f for f in directory.iterdir()
+        if f.is_file() and f.suffix.lower() in VALID_EXTENSIONS
+    }
+
+    added = 0
+    for name, path in on_disk.items():
+        stat = path.stat()
+        if name in indexed and indexed[name].get("size") == stat.st_size:
+            continue
+        sha256 = _hash_file(path)
+        await record_image(path, sha256, stat.st_size,
+                           created_at=datetime.utcfromtimestamp(stat.st_mtime),
+                           variants=await generate_variants(path, sha256))
+        added += 1
+
+    missing = [name for name in indexed if name not in on_disk]
+    if missing:
+        await library_collection.delete_many({"filename": {"$in": missing}})
+
+    return {"indexed": len(on_disk), "added": added, "removed": len(missing)}
@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+import os
+
+from app.database import order_collection
+
+
+# Documentos por ida a Mongo y filas por chunk enviado al cliente: la memoria
+# usada por la exportación no depende de cuántas órdenes haya.
+EXPORT_BATCH_SIZE = int(os.getenv("ORDER_EXPORT_BATCH_SIZE", "500"))
+
+# items_count = líneas de la orden (igual que en /orders/my-orders); units = suma de cantidades
+CSV_COLUMNS = ["id", "created_at", "user_id", "status", "total", "items_count", "units", "items"]
+
+
+def _orders_cursor(query: dict):
+    return order_collection.find(query).sort(
+        [("created_at", -1), ("_id", -1)]
+    ).batch_size(EXPORT_BATCH_SIZE)
+
+
+def _csv_row(order: dict) -> list:
+    items = order.get("items", [])
+    created_at = order.get("created_at")
+    return [
+        str(order["_id"]),
+        created_at.isoformat() if created_at else "",
+        order.get("user_id", ""),
+        order.get("status", ""),
+        order.get("total", 0),
+        len(items),
+        sum(i.get("quantity", 0) for i in items),
+        "; ".join(f"{i.get('quantity', 0)} x {i.get('name', i.get('product_id', ''))}" for i in items),
+    ]
+
+
+async def stream_orders_ndjson(query: dict):
+    """Una orden por línea (JSON), en chunks de EXPORT_BATCH_SIZE órdenes."""
+    lines = []
+    async for order in _orders_cursor(query):
+        order["_id"] = str(order["_id"])
+        lines.append(json.dumps(order, ensure_ascii=False, default=str))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+async def stream_orders_csv(query: dict):
+    """CSV con una fila por orden; los ítems se resumen en una sola columna."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    rows = 0
+    async for order in _orders_cursor(query):
+        writer.writerow(_csv_row(order))
+        rows += 1
+        if rows >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            rows = 0
+    yield buffer.getvalue()
@@ -1,7 +1,17 @@
-from app.database import order_collection, product_collection, cart_collection
+from app.database import order_collection, cart_collection
 from bson import ObjectId
 from fastapi import HTTPException
 from datetime import datetime
+from pymongo import ReturnDocument
+from app.services.analytics_service import record_order, record_status_change
+from app.services.cart_service import batch_cart_service, CART_PRODUCT_PROJECTION
+from app.utils.pagination import paginate, apply_cursor, encode_cursor, MAX_LIMIT
+from app.services.stock_service import (
+    fetch_products,
+    reserve_stock,
+    release_stock,
+    confirm_reservation,
+)
 
 
 VALID_STATUSES = ["pending", "confirmed", "shipped", "delivered", "cancelled"]
@@ -12,76 +22,59 @@ def _serialize_order(order: dict) -> dict:
     return order
 
 
-async def _descontar_stock(product_id: str, quantity: int):
-    """Descuenta stock del producto, lanza error si no hay suficiente."""
-    product = await product_collection.find_one({"_id": ObjectId(product_id)})
-
-    if not product:
-        raise HTTPException(status_code=404, detail=f"Producto {product_id} no encontrado")
-
-    if product["stock"] < quantity:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Stock insuficiente para '{product['name']}'. Disponible: {product['stock']}"
-        )
-
-    await product_collection.update_one(
-        {"_id": ObjectId(product_id)},
-        {"$inc": {"stock": -quantity}}
-    )
-
-
 # ─────────────────────────────────────────────
-# CREAR ORDEN DESDE EL CARRITO ← NUEVO
+# CONSTRUIR Y GUARDAR ORDEN
 # ─────────────────────────────────────────────
 
-async def create_order_from_cart_service(user_id: str):
-    # 1. Obtener carrito
-    cart = await cart_collection.find_one({"user_id": user_id})
-
-    if not cart or not cart.get("items"):
-        raise HTTPException(status_code=400, detail="El carrito está vacío")
+async def _place_order(user_id: str, lines: list, products: dict = None):
+    """
+    lines: [{"product_id", "quantity", "name"?, "image"?}]
+    Valida con un solo $in (o con products si el llamador ya los leyó), reserva
+    el stock con un bulk_write atómico por producto y guarda la orden. Si la
+    inserción falla, devuelve el stock.
+    """
+    quantities = {}
+    for line in lines:
+        if line["quantity"] < 1:
+            raise HTTPException(status_code=400, detail="La cantidad debe ser mayor a 0")
+        quantities[line["product_id"]] = quantities.get(line["product_id"], 0) + line["quantity"]
+
+    if products is None:
+        products = await fetch_products(quantities.keys())
 
     items_snapshot = []
     total = 0
+    seen = set()
 
-    # 2. Validar stock y construir snapshot
-    for item in cart["items"]:
-        product = await product_collection.find_one(
-            {"_id": ObjectId(item["product_id"])}
-        )
+    for line in lines:
+        product_id = line["product_id"]
+        if product_id in seen:
+            continue
+        seen.add(product_id)
 
+        product = products.get(product_id)
         if not product:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Producto '{item['name']}' ya no existe"
-            )
+            detail = f"Producto '{line['name']}' ya no existe" if line.get("name") else "Producto no encontrado"
+            raise HTTPException(status_code=404, detail=detail)
 
-        if product["stock"] < item["quantity"]:
+        quantity = quantities[product_id]
+        if product["stock"] < quantity:
             raise HTTPException(
                 status_code=400,
                 detail=f"Stock insuficiente para '{product['name']}'. Disponible: {product['stock']}"
             )
 
-        item_total = product["price"] * item["quantity"]
-        total += item_total
-
+        total += product["price"] * quantity
         items_snapshot.append({
-            "product_id": str(product["_id"]),
+            "product_id": product_id,
             "name": product["name"],
             "price": product["price"],
-            "quantity": item["quantity"],
-            "image": item.get("image")
+            "quantity": quantity,
+            "image": line.get("image") or (product["images"][0] if product.get("images") else None)
         })
 
-    # 3. Descontar stock de cada producto
-    for item in items_snapshot:
-        await product_collection.update_one(
-            {"_id": ObjectId(item["product_id"])},
-            {"$inc": {"stock": -item["quantity"]}}
-        )
+    reservation = await reserve_stock(quantities)
 
-    # 4. Crear la orden
     order = {
         "user_id": user_id,
         "items": items_snapshot,
@@ -90,13 +83,36 @@ async def create_order_from_cart_service(user_id: str):
         "created_at": datetime.utcnow()
     }
 
-    result = await order_collection.insert_one(order)
+    try:
+        result = await order_collection.insert_one(order)
+    except Exception:
+        await release_stock(reservation, quantities)
+        raise
+
+    await confirm_reservation(reservation, quantities)
     order["_id"] = str(result.inserted_id)
+    await record_order(order)
+    return order
+
+
+# ─────────────────────────────────────────────
+# CREAR ORDEN DESDE EL CARRITO ← NUEVO
+# ─────────────────────────────────────────────
+
+async def create_order_from_cart_service(user_id: str):
+    # 1. Obtener carrito
+    cart = await cart_collection.find_one({"user_id": user_id})
 
-    # 5. Vaciar el carrito
+    if not cart or not cart.get("items"):
+        raise HTTPException(status_code=400, detail="El carrito está vacío")
+
+    # 2. Validar stock, reservarlo y crear la orden
+    order = await _place_order(user_id, cart["items"])
+
+    # 3. Vaciar el carrito
     await cart_collection.update_one(
         {"user_id": user_id},
-        {"$set": {"items": [], "updated_at": datetime.utcnow()}}
+        {"$set": {"items": [], "updated_at": datetime.utcnow()}, "$inc": {"rev": 1}}
     )
 
     return order
@@ -107,52 +123,92 @@ async def create_order_from_cart_service(user_id: str):
 # ─────────────────────────────────────────────
 
 async def create_order_service(user_id: str, order_data):
-    items_snapshot = []
-    total = 0
+    lines = [
+        {"product_id": item.product_id, "quantity": item.quantity}
+        for item in order_data.items
+    ]
+    return await _place_order(user_id, lines)
 
-    for item in order_data.items:
-        product = await product_collection.find_one(
-            {"_id": ObjectId(item.product_id)}
-        )
 
-        if not product:
-            raise HTTPException(status_code=404, detail="Producto no encontrado")
-
-        if product["stock"] < item.quantity:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Stock insuficiente para '{product['name']}'"
-            )
+# ─────────────────────────────────────────────
+# VOLVER A PEDIR
+# ─────────────────────────────────────────────
 
-        item_total = product["price"] * item.quantity
-        total += item_total
+# Los mismos campos que usa el carrito: los productos leídos se pasan tal cual a batch_cart_service
+REORDER_PROJECTION = CART_PRODUCT_PROJECTION
+
+
+def _revalidate_lines(items: list, products: dict):
+    """
+    Compara el snapshot de la orden con los productos actuales. Devuelve las
+    líneas que se pueden pedir (recortadas al stock) y el reporte de cambios.
+    """
+    lines = []
+    report = {"unavailable": [], "adjusted": [], "price_changed": []}
+    for item in items:
+        product_id = item["product_id"]
+        product = products.get(product_id)
+        if not product or product["stock"] <= 0:
+            report["unavailable"].append({
+                "product_id": product_id,
+                "name": item.get("name"),
+                "reason": "Producto no encontrado" if not product else "Sin stock",
+            })
+            continue
+
+        quantity = min(item["quantity"], product["stock"])
+        if quantity < item["quantity"]:
+            report["adjusted"].append({
+                "product_id": product_id, "requested": item["quantity"], "available": quantity,
+            })
+        if product["price"] != item.get("price"):
+            report["price_changed"].append({
+                "product_id": product_id, "old_price": item.get("price"), "price": product["price"],
+            })
+        lines.append({"product_id": product_id, "quantity": quantity, "name": product["name"]})
+    return lines, report
+
+
+async def reorder_service(order_id: str, user_id: str, mode: str = "cart"):
+    """
+    Vuelve a pedir los ítems de una orden propia. Revalida precio y stock con
+    un solo $in y, según mode, los carga al carrito (/cart/batch) o crea la
+    orden directamente con la misma lógica que create_order_service. En ambos
+    casos los productos leídos se reutilizan, sin volver a consultarlos.
+    """
+    if not ObjectId.is_valid(order_id):
+        raise HTTPException(status_code=404, detail="Orden no encontrada")
+    order = await order_collection.find_one(
+        {"_id": ObjectId(order_id), "user_id": user_id},
+        {"items": 1}
+    )
+    if not order:
+        raise HTTPException(status_code=404, detail="Orden no encontrada")
 
-        items_snapshot.append({
-            "product_id": str(product["_id"]),
-            "name": product["name"],
-            "price": product["price"],
-            "quantity": item.quantity,
-            "image": product["images"][0] if product.get("images") else None
-        })
+    items = order.get("items", [])
+    products = await fetch_products({i["product_id"] for i in items}, REORDER_PROJECTION)
+    lines, report = _revalidate_lines(items, products)
+    if not lines:
+        raise HTTPException(status_code=400, detail="Ningún producto de la orden está disponible")
 
-    # Descontar stock
-    for item in items_snapshot:
-        await product_collection.update_one(
-            {"_id": ObjectId(item["product_id"])},
-            {"$inc": {"stock": -item["quantity"]}}
-        )
+    if mode == "order":
+        created = await _place_order(user_id, lines, products)
+        return {"mode": mode, "order": created, **report}
 
-    order = {
-        "user_id": user_id,
-        "items": items_snapshot,
-        "total": round(total, 2),
-        "status": "pending",
-        "created_at": datetime.utcnow()
-    }
+    ops = [{"op": "add", "product_id": l["product_id"], "quantity": l["quantity"]} for l in lines]
+    batch = await batch_cart_service(user_id, ops, products=products)
+    if "error" in batch:
+        raise HTTPException(status_code=409, detail=batch["error"])
 
-    result = await order_collection.insert_one(order)
-    order["_id"] = str(result.inserted_id)
-    return order
+    # lo que ya estaba en el carrito puede hacer que el total supere el stock
+    for result in batch["results"]:
+        if not result["ok"]:
+            report["unavailable"].append({
+                "product_id": result["product_id"],
+                "name": products[result["product_id"]]["name"],
+                "reason": result["error"],
+            })
+    return {"mode": mode, "cart": batch["cart"], **report}
 
 
 # ─────────────────────────────────────────────
@@ -166,13 +222,91 @@ async def get_user_orders_service(user_id: str):
     return orders
 
 
-async def get_all_orders_service():
+# Resumen para "Mis órdenes": el conteo y la primera imagen se calculan en el
+# servidor, así no viajan los snapshots de ítems de cada orden.
+ORDER_SUMMARY_PROJECTION = {
+    "total": 1,
+    "status": 1,
+    "created_at": 1,
+    "items_count": {"$size": {"$ifNull": ["$items", []]}},
+    "first_image": {"$arrayElemAt": ["$items.image", 0]},
+}
+
+
+async def get_user_orders_page_service(user_id: str, limit: int, cursor=None):
+    """Página de resúmenes sobre el índice (user_id, created_at, _id)."""
+    limit = max(1, min(limit, MAX_LIMIT))
+    pipeline = [
+        {"$match": apply_cursor({"user_id": user_id}, cursor)},
+        {"$sort": {"created_at": -1, "_id": -1}},
+        {"$limit": limit + 1},
+        {"$project": ORDER_SUMMARY_PROJECTION},
+    ]
+    docs = await order_collection.aggregate(pipeline).to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1])
+
+    return {
+        "items":       [_serialize_order(d) for d in docs],
+        "next_cursor": next_cursor,
+    }
+
+
+async def get_order_service(order_id: str, user: dict):
+    """Snapshot completo. Un cliente solo ve sus órdenes; el admin ve todas."""
+    if not ObjectId.is_valid(order_id):
+        raise HTTPException(status_code=404, detail="Orden no encontrada")
+
+    query = {"_id": ObjectId(order_id)}
+    if user.get("role") != "admin":
+        query["user_id"] = str(user["_id"])
+
+    order = await order_collection.find_one(query)
+    if not order:
+        raise HTTPException(status_code=404, detail="Orden no encontrada")
+    return _serialize_order(order)
+
+
+def orders_query(status: str = None, date_from: datetime = None, date_to: datetime = None) -> dict:
+    """Filtros del listado/exportación de admin. El rango es [date_from, date_to)."""
+    if status and status not in VALID_STATUSES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Estado inválido. Opciones: {VALID_STATUSES}"
+        )
+
+    query = {}
+    if status:
+        query["status"] = status
+    if date_from or date_to:
+        query["created_at"] = {}
+        if date_from:
+            query["created_at"]["$gte"] = date_from
+        if date_to:
+            query["created_at"]["$lt"] = date_to
+    return query
+
+
+async def get_all_orders_service(query: dict = None):
     orders = []
-    async for order in order_collection.find().sort("created_at", -1):
+    async for order in order_collection.find(query or {}).sort("created_at", -1):
         orders.append(_serialize_order(order))
     return orders
 
 
+async def get_all_orders_page_service(limit: int, cursor=None, query: dict = None):
+    return await paginate(
+        order_collection,
+        query or {},
+        limit=limit,
+        cursor=cursor,
+        serializer=_serialize_order,
+    )
+
+
 # ─────────────────────────────────────────────
 # ACTUALIZAR ESTADO (ADMIN) ← NUEVO
 # ─────────────────────────────────────────────
@@ -184,13 +318,21 @@ async def update_order_status_service(order_id: str, new_status: str):
             detail=f"Estado inválido. Opciones: {VALID_STATUSES}"
         )
 
-    result = await order_collection.update_one(
-        {"_id": ObjectId(order_id)},
-        {"$set": {"status": new_status, "updated_at": datetime.utcnow()}}
+    # el documento previo trae el estado anterior para mover el embudo de analytics;
+    # status_version cuenta los cambios reales y forma parte de la clave del email
+    previous = await order_collection.find_one_and_update(
+        {"_id": ObjectId(order_id), "status": {"$ne": new_status}},
+        {"$set": {"status": new_status, "updated_at": datetime.utcnow()}, "$inc": {"status_version": 1}},
+        return_document=ReturnDocument.BEFORE
     )
 
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Orden no encontrada")
+    if previous is None:
+        order = await order_collection.find_one({"_id": ObjectId(order_id)})
+        if order is None:
+            raise HTTPException(status_code=404, detail="Orden no encontrada")
+        return _serialize_order(order)      # ya estaba en ese estado: nada que cambiar
+
+    await record_status_change(previous, previous.get("status", "pending"), new_status)
 
     order = await order_collection.find_one({"_id": ObjectId(order_id)})
     return _serialize_order(order)
\ No newline at end of file
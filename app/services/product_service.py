@@ -1,11 +1,17 @@
 from app.database import product_collection
+from app.services.search_service import product_search, search_product_ids
+from app.services.stock_service import invalidate_product_snapshots
+from app.utils.pagination import paginate, encode_cursor, decode_cursor, MAX_LIMIT
 from datetime import datetime
 from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
 
 
 def serialize_product(product):
     product["id"] = str(product["_id"])
     del product["_id"]
+    product.pop("stock_holds", None)   # marcas internas de reservas de stock
     return product
 
 
@@ -24,16 +30,88 @@ async def create_product_service(product):
     product_dict["created_at"] = datetime.utcnow()
     result = await product_collection.insert_one(product_dict)
     created_product = await product_collection.find_one({"_id": result.inserted_id})
+    product_search.add(created_product)
     return serialize_product(created_product)
 
 
-async def get_products_service(query):
+async def get_products_service(query, projection=None):
     products = []
-    async for product in product_collection.find(query):
+    async for product in product_collection.find(query, projection):
         products.append(serialize_product(product))
     return products
 
 
+async def get_products_page_service(query, limit: int, cursor=None, projection=None):
+    return await paginate(
+        product_collection,
+        query,
+        limit=limit,
+        cursor=cursor,
+        projection=projection,
+        serializer=serialize_product,
+    )
+
+
+async def _ranked_products(query, ranked: list, projection=None):
+    """Los productos de ranked que cumplen query, en el orden de ranked."""
+    if not ranked:
+        return []
+    query = {**query, "_id": {"$in": [ObjectId(pid) for pid in ranked]}}
+    position = {pid: i for i, pid in enumerate(ranked)}
+
+    products = await get_products_service(query, projection)
+    products.sort(key=lambda p: position[p["id"]])
+    return products
+
+
+async def search_products_service(query, text: str, projection=None):
+    """Búsqueda por relevancia: el índice ordena los ids y Mongo aplica el resto de filtros."""
+    ranked = await search_product_ids(text)
+    return await _ranked_products(query, ranked, projection)
+
+
+async def search_products_page_service(query, text: str, limit: int, cursor=None, projection=None):
+    """
+    Pagina sobre la lista de ids ordenada por relevancia. Un solo find de _id
+    aplica los filtros de Mongo a todos los ids que quedan después del cursor;
+    las coincidencias se ordenan en memoria por relevancia y solo se leen los
+    documentos de la página. El cursor guarda el id del último producto: si ya
+    no está en el índice actual (los resultados cambiaron) se rechaza con 400.
+    """
+    limit  = max(1, min(limit, MAX_LIMIT))
+    ranked = await search_product_ids(text)
+
+    start = 0
+    if cursor:
+        _, last_id = decode_cursor(cursor)
+        try:
+            start = ranked.index(str(last_id)) + 1
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor vencido: los resultados de la búsqueda cambiaron")
+
+    remaining = ranked[start:]
+    if not remaining:
+        return {"items": [], "next_cursor": None}
+
+    matched = await product_collection.find(
+        {**query, "_id": {"$in": [ObjectId(pid) for pid in remaining]}},
+        {"_id": 1}
+    ).to_list(None)
+    matched_ids = {str(doc["_id"]) for doc in matched}
+    page_ids = [pid for pid in remaining if pid in matched_ids][:limit + 1]
+
+    has_more = len(page_ids) > limit
+    page_ids = page_ids[:limit]
+    items = await _ranked_products(query, page_ids, projection)
+
+    next_cursor = None
+    if has_more and items:
+        last = items[-1]
+        next_cursor = encode_cursor({"_id": last["id"], "rank": ranked.index(last["id"])}, "rank")
+
+    return {"items": items, "next_cursor": next_cursor}
+
+
 async def get_product_by_id_service(product_id):
     try:
         product = await product_collection.find_one({"_id": ObjectId(product_id)})
@@ -45,48 +123,45 @@ async def get_product_by_id_service(product_id):
 
 
 async def delete_product_service(product_id):
+    """Devuelve el producto borrado (solo sus imágenes) o None si no existía."""
     try:
-        result = await product_collection.delete_one({"_id": ObjectId(product_id)})
-        return result.deleted_count
+        deleted = await product_collection.find_one_and_delete(
+            {"_id": ObjectId(product_id)}, {"images": 1}
+        )
     except:
-        return 0
+        return None
+    if deleted:
+        product_search.remove(product_id)
+        invalidate_product_snapshots([product_id])
+    return deleted
 
 
-async def update_product_images_service(product_id: str, image_url: str):
+async def add_product_images_service(product_id: str, image_urls: list):
+    """Agrega varias imágenes a la galería en una sola escritura."""
     try:
-        product = await product_collection.find_one({"_id": ObjectId(product_id)})
-        if not product:
-            return None
-
-        images = product.get("images", [])
-        if image_url not in images:
-            images.append(image_url)
-
-        await product_collection.update_one(
+        updated = await product_collection.find_one_and_update(
             {"_id": ObjectId(product_id)},
-            {"$set": {"images": images}}
+            {"$addToSet": {"images": {"$each": image_urls}}},
+            return_document=ReturnDocument.AFTER
         )
-
-        updated = await product_collection.find_one({"_id": ObjectId(product_id)})
-        return serialize_product(updated)
     except:
         return None
+    invalidate_product_snapshots([product_id])
+    return serialize_product(updated) if updated else None
 
 
-async def delete_product_image_service(product_id: str, image_url: str):
-    try:
-        product = await product_collection.find_one({"_id": ObjectId(product_id)})
-        if not product:
-            return None
+async def update_product_images_service(product_id: str, image_url: str):
+    return await add_product_images_service(product_id, [image_url])
 
-        images = [img for img in product.get("images", []) if img != image_url]
 
-        await product_collection.update_one(
+async def delete_product_image_service(product_id: str, image_url: str):
+    try:
+        updated = await product_collection.find_one_and_update(
             {"_id": ObjectId(product_id)},
-            {"$set": {"images": images}}
+            {"$pull": {"images": image_url}},
+            return_document=ReturnDocument.AFTER
         )
-
-        updated = await product_collection.find_one({"_id": ObjectId(product_id)})
-        return serialize_product(updated)
     except:
-        return None
\ No newline at end of file
+        return None
+    invalidate_product_snapshots([product_id])
+    return serialize_product(updated) if updated else None
@@ -1,6 +1,14 @@
 from app.database import review_collection, product_collection
 from bson import ObjectId
 from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.utils.cache import TTLCache
+from app.utils.pagination import paginate
+
+# Resumen de rating por producto. Se invalida al crear/borrar reviews en este
+# worker; el TTL acota lo que puede tardar en verse un cambio de otro worker.
+summary_cache = TTLCache(maxsize=4096, ttl=30)
 
 
 def serialize_review(review: dict) -> dict:
@@ -9,6 +17,43 @@ def serialize_review(review: dict) -> dict:
     return review
 
 
+def _star(rating: float) -> int:
+    """Balde del histograma: 4.5 → 5, 4.4 → 4."""
+    return min(5, max(1, int(rating + 0.5)))
+
+
+def _average(rating_sum: float, rating_count: int) -> float:
+    return round(rating_sum / rating_count, 1) if rating_count > 0 else 0
+
+
+async def _apply_rating(product_id: str, rating: float, sign: int):
+    """
+    Suma (sign=1) o resta (sign=-1) una review a los agregados del producto:
+    rating_sum, rating_count y rating_histogram.<estrellas>. O(1) por review.
+    """
+    try:
+        product = await product_collection.find_one_and_update(
+            {"_id": ObjectId(product_id)},
+            {"$inc": {
+                "rating_sum": sign * rating,
+                "rating_count": sign,
+                f"rating_histogram.{_star(rating)}": sign,
+                "reviews_version": 1,
+            }},
+            projection={"rating_sum": 1, "rating_count": 1},
+            return_document=ReturnDocument.AFTER
+        )
+    except Exception:
+        return
+
+    summary_cache.invalidate(product_id)
+    if product:
+        await product_collection.update_one(
+            {"_id": product["_id"]},
+            {"$set": {"rating": _average(product["rating_sum"], product["rating_count"])}}
+        )
+
+
 async def create_review_service(user_id: str, user_name: str, product_id: str, rating: float, comment: str):
     # Verificar si ya dejó una review
     existing = await review_collection.find_one({
@@ -27,19 +72,13 @@ async def create_review_service(user_id: str, user_name: str, product_id: str, r
         "created_at": datetime.utcnow()
     }
 
-    await review_collection.insert_one(review)
-
-    # Recalcular rating promedio del producto
-    reviews = []
-    async for r in review_collection.find({"product_id": product_id}):
-        reviews.append(r)
+    try:
+        await review_collection.insert_one(review)
+    except DuplicateKeyError:
+        return {"error": "Ya dejaste una review para este producto"}
 
-    if reviews:
-        avg_rating = sum(r["rating"] for r in reviews) / len(reviews)
-        await product_collection.update_one(
-            {"_id": ObjectId(product_id)},
-            {"$set": {"rating": round(avg_rating, 1)}}
-        )
+    # Actualizar agregados del producto sin releer sus reviews
+    await _apply_rating(product_id, rating, 1)
 
     return serialize_review(review)
 
@@ -53,12 +92,102 @@ async def get_product_reviews_service(product_id: str):
     return reviews
 
 
+async def get_product_reviews_page_service(product_id: str, limit: int, cursor=None):
+    return await paginate(
+        review_collection,
+        {"product_id": product_id},
+        limit=limit,
+        cursor=cursor,
+        serializer=serialize_review,
+    )
+
+
+async def get_review_summary_service(product_id: str):
+    """
+    {"version", "summary"} desde los agregados del producto (caché de proceso).
+    version cambia con cada review creada o borrada: sirve de ETag.
+    """
+    cached = summary_cache.get(product_id)
+    if cached is not None:
+        return cached
+
+    try:
+        product = await product_collection.find_one(
+            {"_id": ObjectId(product_id)},
+            {"rating_sum": 1, "rating_count": 1, "rating_histogram": 1, "reviews_version": 1}
+        )
+    except Exception:
+        product = None
+    product = product or {}
+
+    histogram = {str(i): 0 for i in range(1, 6)}
+    histogram.update(product.get("rating_histogram", {}))
+    count = product.get("rating_count", 0)
+
+    entry = {
+        "version": product.get("reviews_version", 0),
+        "summary": {
+            "average":   _average(product.get("rating_sum", 0), count),
+            "count":     count,
+            "histogram": histogram,
+        },
+    }
+    summary_cache.set(product_id, entry)
+    return entry
+
+
 async def delete_review_service(review_id: str, user_id: str):
     try:
-        result = await review_collection.delete_one({
+        review = await review_collection.find_one_and_delete({
             "_id": ObjectId(review_id),
             "user_id": user_id
         })
-        return result.deleted_count
     except:
-        return 0
\ No newline at end of file
+        return 0
+
+    if not review:
+        return 0
+
+    await _apply_rating(review["product_id"], review["rating"], -1)
+    return 1
+
+
+# ─────────────────────────────────────────────
+# RECONCILIAR AGREGADOS (one-shot)
+# ─────────────────────────────────────────────
+
+async def reconcile_review_aggregates(product_id: str = None):
+    """
+    Recalcula rating_sum, rating_count, rating_histogram y rating desde la
+    colección de reviews. Sirve para el backfill inicial y para corregir
+    desvíos; recorre las reviews una sola vez.
+    """
+    review_filter = {"product_id": product_id} if product_id else {}
+    totals = {}
+    async for r in review_collection.find(review_filter, {"product_id": 1, "rating": 1}):
+        agg = totals.setdefault(r["product_id"], {
+            "sum": 0, "count": 0, "histogram": {str(i): 0 for i in range(1, 6)}
+        })
+        agg["sum"] += r["rating"]
+        agg["count"] += 1
+        agg["histogram"][str(_star(r["rating"]))] += 1
+
+    product_filter = {"_id": ObjectId(product_id)} if product_id else {}
+    updated = 0
+    async for product in product_collection.find(product_filter, {"_id": 1}):
+        agg = totals.get(str(product["_id"]), {
+            "sum": 0, "count": 0, "histogram": {str(i): 0 for i in range(1, 6)}
+        })
+        await product_collection.update_one(
+            {"_id": product["_id"]},
+            {"$set": {
+                "rating_sum": agg["sum"],
+                "rating_count": agg["count"],
+                "rating_histogram": agg["histogram"],
+                "rating": _average(agg["sum"], agg["count"]),
+            }, "$inc": {"reviews_version": 1}}
+        )
+        summary_cache.invalidate(str(product["_id"]))
+        updated += 1
+
+    return {"products": updated, "reviews": sum(a["count"] for a in totals.values())}
\ No newline at end of file
@@ -0,0 +1,132 @@
+import asyncio
+import bisect
+import os
+import re
+import time
+from collections import defaultdict
+
+from app.database import product_collection
+from app.utils.text import fold
+
+
+SEARCH_INDEX_TTL = int(os.getenv("SEARCH_INDEX_TTL", "300"))   # segundos antes de reconstruir
+FIELD_WEIGHTS    = {"name": 3.0, "description": 1.0}
+MAX_EXPANSIONS   = 64      # tokens máximos por prefijo ("ca" → camara, cable, carga…)
+EXACT_BONUS      = 2.0     # un token exacto pesa más que uno que solo coincide por prefijo
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str):
+    return _TOKEN_RE.findall(fold(text))
+
+
+class ProductSearchIndex:
+    """
+    Índice invertido en memoria sobre name/description.
+
+    postings: token → {product_id: peso}
+    vocab:    tokens ordenados, para resolver prefijos con bisect (typeahead)
+
+    Se mantiene al día desde los servicios de productos y se reconstruye
+    cada SEARCH_INDEX_TTL segundos para recoger cambios hechos por otros workers.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._doc_tokens = {}
+        self._vocab = []
+        self._built_at = None
+        self._lock = asyncio.Lock()
+
+    # ── mantenimiento ──
+
+    def _index_doc(self, product_id: str, doc: dict):
+        weights = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(doc.get(field, "")):
+                weights[token] += weight
+
+        for token, weight in weights.items():
+            if token not in self._postings:
+                bisect.insort(self._vocab, token)
+            self._postings[token][product_id] = weight
+        self._doc_tokens[product_id] = set(weights)
+
+    def add(self, product: dict):
+        product_id = str(product.get("id") or product.get("_id"))
+        self.remove(product_id)
+        self._index_doc(product_id, product)
+
+    def remove(self, product_id: str):
+        for token in self._doc_tokens.pop(str(product_id), ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(str(product_id), None)
+            if not postings:
+                del self._postings[token]
+                i = bisect.bisect_left(self._vocab, token)
+                if i < len(self._vocab) and self._vocab[i] == token:
+                    del self._vocab[i]
+
+    async def rebuild(self):
+        fresh = ProductSearchIndex()
+        async for product in product_collection.find({}, {"name": 1, "description": 1}):
+            fresh._index_doc(str(product["_id"]), product)
+
+        self._postings   = fresh._postings
+        self._doc_tokens = fresh._doc_tokens
+        self._vocab      = fresh._vocab
+        self._built_at   = time.monotonic()
+
+    async def ensure_fresh(self):
+        if self._built_at is not None and time.monotonic() - self._built_at < SEARCH_INDEX_TTL:
+            return
+        async with self._lock:
+            if self._built_at is None or time.monotonic() - self._built_at >= SEARCH_INDEX_TTL:
+                await self.rebuild()
+
+    # ── consulta ──
+
+    def _expand(self, term: str):
+        start = bisect.bisect_left(self._vocab, term)
+        tokens = []
+        for token in self._vocab[start:start + MAX_EXPANSIONS]:
+            if not token.startswith(term):
+                break
+            tokens.append(token)
+        return tokens
+
+    def search(self, text: str):
+        """
+        Devuelve los ids ordenados por relevancia. Todos los términos deben
+        coincidir (exacto o por prefijo); el puntaje suma los pesos por campo.
+        """
+        scores = None
+        for term in tokenize(text):
+            term_scores = {}
+            for token in self._expand(term):
+                bonus = EXACT_BONUS if token == term else 1.0
+                for product_id, weight in self._postings[token].items():
+                    term_scores[product_id] = max(term_scores.get(product_id, 0), weight * bonus)
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {pid: scores[pid] + s for pid, s in term_scores.items() if pid in scores}
+
+            if not scores:
+                return []
+
+        if not scores:
+            return []
+        return sorted(scores, key=lambda pid: (-scores[pid], pid))
+
+
+product_search = ProductSearchIndex()
+
+
+async def search_product_ids(text: str):
+    await product_search.ensure_fresh()
+    return product_search.search(text)
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import time
+
+from app.database import settings_collection
+from app.utils.cache import TTLCache
+
+
+SETTINGS_CACHE_TTL    = int(os.getenv("SETTINGS_CACHE_TTL", "300"))
+SETTINGS_VERSION_POLL = float(os.getenv("SETTINGS_VERSION_POLL", "5"))
+
+# Cada documento de settings lleva un contador "version" que se incrementa en
+# cada escritura. Un worker que tiene la clave en caché solo consulta ese
+# contador (proyección mínima sobre el índice key_unique) cada
+# SETTINGS_VERSION_POLL segundos: así ve los cambios hechos en otros workers
+# sin releer el documento ni depender de change streams (requieren replica set).
+settings_cache = TTLCache(maxsize=64, ttl=SETTINGS_CACHE_TTL)
+
+
+def render_json(value) -> bytes:
+    """Mismo formato que JSONResponse, para que el ETag corresponda byte a byte."""
+    return json.dumps(
+        value, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _entry(doc, build) -> dict:
+    body = render_json(build(doc))
+    return {
+        "version": doc.get("version", 0) if doc else None,
+        "body":    body,
+        "etag":    f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        "checked": time.monotonic(),
+    }
+
+
+async def get_setting(key: str, build) -> dict:
+    """
+    Devuelve {"body", "etag"} de la clave. build(doc) arma la respuesta a partir
+    del documento (o de None si todavía no existe).
+    """
+    entry = settings_cache.get(key)
+    if entry and time.monotonic() - entry["checked"] < SETTINGS_VERSION_POLL:
+        return entry
+
+    if entry:
+        doc = await settings_collection.find_one({"key": key}, {"version": 1})
+        version = doc.get("version", 0) if doc else None
+        if version == entry["version"]:
+            entry["checked"] = time.monotonic()
+            return entry
+
+    doc = await settings_collection.find_one({"key": key})
+    entry = _entry(doc, build)
+    settings_cache.set(key, entry)
+    return entry
+
+
+async def save_setting(key: str, fields: dict):
+    update = {"$inc": {"version": 1}}
+    if fields:
+        update["$set"] = fields
+    await settings_collection.update_one({"key": key}, update, upsert=True)
+    settings_cache.invalidate(key)
@@ -0,0 +1,138 @@
+import os
+import uuid
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from app.database import product_collection
+from app.utils.cache import TTLCache
+
+
+# ─────────────────────────────────────────────
+# LECTURA EN LOTE
+# ─────────────────────────────────────────────
+
+async def fetch_products(product_ids, projection=None) -> dict:
+    """Un solo find con $in. Devuelve {product_id: producto}; los ids inválidos se ignoran."""
+    ids = []
+    for pid in product_ids:
+        try:
+            ids.append(ObjectId(pid))
+        except (InvalidId, TypeError):
+            continue
+    if not ids:
+        return {}
+
+    products = await product_collection.find({"_id": {"$in": ids}}, projection).to_list(len(ids))
+    return {str(p["_id"]): p for p in products}
+
+
+# ─────────────────────────────────────────────
+# SNAPSHOTS PARA EL CARRITO
+#
+# Precio, stock, nombre e imagen por producto, en caché por proceso. Se
+# invalidan aquí al reservar/devolver stock y desde products al editar o
+# borrar; el TTL acota lo desactualizado que puede estar otro worker.
+# ─────────────────────────────────────────────
+
+SNAPSHOT_PROJECTION = {"name": 1, "price": 1, "original_price": 1, "stock": 1, "images": {"$slice": 1}}
+PRODUCT_SNAPSHOT_TTL = float(os.getenv("PRODUCT_SNAPSHOT_TTL", "10"))
+
+product_snapshots = TTLCache(maxsize=4096, ttl=PRODUCT_SNAPSHOT_TTL)
+_MISSING = {}   # marca de "producto borrado" dentro de la caché
+
+
+def invalidate_product_snapshots(product_ids):
+    for pid in product_ids:
+        product_snapshots.invalidate(str(pid))
+
+
+async def fetch_product_snapshots(product_ids) -> dict:
+    """
+    {product_id: snapshot} para todos los ids; los que no están en caché se
+    leen con un solo $in. Los productos que ya no existen no aparecen.
+    """
+    result, missing = {}, []
+    for pid in product_ids:
+        cached = product_snapshots.get(pid)
+        if cached is None:
+            missing.append(pid)
+        elif cached is not _MISSING:
+            result[pid] = cached
+
+    if missing:
+        found = await fetch_products(missing, SNAPSHOT_PROJECTION)
+        for pid in missing:
+            product_snapshots.set(pid, found.get(pid, _MISSING))
+            if pid in found:
+                result[pid] = found[pid]
+    return result
+
+
+# ─────────────────────────────────────────────
+# RESERVA DE STOCK
+#
+# Un bulk_write con decrementos condicionales {stock: {$gte: qty}}. Cada
+# producto descontado queda marcado con el id de la reserva en stock_holds,
+# así una reserva parcial se puede revertir exactamente aunque otra compra
+# concurrente haya tocado los mismos productos.
+# ─────────────────────────────────────────────
+
+async def reserve_stock(quantities: dict) -> str:
+    """
+    quantities: {product_id: cantidad}. Descuenta todo o nada; si algún
+    producto no alcanza revierte lo reservado y lanza 400.
+    """
+    # con qty <= 0 el guard $gte siempre pasa y el $inc sumaría stock
+    if any(qty < 1 for qty in quantities.values()):
+        raise HTTPException(status_code=400, detail="La cantidad debe ser mayor a 0")
+
+    reservation = uuid.uuid4().hex
+    invalidate_product_snapshots(quantities)
+    ops = [
+        UpdateOne(
+            {"_id": ObjectId(pid), "stock": {"$gte": qty}},
+            {"$inc": {"stock": -qty}, "$push": {"stock_holds": reservation}}
+        )
+        for pid, qty in quantities.items()
+    ]
+
+    result = await product_collection.bulk_write(ops, ordered=False)
+    if result.modified_count == len(ops):
+        return reservation
+
+    # alguna compra concurrente se llevó el stock: ver cuál falló y revertir el resto
+    ids = [ObjectId(pid) for pid in quantities]
+    short = await product_collection.find(
+        {"_id": {"$in": ids}, "stock_holds": {"$ne": reservation}},
+        {"name": 1, "stock": 1}
+    ).to_list(len(ids))
+    await release_stock(reservation, quantities)
+
+    product = short[0] if short else {"name": "producto", "stock": 0}
+    raise HTTPException(
+        status_code=400,
+        detail=f"Stock insuficiente para '{product['name']}'. Disponible: {product['stock']}"
+    )
+
+
+async def release_stock(reservation: str, quantities: dict):
+    """Devuelve el stock de los productos que esta reserva alcanzó a descontar."""
+    invalidate_product_snapshots(quantities)
+    ops = [
+        UpdateOne(
+            {"_id": ObjectId(pid), "stock_holds": reservation},
+            {"$inc": {"stock": qty}, "$pull": {"stock_holds": reservation}}
+        )
+        for pid, qty in quantities.items()
+    ]
+    await product_collection.bulk_write(ops, ordered=False)
+
+
+async def confirm_reservation(reservation: str, quantities: dict):
+    """La orden ya está guardada: se limpian las marcas de la reserva (por _id, sin recorrer products)."""
+    await product_collection.update_many(
+        {"_id": {"$in": [ObjectId(pid) for pid in quantities]}, "stock_holds": reservation},
+        {"$pull": {"stock_holds": reservation}}
+    )
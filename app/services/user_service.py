@@ -0,0 +1,108 @@
+import re
+
+from app.database import user_collection
+from app.utils.text import fold
+from app.utils.pagination import paginate
+
+
+# Solo los campos que se serializan: nunca se lee hashed_password
+USER_PROJECTION = {"name": 1, "email": 1, "role": 1, "created_at": 1}
+
+# Por encima de este número un conteo con filtros deja de ser exacto
+USERS_COUNT_CAP = 10000
+
+# Tope del listado sin paginar (el mismo que tenía la ruta original); para
+# recorrer todos los usuarios se usa limit/cursor
+USERS_LIST_CAP = 1000
+
+
+def name_key(name: str) -> str:
+    """Nombre normalizado (minúsculas, sin tildes) para búsquedas por prefijo."""
+    return fold(name).strip()
+
+
+def email_key(email: str) -> str:
+    """El email se guarda tal cual (la parte local conserva mayúsculas); la búsqueda usa esta copia."""
+    return (email or "").strip().lower()
+
+
+def serialize_user(u):
+    return {
+        "id":         str(u["_id"]),
+        "name":       u.get("name", ""),
+        "email":      u.get("email", ""),
+        "role":       u.get("role", "customer"),
+        "created_at": str(u.get("created_at", "")),
+    }
+
+
+def _prefix(value: str) -> dict:
+    # regex anclado y sin flags: Mongo lo resuelve como rango sobre el índice
+    return {"$regex": f"^{re.escape(value)}"}
+
+
+def _users_query(role=None, email=None, name=None):
+    """
+    Devuelve (query, campo de orden, dirección). Con un filtro por prefijo se
+    ordena por ese mismo campo para que el índice resuelva filtro, orden y cursor.
+    """
+    query = {}
+    sort_field, direction = "created_at", -1
+    if role:
+        query["role"] = role
+    if email:
+        query["email_key"] = _prefix(email_key(email))
+        sort_field, direction = "email_key", 1
+    elif name:
+        query["name_key"] = _prefix(name_key(name))
+        sort_field, direction = "name_key", 1
+    return query, sort_field, direction
+
+
+async def list_users_service(role=None, email=None, name=None):
+    query, sort_field, direction = _users_query(role, email, name)
+    users = await user_collection.find(query, USER_PROJECTION).sort(
+        [(sort_field, direction), ("_id", direction)]
+    ).limit(USERS_LIST_CAP).to_list(USERS_LIST_CAP)
+    return [serialize_user(u) for u in users]
+
+
+async def list_users_page_service(limit: int, cursor=None, role=None, email=None, name=None):
+    query, sort_field, direction = _users_query(role, email, name)
+    projection = {**USER_PROJECTION, sort_field: 1}
+    return await paginate(
+        user_collection,
+        query,
+        limit=limit,
+        cursor=cursor,
+        projection=projection,
+        serializer=serialize_user,
+        sort_field=sort_field,
+        direction=direction,
+    )
+
+
+async def count_users_service(role=None, email=None, name=None) -> dict:
+    """
+    Sin filtros usa estimated_document_count (metadatos de la colección, no
+    recorre nada). Con filtros cuenta sobre el índice hasta USERS_COUNT_CAP.
+    """
+    query, _, _ = _users_query(role, email, name)
+    if not query:
+        return {"total": await user_collection.estimated_document_count(), "exact": False}
+
+    total = await user_collection.count_documents(query, limit=USERS_COUNT_CAP)
+    return {"total": total, "exact": total < USERS_COUNT_CAP}
+
+
+async def backfill_user_keys():
+    """Agrega name_key y email_key a los usuarios creados antes de que existieran."""
+    updated = 0
+    missing = {"$or": [{"name_key": {"$exists": False}}, {"email_key": {"$exists": False}}]}
+    async for u in user_collection.find(missing, {"name": 1, "email": 1}):
+        await user_collection.update_one(
+            {"_id": u["_id"]},
+            {"$set": {"name_key": name_key(u.get("name", "")), "email_key": email_key(u.get("email", ""))}}
+        )
+        updated += 1
+    return {"updated": updated}
@@ -1,7 +1,12 @@
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+import asyncio
 import os
+import threading
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,9 +15,20 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60        # 1 hora
 REFRESH_TOKEN_EXPIRE_DAYS = 7           # 7 días ← NUEVO
+GUEST_TOKEN_EXPIRE_DAYS = 30            # carrito de invitado
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt tarda ~100-300 ms por llamada: se ejecuta en un pool de hilos acotado
+# (bcrypt libera el GIL) para no congelar el event loop. Si hay más de
+# WORKERS + QUEUE operaciones pendientes se rechaza con 429 en vez de encolar.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_QUEUE   = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_stats = {"in_flight": 0, "completed": 0, "failed": 0, "rejected": 0}
+_hash_stats_lock = threading.Lock()     # el callback de fin corre en el hilo del pool
+
 
 def hash_password(password: str):
     return pwd_context.hash(password)
@@ -22,6 +38,52 @@ def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+async def _run_in_hash_pool(fn, *args):
+    if _hash_stats["in_flight"] >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE:
+        _hash_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=429,
+            detail="Demasiadas solicitudes, intenta de nuevo en unos segundos",
+            headers={"Retry-After": "1"},
+        )
+
+    with _hash_stats_lock:
+        _hash_stats["in_flight"] += 1
+    job = _hash_executor.submit(fn, *args)
+    # in_flight baja cuando el trabajo termina en el pool, no cuando la tarea
+    # que lo espera se cancela: bcrypt sigue ocupando el hilo hasta acabar
+    job.add_done_callback(_hash_job_done)
+    return await asyncio.wrap_future(job)
+
+
+def _hash_job_done(job):
+    ok = not job.cancelled() and job.exception() is None
+    with _hash_stats_lock:
+        _hash_stats["in_flight"] -= 1
+        _hash_stats["completed" if ok else "failed"] += 1
+
+
+async def hash_password_async(password: str):
+    return await _run_in_hash_pool(hash_password, password)
+
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+
+def password_hash_stats() -> dict:
+    in_flight = _hash_stats["in_flight"]
+    return {
+        "workers":   PASSWORD_HASH_WORKERS,
+        "max_queue": PASSWORD_HASH_QUEUE,
+        "running":   min(in_flight, PASSWORD_HASH_WORKERS),
+        "queued":    max(0, in_flight - PASSWORD_HASH_WORKERS),
+        "completed": _hash_stats["completed"],
+        "failed":    _hash_stats["failed"],
+        "rejected":  _hash_stats["rejected"],
+    }
+
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -37,6 +99,20 @@ def create_refresh_token(data: dict):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def create_guest_token() -> str:
+    """Token firmado que identifica un carrito de invitado (no sirve como access token)."""
+    expire = datetime.utcnow() + timedelta(days=GUEST_TOKEN_EXPIRE_DAYS)
+    to_encode = {"guest_id": uuid.uuid4().hex, "exp": expire, "type": "guest"}
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def guest_id_from_token(token: str):
+    payload = decode_token(token) if token else None
+    if not payload or payload.get("type") != "guest":
+        return None
+    return payload.get("guest_id")
+
+
 def decode_token(token: str):
     try:
         return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
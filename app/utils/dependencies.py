@@ -1,9 +1,11 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Header, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 import os
 from dotenv import load_dotenv
 from app.database import user_collection
+from app.utils.auth_utils import guest_id_from_token
+from app.utils.cache import TTLCache
 from bson import ObjectId
 
 load_dotenv()
@@ -11,6 +13,16 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 
+# Principal del usuario autenticado (sin hashed_password), por user_id.
+# Se invalida al cambiar el rol o eliminar el usuario; el TTL cubre los
+# cambios hechos desde otros workers.
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))
+user_cache = TTLCache(maxsize=int(os.getenv("USER_CACHE_SIZE", "2048")), ttl=USER_CACHE_TTL)
+
+
+def invalidate_user(user_id):
+    user_cache.invalidate(str(user_id))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
@@ -32,15 +44,23 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
-    try:
-        user = await user_collection.find_one({"_id": ObjectId(user_id)})
-    except:
-        raise credentials_exception
-
+    user = user_cache.get(user_id)
     if user is None:
-        raise credentials_exception
+        try:
+            user = await user_collection.find_one(
+                {"_id": ObjectId(user_id)},
+                {"hashed_password": 0}
+            )
+        except:
+            raise credentials_exception
+
+        if user is None:
+            raise credentials_exception
+
+        user_cache.set(user_id, user)
 
-    return user
+    # copia: los handlers no deben poder modificar la entrada cacheada
+    return dict(user)
 
 
 async def get_current_admin(current_user: dict = Depends(get_current_user)):
@@ -54,4 +74,12 @@ async def get_current_moderator(current_user: dict = Depends(get_current_user)):
     """Admin y moderator pueden pasar."""
     if current_user["role"] not in ["admin", "moderator"]:
         raise HTTPException(status_code=403, detail="Se requiere rol de moderador o admin")
-    return current_user
\ No newline at end of file
+    return current_user
+
+
+async def get_guest_id(x_guest_token: str = Header(None, alias="X-Guest-Token")):
+    """Id del carrito de invitado a partir del header X-Guest-Token firmado."""
+    guest_id = guest_id_from_token(x_guest_token)
+    if not guest_id:
+        raise HTTPException(status_code=401, detail="Token de invitado inválido o expirado")
+    return guest_id
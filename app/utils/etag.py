@@ -0,0 +1,13 @@
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    """
+    Comparación débil de If-None-Match (RFC 9110): acepta una lista de tags
+    separados por coma, "*" y tags con o sin el prefijo W/.
+    """
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or _opaque(etag) in {_opaque(t) for t in tags}
@@ -0,0 +1,62 @@
+import struct
+
+
+def image_dimensions(path):
+    """
+    (ancho, alto) leyendo solo la cabecera del archivo. Soporta PNG, GIF,
+    JPEG y WEBP; devuelve (None, None) si el formato no se reconoce.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(32)
+
+            if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+                return struct.unpack(">II", head[16:24])
+
+            if head[:6] in (b"GIF87a", b"GIF89a"):
+                return struct.unpack("<HH", head[6:10])
+
+            if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                return _webp_dimensions(f, head)
+
+            if head[:2] == b"\xff\xd8":
+                return _jpeg_dimensions(f)
+    except (OSError, struct.error):
+        pass
+    return None, None
+
+
+def _webp_dimensions(f, head):
+    chunk = head[12:16]
+    f.seek(20)
+    data = f.read(10)
+    if chunk == b"VP8 ":
+        w, h = struct.unpack("<HH", data[6:10])
+        return w & 0x3FFF, h & 0x3FFF
+    if chunk == b"VP8L":
+        b = data[1:5]
+        w = 1 + (((b[1] & 0x3F) << 8) | b[0])
+        h = 1 + (((b[3] & 0x0F) << 10) | (b[2] << 2) | ((b[1] & 0xC0) >> 6))
+        return w, h
+    if chunk == b"VP8X":
+        w = 1 + int.from_bytes(data[4:7], "little")
+        h = 1 + int.from_bytes(data[7:10], "little")
+        return w, h
+    return None, None
+
+
+def _jpeg_dimensions(f):
+    # recorre los segmentos hasta el primer SOFn, saltando los demás sin leerlos
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None, None
+        code = marker[1]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        length = struct.unpack(">H", f.read(2))[0]
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            h, w = struct.unpack(">xHH", f.read(5))
+            return w, h
+        f.seek(length - 2, 1)
@@ -0,0 +1,112 @@
+import base64
+import json
+from datetime import datetime
+from bson import ObjectId
+from fastapi import HTTPException
+
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT     = 100
+
+
+# ─────────────────────────────────────────────
+# CURSORES OPACOS
+# ─────────────────────────────────────────────
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "$date" in value:
+            return datetime.fromisoformat(value["$date"])
+        if "$oid" in value:
+            return ObjectId(value["$oid"])
+    return value
+
+
+def encode_cursor(doc: dict, sort_field: str = "created_at") -> str:
+    """Cursor opaco con la clave de orden y el _id del último documento."""
+    payload = {"v": _encode_value(doc.get(sort_field)), "id": str(doc["_id"])}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded  = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return _decode_value(payload["v"]), ObjectId(payload["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def apply_cursor(query: dict, cursor, sort_field: str = "created_at", direction: int = -1) -> dict:
+    """Agrega al query la condición 'después del cursor' sobre (sort_field, _id)."""
+    if not cursor:
+        return query
+
+    value, last_id = decode_cursor(cursor)
+    op = "$lt" if direction < 0 else "$gt"
+    after = {"$or": [
+        {sort_field: {op: value}},
+        {sort_field: value, "_id": {op: last_id}},
+    ]}
+
+    if not query:
+        return after
+    return {"$and": [query, after]}
+
+
+# ─────────────────────────────────────────────
+# PROYECCIÓN
+# ─────────────────────────────────────────────
+
+def parse_fields(fields, required=("created_at",)):
+    """'name,price' → {'name': 1, 'price': 1, 'created_at': 1}. None = documento completo."""
+    if not fields:
+        return None
+    projection = {f.strip(): 1 for f in fields.split(",") if f.strip() and not f.strip().startswith("$")}
+    if not projection:
+        return None
+    for f in required:
+        projection[f] = 1
+    return projection
+
+
+# ─────────────────────────────────────────────
+# PAGINAR
+# ─────────────────────────────────────────────
+
+async def paginate(
+    collection,
+    query: dict,
+    limit: int,
+    cursor=None,
+    projection=None,
+    serializer=None,
+    sort_field: str = "created_at",
+    direction: int = -1,
+):
+    """
+    Keyset pagination sobre (sort_field, _id). Pide limit + 1 documentos
+    para saber si hay otra página sin hacer un count.
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    find  = collection.find(apply_cursor(query, cursor, sort_field, direction), projection)
+    docs  = await find.sort([(sort_field, direction), ("_id", direction)]).to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort_field)
+
+    return {
+        "items":       [serializer(d) if serializer else d for d in docs],
+        "next_cursor": next_cursor,
+    }
@@ -0,0 +1,7 @@
+import unicodedata
+
+
+def fold(text: str) -> str:
+    """Minúsculas y sin tildes: 'Cámara' → 'camara'."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
@@ -12,10 +12,35 @@ def get_mock_db():
     database.product_collection = db["products"]
     database.order_collection = db["orders"]
     database.cart_collection = db["carts"]
+    database.review_collection = db["reviews"]
+    database.email_outbox_collection = db["email_outbox"]
+    database.library_collection = db["library_images"]
+    database.blob_collection = db["blobs"]
+    database.settings_collection = db["settings"]
+    database.sales_rollup_collection = db["sales_rollups"]
+    database.sales_product_collection = db["sales_products"]
+    database.guest_cart_collection = db["guest_carts"]
+    database.idempotency_collection = db["idempotency_keys"]
 
     return db
 
 
+@pytest.fixture
+def bulk_write(monkeypatch):
+    """
+    mongomock no acepta el argumento sort que pymongo 4.x pasa al agregar un
+    UpdateOne al bulk; se descarta para poder probar reserve_stock/release_stock.
+    """
+    from mongomock.collection import BulkOperationBuilder
+
+    add_update = BulkOperationBuilder.add_update
+
+    def patched(self, selector, doc, multi=False, upsert=False, sort=None, **kwargs):
+        return add_update(self, selector, doc, multi, upsert, **kwargs)
+
+    monkeypatch.setattr(BulkOperationBuilder, "add_update", patched)
+
+
 @pytest.fixture
 def mock_db():
     return get_mock_db()
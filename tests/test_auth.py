@@ -25,4 +25,60 @@ async def test_login_success(client):
     })
     assert response.status_code == 200
     assert "access_token" in response.json()
-    assert "refresh_token" in response.json()
\ No newline at end of file
+    assert "refresh_token" in response.json()
+
+@pytest.mark.asyncio
+async def test_role_change_invalidates_cached_user(client, auth_headers, admin_headers):
+    me = await client.get("/auth/me", headers=auth_headers)
+    assert me.status_code == 200
+    user_id = me.json()["id"]
+
+    response = await client.put("/auth/users/role", json={
+        "user_id": user_id,
+        "role": "moderator"
+    }, headers=admin_headers)
+    assert response.status_code == 200
+
+    me = await client.get("/auth/me", headers=auth_headers)
+    assert me.json()["role"] == "moderator"
+
+    await client.put("/auth/users/role", json={
+        "user_id": user_id,
+        "role": "customer"
+    }, headers=admin_headers)
+
+
+@pytest.mark.asyncio
+async def test_hash_pool_sheds_load_with_429(client, admin_headers, monkeypatch):
+    import asyncio
+    import threading
+    from app.utils import auth_utils
+
+    before = (await client.get("/auth/hash-stats", headers=admin_headers)).json()
+    monkeypatch.setattr(auth_utils, "PASSWORD_HASH_WORKERS", 1)
+    monkeypatch.setattr(auth_utils, "PASSWORD_HASH_QUEUE", 0)
+
+    release = threading.Event()
+    blocked = asyncio.create_task(auth_utils._run_in_hash_pool(release.wait, 5))
+    await asyncio.sleep(0.05)
+
+    response = await client.post("/auth/login", data={"username": "test@admin.com", "password": "test1234"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+    # cancelar a quien espera no libera el cupo: el trabajo sigue en el pool
+    blocked.cancel()
+    await asyncio.sleep(0.05)
+    assert auth_utils.password_hash_stats()["running"] == 1
+
+    release.set()
+    for _ in range(50):
+        if auth_utils.password_hash_stats()["running"] == 0:
+            break
+        await asyncio.sleep(0.02)
+
+    monkeypatch.undo()
+    stats = (await client.get("/auth/hash-stats", headers=admin_headers)).json()
+    assert stats["running"] == 0 and stats["queued"] == 0
+    assert stats["rejected"] == before["rejected"] + 1
+    assert stats["completed"] == before["completed"] + 1
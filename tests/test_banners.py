@@ -0,0 +1,38 @@
+import pytest
+
+
+@pytest.fixture
+def banners_dir(tmp_path, monkeypatch):
+    import app.routes.banner_routes as banner_routes
+    import app.services.blob_store as blob_store
+    monkeypatch.setattr(blob_store, "BLOBS_DIR", tmp_path / ".blobs")
+    monkeypatch.setattr(banner_routes, "BANNERS_DIR", tmp_path)
+    monkeypatch.setattr(banner_routes, "META_FILE", tmp_path / "_meta.json")
+    banner_routes.invalidate_catalog()
+    return tmp_path
+
+
+@pytest.mark.asyncio
+async def test_banners_etag_and_invalidation(client, admin_headers, banners_dir):
+    upload = await client.post("/banners/upload", files={
+        "file": ("promo.png", b"\x89PNG banner", "image/png")
+    }, data={"link": "/ofertas", "alt": "Promo"}, headers=admin_headers)
+    assert upload.status_code == 200
+
+    response = await client.get("/banners/")
+    assert response.status_code == 200
+    assert response.json()[0]["link"] == "/ofertas"
+    assert "max-age" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+
+    cached = await client.get("/banners/", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    weak = await client.get("/banners/", headers={"If-None-Match": f'"otro", W/{etag}'})
+    assert weak.status_code == 304
+
+    await client.put("/banners/promo.png", json={"link": "/nuevo", "alt": "Promo"},
+                     headers=admin_headers)
+    fresh = await client.get("/banners/", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.json()[0]["link"] == "/nuevo"
+    assert not list(banners_dir.glob("*.tmp"))
@@ -45,4 +45,208 @@ async def test_add_to_cart_insufficient_stock(client, auth_headers, admin_header
         "quantity": 99
     }, headers=auth_headers)
     assert response.status_code == 400
-    assert "Stock insuficiente" in response.json()["detail"]
\ No newline at end of file
+    assert "Stock insuficiente" in response.json()["detail"]
+
+@pytest.mark.asyncio
+async def test_cart_mutations_are_atomic(client, auth_headers, admin_headers):
+    import asyncio
+    from app.services.cart_service import add_to_cart_service
+
+    product = await client.post("/products/", json={
+        "name": "Producto Concurrente",
+        "description": "Test",
+        "price": 5.0,
+        "category": "test",
+        "stock": 3
+    }, headers=admin_headers)
+    product_id = product.json()["id"]
+    me = (await client.get("/auth/me", headers=auth_headers)).json()
+    # carrito con un solo ítem: mongomock resuelve mal "items.$" tras un $elemMatch
+    # cuando el ítem no es el primero del arreglo (Mongo real no tiene ese problema)
+    await client.delete("/cart/clear", headers=auth_headers)
+
+    # cinco pestañas suman 1 a la vez: solo 3 caben en el stock
+    results = await asyncio.gather(*[add_to_cart_service(me["id"], product_id, 1) for _ in range(5)])
+    assert sum("error" not in r for r in results) == 3
+    cart = (await client.get("/cart/", headers=auth_headers)).json()
+    line = [i for i in cart["items"] if i["product_id"] == product_id]
+    assert len(line) == 1 and line[0]["quantity"] == 3
+
+    updated = await client.put("/cart/update", json={"product_id": product_id, "quantity": 1},
+                               headers=auth_headers)
+    assert [i["quantity"] for i in updated.json()["items"] if i["product_id"] == product_id] == [1]
+
+    removed = await client.delete(f"/cart/remove/{product_id}", headers=auth_headers)
+    assert product_id not in [i["product_id"] for i in removed.json()["items"]]
+
+    missing = await client.put("/cart/update", json={"product_id": product_id, "quantity": 1},
+                               headers=auth_headers)
+    assert missing.json()["detail"] == "El producto no está en el carrito"
+
+
+@pytest.mark.asyncio
+async def test_cart_refresh_flags_price_drift_and_stock(client, auth_headers, admin_headers):
+    await client.delete("/cart/clear", headers=auth_headers)
+    ids = []
+    for name in ["Producto Precio", "Producto Agotado"]:
+        created = await client.post("/products/", json={
+            "name": name, "description": "Test", "price": 10.0, "category": "test", "stock": 5
+        }, headers=admin_headers)
+        ids.append(created.json()["id"])
+        await client.post("/cart/add", json={"product_id": ids[-1], "quantity": 2}, headers=auth_headers)
+
+    await client.patch(f"/products/{ids[0]}", json={"price": 12.5}, headers=admin_headers)
+    await client.patch(f"/products/{ids[1]}", json={"stock": 1}, headers=admin_headers)
+
+    refreshed = (await client.get("/cart/", params={"refresh": True}, headers=auth_headers)).json()
+    assert refreshed["alerts"] == {"price_changed": [ids[0]], "out_of_stock": [ids[1]], "unavailable": []}
+    assert refreshed["items"][0]["previous_price"] == 10.0
+    assert refreshed["total"] == 45.0
+
+    # los datos frescos quedaron guardados: el cambio de precio se avisa una sola vez
+    again = (await client.get("/cart/", params={"refresh": True}, headers=auth_headers)).json()
+    assert again["alerts"]["price_changed"] == []
+    assert again["alerts"]["out_of_stock"] == [ids[1]]
+    plain = (await client.get("/cart/", headers=auth_headers)).json()
+    assert plain["items"][0]["price"] == 12.5
+
+
+@pytest.mark.asyncio
+async def test_guest_cart_merges_on_login(client, auth_headers, admin_headers):
+    await client.delete("/cart/clear", headers=auth_headers)
+    ids = []
+    for name, stock in [("Producto Invitado", 5), ("Producto Escaso", 1)]:
+        created = await client.post("/products/", json={
+            "name": name, "description": "Test", "price": 8.0, "category": "test", "stock": stock
+        }, headers=admin_headers)
+        ids.append(created.json()["id"])
+
+    assert (await client.get("/cart/guest")).status_code == 401
+    guest = {"X-Guest-Token": (await client.post("/cart/guest/token")).json()["guest_token"]}
+    await client.post("/cart/guest/add", json={"product_id": ids[0], "quantity": 2}, headers=guest)
+    await client.post("/cart/guest/add", json={"product_id": ids[1], "quantity": 1}, headers=guest)
+    assert (await client.get("/cart/guest", headers=guest)).json()["total_items"] == 3
+
+    # el usuario ya tenía la última unidad del producto escaso
+    await client.post("/cart/add", json={"product_id": ids[1], "quantity": 1}, headers=auth_headers)
+
+    login = await client.post("/auth/login", data={
+        "username": "test@test.com", "password": "test1234"
+    }, headers=guest)
+    assert login.json()["cart_merge"]["merged"] == [ids[0]]
+    assert login.json()["cart_merge"]["skipped"][0]["product_id"] == ids[1]
+
+    cart = (await client.get("/cart/", headers=auth_headers)).json()
+    assert {i["product_id"]: i["quantity"] for i in cart["items"]} == {ids[0]: 2, ids[1]: 1}
+
+    # el carrito de invitado se consumió: un segundo login no vuelve a fusionar
+    again = await client.post("/auth/login", data={
+        "username": "test@test.com", "password": "test1234"
+    }, headers=guest)
+    assert again.json()["cart_merge"] == {"merged": [], "skipped": []}
+
+    # un access token no sirve como token de invitado
+    token = {"X-Guest-Token": auth_headers["Authorization"].split()[1]}
+    assert (await client.get("/cart/guest", headers=token)).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_cart_batch_applies_ops_with_per_op_results(client, auth_headers, admin_headers):
+    await client.delete("/cart/clear", headers=auth_headers)
+    ids = []
+    for name, stock in [("Bundle A", 5), ("Bundle B", 5), ("Bundle C", 1)]:
+        created = await client.post("/products/", json={
+            "name": name, "description": "Test", "price": 4.0, "category": "test", "stock": stock
+        }, headers=admin_headers)
+        ids.append(created.json()["id"])
+    await client.post("/cart/add", json={"product_id": ids[1], "quantity": 1}, headers=auth_headers)
+
+    response = await client.post("/cart/batch", json={"ops": [
+        {"op": "add", "product_id": ids[0], "quantity": 2},
+        {"op": "add", "product_id": ids[0], "quantity": 1},
+        {"op": "add", "product_id": ids[2], "quantity": 3},
+        {"op": "update", "product_id": ids[1], "quantity": 4},
+        {"op": "add", "product_id": "000000000000000000000000", "quantity": 1},
+        {"op": "remove", "product_id": ids[1]},
+    ]}, headers=auth_headers)
+    body = response.json()
+    assert [r["ok"] for r in body["results"]] == [True, True, False, True, False, True]
+    assert body["results"][2]["error"].startswith("Stock insuficiente")
+    assert {i["product_id"]: i["quantity"] for i in body["cart"]["items"]} == {ids[0]: 3}
+
+    cart = (await client.get("/cart/", headers=auth_headers)).json()
+    assert {i["product_id"]: i["quantity"] for i in cart["items"]} == {ids[0]: 3}
+
+
+@pytest.mark.asyncio
+async def test_cart_batch_does_not_overwrite_concurrent_changes(client, auth_headers, admin_headers, monkeypatch):
+    from app.services import cart_service
+
+    await client.delete("/cart/clear", headers=auth_headers)
+    created = await client.post("/products/", json={
+        "name": "Producto Rev", "description": "Test", "price": 4.0, "category": "test", "stock": 9
+    }, headers=admin_headers)
+    product_id = created.json()["id"]
+    me = (await client.get("/auth/me", headers=auth_headers)).json()
+
+    # otra pestaña agrega justo antes de la primera escritura del lote
+    original_save = cart_service._save_items
+    calls = []
+
+    async def racing_save(user_id, cart, items, guest):
+        if not calls:
+            await cart_service.add_to_cart_service(user_id, product_id, 1)
+        calls.append(1)
+        return await original_save(user_id, cart, items, guest)
+
+    monkeypatch.setattr(cart_service, "_save_items", racing_save)
+    result = await cart_service.batch_cart_service(me["id"], [
+        {"op": "add", "product_id": product_id, "quantity": 2}
+    ])
+
+    assert len(calls) == 2                     # la primera escritura detectó el cambio y reintentó
+    assert result["cart"]["items"][0]["quantity"] == 3
+
+
+@pytest.mark.asyncio
+async def test_guest_cart_survives_failed_merge(client, auth_headers, admin_headers, monkeypatch):
+    from app.services import cart_service
+    from app.utils.auth_utils import guest_id_from_token
+
+    created = await client.post("/products/", json={
+        "name": "Producto Fusión", "description": "Test", "price": 6.0, "category": "test", "stock": 5
+    }, headers=admin_headers)
+    product_id = created.json()["id"]
+    guest = {"X-Guest-Token": (await client.post("/cart/guest/token")).json()["guest_token"]}
+    await client.post("/cart/guest/add", json={"product_id": product_id, "quantity": 2}, headers=guest)
+    me = (await client.get("/auth/me", headers=auth_headers)).json()
+    guest_id = guest_id_from_token(guest["X-Guest-Token"])
+
+    original_batch = cart_service.batch_cart_service
+
+    async def exhausted(user_id, ops, guest=False):
+        return {"error": "El carrito cambió mientras se actualizaba, intenta de nuevo"}
+
+    async def broken(user_id, ops, guest=False):
+        raise RuntimeError("Mongo no responde")
+
+    # reintentos agotados: se informa y el carrito de invitado sigue ahí
+    monkeypatch.setattr(cart_service, "batch_cart_service", exhausted)
+    result = await cart_service.merge_guest_cart_service(guest_id, me["id"])
+    assert result["merged"] == [] and result["skipped"][0]["product_id"] == product_id
+    assert (await client.get("/cart/guest", headers=guest)).json()["total_items"] == 2
+
+    # un error inesperado tampoco lo borra
+    monkeypatch.setattr(cart_service, "batch_cart_service", broken)
+    with pytest.raises(RuntimeError):
+        await cart_service.merge_guest_cart_service(guest_id, me["id"])
+    assert (await client.get("/cart/guest", headers=guest)).json()["total_items"] == 2
+
+    # el siguiente login lo fusiona y recién entonces se borra
+    monkeypatch.setattr(cart_service, "batch_cart_service", original_batch)
+    await client.delete("/cart/clear", headers=auth_headers)
+    login = await client.post("/auth/login", data={
+        "username": "test@test.com", "password": "test1234"
+    }, headers=guest)
+    assert login.json()["cart_merge"]["merged"] == [product_id]
+    assert (await client.get("/cart/guest", headers=guest)).json()["items"] == []
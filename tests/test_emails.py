@@ -0,0 +1,94 @@
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_email_outbox_dedup_and_dispatch(mock_db):
+    from app.services.email_outbox import (
+        enqueue_email,
+        dispatch_pending,
+        set_transport,
+        MemoryTransport,
+        email_outbox_collection,
+    )
+
+    transport = MemoryTransport()
+    set_transport(transport)
+
+    message = {"from": "a@test.com", "to": ["b@test.com"], "subject": "Hola", "html": "<p>x</p>"}
+    assert await enqueue_email("test:dedup", message, tag="test") is True
+    assert await enqueue_email("test:dedup", message, tag="test") is False
+
+    assert await dispatch_pending() >= 1
+    assert [m["subject"] for m in transport.sent].count("Hola") == 1
+
+    doc = await email_outbox_collection.find_one({"_id": "test:dedup"})
+    assert doc["status"] == "sent"
+
+
+@pytest.mark.asyncio
+async def test_email_outbox_retries_with_backoff(mock_db):
+    from app.services.email_outbox import (
+        enqueue_email,
+        dispatch_pending,
+        set_transport,
+        MemoryTransport,
+        email_outbox_collection,
+    )
+
+    class FailingTransport:
+        def send_batch(self, messages):
+            raise RuntimeError("proveedor caído")
+
+    await email_outbox_collection.delete_many({})
+    set_transport(FailingTransport())
+    await enqueue_email("test:retry", {"to": ["c@test.com"]}, tag="test")
+    await dispatch_pending()
+
+    doc = await email_outbox_collection.find_one({"_id": "test:retry"})
+    assert doc["status"] == "pending"
+    assert doc["attempts"] == 1
+    assert doc["next_attempt_at"] > doc["created_at"]
+    set_transport(MemoryTransport())
+
+
+@pytest.mark.asyncio
+async def test_repeated_status_change_sends_a_new_email(client, auth_headers, admin_headers):
+    from datetime import datetime
+    from app.services.email_outbox import email_outbox_collection
+    from app.services.order_services import order_collection
+
+    me = (await client.get("/auth/me", headers=auth_headers)).json()
+    created = await order_collection.insert_one({
+        "user_id": me["id"], "items": [], "total": 5.0, "status": "pending", "created_at": datetime.utcnow(),
+    })
+    order_id = str(created.inserted_id)
+
+    for status in ["shipped", "pending", "shipped", "shipped"]:
+        response = await client.put(f"/orders/{order_id}/status", json={"status": status}, headers=admin_headers)
+        assert response.status_code == 200
+
+    keys = [d["_id"] async for d in email_outbox_collection.find({"_id": {"$regex": f"^order_status:{order_id}:"}})]
+    # "pending" no tiene correo; el último PUT repite el estado y no cuenta como cambio
+    assert sorted(keys) == [
+        f"order_status:{order_id}:1:shipped",
+        f"order_status:{order_id}:3:shipped",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_failed_email_gets_expiry_field(mock_db, monkeypatch):
+    from app.services import email_outbox
+
+    class FailingTransport:
+        def send_batch(self, messages):
+            raise RuntimeError("proveedor caído")
+
+    await email_outbox.email_outbox_collection.delete_many({})
+    monkeypatch.setattr(email_outbox, "EMAIL_MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(email_outbox, "_transport", FailingTransport())
+    await email_outbox.enqueue_email("test:failed", {"to": ["d@test.com"]}, tag="test")
+    await email_outbox.dispatch_pending()
+
+    doc = await email_outbox.email_outbox_collection.find_one({"_id": "test:failed"})
+    assert doc["status"] == "failed"
+    assert doc["failed_at"] is not None
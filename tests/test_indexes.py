@@ -0,0 +1,73 @@
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+
+@pytest.mark.asyncio
+async def test_create_indexes_and_report():
+    from app.indexes import INDEXES, create_indexes, index_report
+
+    db = AsyncMongoMockClient()["indexes_test"]
+    # índice de una versión anterior, reemplazado por user_id_created_at_id
+    await db["orders"].create_index([("user_id", 1), ("created_at", -1)], name="user_id_created_at")
+
+    result = await create_indexes(db)
+    assert result["failed"] == []
+    assert result["dropped"] == ["orders.user_id_created_at"]
+    assert len(result["ensured"]) == sum(len(specs) for specs in INDEXES.values())
+
+    report = await index_report(db)
+    assert report["missing"] == [] and report["undeclared"] == []
+
+    await db["orders"].drop_index("status_created_at")
+    await db["orders"].create_index([("total", 1)], name="total_manual")
+    report = await index_report(db)
+    assert report["missing"] == ["orders.status_created_at"]
+    assert report["undeclared"] == ["orders.total_manual"]
+
+
+async def _without_precheck(collection, monkeypatch):
+    """Simula la carrera: el find_one previo no ve el documento que otro request acaba de insertar."""
+    async def nothing(*args, **kwargs):
+        return None
+    monkeypatch.setattr(collection, "find_one", nothing)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_register_returns_400(client, monkeypatch):
+    from app.services.auth_service import user_collection
+
+    await user_collection.create_index([("email", 1)], name="email_unique", unique=True)
+    try:
+        body = {"name": "Carrera", "email": "carrera@test.com", "password": "test1234"}
+        assert (await client.post("/auth/register", json=body)).status_code == 200
+
+        await _without_precheck(user_collection, monkeypatch)
+        response = await client.post("/auth/register", json=body)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Email ya registrado"
+    finally:
+        monkeypatch.undo()
+        await user_collection.drop_index("email_unique")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_review_returns_400(client, auth_headers, admin_headers, monkeypatch):
+    from app.services.review_service import review_collection
+
+    product = await client.post("/products/", json={
+        "name": "Producto Review Única", "description": "Test", "price": 5.0, "category": "test", "stock": 1
+    }, headers=admin_headers)
+    product_id = product.json()["id"]
+
+    await review_collection.create_index([("product_id", 1), ("user_id", 1)], name="product_user_unique", unique=True)
+    try:
+        body = {"rating": 5, "comment": "Primera"}
+        assert (await client.post(f"/reviews/{product_id}", json=body, headers=auth_headers)).status_code == 200
+
+        await _without_precheck(review_collection, monkeypatch)
+        response = await client.post(f"/reviews/{product_id}", json=body, headers=auth_headers)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Ya dejaste una review para este producto"
+    finally:
+        monkeypatch.undo()
+        await review_collection.drop_index("product_user_unique")
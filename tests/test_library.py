@@ -0,0 +1,103 @@
+import struct
+import pytest
+
+
+def _png(width, height):
+    return b"\x89PNG\r\n\x1a\n" + b"\x00\x00\x00\x0dIHDR" + struct.pack(">II", width, height) + b"\x08\x02\x00\x00\x00"
+
+
+@pytest.fixture
+def library_dir(tmp_path, monkeypatch):
+    import app.routes.image_library_routes as library_routes
+    import app.services.blob_store as blob_store
+    monkeypatch.setattr(blob_store, "BLOBS_DIR", tmp_path.parent / f"{tmp_path.name}_blobs")
+    monkeypatch.setattr(library_routes, "LIBRARY_DIR", tmp_path)
+    return tmp_path
+
+
+@pytest.mark.asyncio
+async def test_library_index_upload_filter_and_rebuild(client, admin_headers, library_dir):
+    from app.services.library_service import rebuild_library_index, library_collection
+
+    await library_collection.delete_many({})
+    for name in ["logo_a.png", "logo_b.png", "fondo.gif"]:
+        data = _png(640, 320) if name.endswith(".png") else b"GIF89a" + struct.pack("<HH", 10, 20)
+        response = await client.post("/library/upload", files={
+            "file": (name, data, "image/png" if name.endswith(".png") else "image/gif")
+        }, headers=admin_headers)
+        assert response.status_code == 200
+
+    page = (await client.get("/library/", params={"prefix": "logo", "limit": 1})).json()
+    assert len(page["items"]) == 1
+    assert page["items"][0]["width"] == 640
+    assert page["next_cursor"]
+
+    gifs = (await client.get("/library/", params={"type": "gif"})).json()
+    assert [g["filename"] for g in gifs] == ["fondo.gif"]
+    assert gifs[0]["height"] == 20
+
+    (library_dir / "fondo.gif").unlink()
+    (library_dir / "nuevo.png").write_bytes(_png(1, 1))
+    result = await rebuild_library_index(library_dir)
+    assert result == {"indexed": 3, "added": 1, "removed": 1}
+
+
+@pytest.mark.asyncio
+async def test_library_deduplicates_identical_uploads(client, admin_headers, library_dir):
+    from app.services.blob_store import blob_collection
+
+    await blob_collection.delete_many({})
+    content = b"GIF89a" + b"\x02\x00\x02\x00" + b"\x00" * 64
+
+    first = await client.post("/library/upload", files={
+        "file": ("original.gif", content, "image/gif")
+    }, headers=admin_headers)
+    second = await client.post("/library/upload", files={
+        "file": ("copia.gif", content, "image/gif")
+    }, headers=admin_headers)
+    assert first.json()["deduplicated"] is False
+    assert second.json()["deduplicated"] is True
+    assert first.json()["sha256"] == second.json()["sha256"]
+
+    # mismo contenido: ambos nombres apuntan al mismo archivo físico
+    a, b = library_dir / "original.gif", library_dir / "copia.gif"
+    assert a.stat().st_ino == b.stat().st_ino
+
+    stats = (await client.get("/library/storage-stats", headers=admin_headers)).json()["disk"]
+    assert stats["blobs"] == 1
+    assert stats["references"] == 2
+    assert stats["dedup_hits"] == 1
+    assert stats["saved_bytes"] == len(content)
+
+    # borrar una copia no afecta a la otra
+    await client.delete("/library/copia.gif", headers=admin_headers)
+    assert a.read_bytes() == content
+    stats = (await client.get("/library/storage-stats", headers=admin_headers)).json()["disk"]
+    assert stats["references"] == 1
+
+
+@pytest.mark.asyncio
+async def test_library_generates_webp_variants(client, admin_headers, library_dir):
+    import io
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (800, 200), "red").save(buffer, "PNG")
+
+    response = await client.post("/library/upload", files={
+        "file": ("hero.png", buffer.getvalue(), "image/png")
+    }, headers=admin_headers)
+    srcset = response.json()["srcset"]
+
+    # nunca se agranda: 1024 y 1600 colapsan al ancho original
+    assert [entry.split()[-1] for entry in srcset.split(", ")] == ["320w", "640w", "800w"]
+    derived = sorted((library_dir / "_derived").iterdir())
+    assert len(derived) == 3
+    with Image.open(derived[0]) as small:
+        assert small.format == "WEBP"
+
+    listed = (await client.get("/library/", params={"prefix": "hero"})).json()
+    assert listed[0]["srcset"] == srcset
+
+    await client.delete("/library/hero.png", headers=admin_headers)
+    assert list((library_dir / "_derived").iterdir()) == []
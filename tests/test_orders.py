@@ -0,0 +1,505 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+import pytest
+
+
+async def _seed_orders(user_id, count):
+    """Inserta órdenes directamente, sin pasar por el checkout ni reservar stock."""
+    from app.services.order_services import order_collection
+
+    orders = []
+    base = datetime.utcnow()
+    for quantity in range(1, count + 1):
+        order = {
+            "user_id": user_id,
+            "items": [{"product_id": "p1", "name": "Producto Órdenes", "price": 10.0,
+                       "quantity": quantity, "image": None}],
+            "total": 10.0 * quantity,
+            "status": "pending",
+            "created_at": base + timedelta(milliseconds=quantity),
+        }
+        result = await order_collection.insert_one(order)
+        orders.append({**order, "_id": str(result.inserted_id)})
+    return orders
+
+
+@pytest.mark.asyncio
+async def test_all_orders_cursor_pages_and_streaming_export(client, admin_headers):
+    since = (datetime.utcnow() - timedelta(seconds=1)).isoformat()
+    orders = await _seed_orders("user-export", 3)
+    await client.put(f"/orders/{orders[0]['_id']}/status", json={"status": "shipped"},
+                     headers=admin_headers)
+
+    first = await client.get("/orders/all", params={"from": since, "limit": 2}, headers=admin_headers)
+    second = await client.get("/orders/all", params={
+        "from": since, "limit": 2, "cursor": first.json()["next_cursor"]
+    }, headers=admin_headers)
+    ids = [o["_id"] for o in first.json()["items"] + second.json()["items"]]
+    assert ids == [o["_id"] for o in reversed(orders)]
+    assert second.json()["next_cursor"] is None
+
+    ndjson = await client.get("/orders/export", params={"from": since, "status": "shipped"},
+                              headers=admin_headers)
+    assert ndjson.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in ndjson.text.splitlines()]
+    assert [o["_id"] for o in lines] == [orders[0]["_id"]]
+
+    exported = await client.get("/orders/export", params={"from": since, "format": "csv"},
+                                headers=admin_headers)
+    assert "attachment" in exported.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(exported.text)))
+    assert [r["items_count"] for r in rows] == ["1", "1", "1"]
+    assert [r["units"] for r in rows] == ["3", "2", "1"]
+    assert rows[0]["items"] == "3 x Producto Órdenes"
+
+    invalid = await client.get("/orders/export", params={"status": "perdido"}, headers=admin_headers)
+    assert invalid.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_sales_rollups_follow_orders_and_status_changes(client, admin_headers):
+    from app.services.analytics_service import (
+        record_order, sales_rollup_collection, sales_product_collection
+    )
+
+    await sales_rollup_collection.delete_many({})
+    await sales_product_collection.delete_many({})
+    orders = await _seed_orders("user-analytics", 3)   # 1, 2 y 3 unidades a 10.0
+    for order in orders:
+        await record_order(order)
+
+    await client.put(f"/orders/{orders[2]['_id']}/status", json={"status": "cancelled"},
+                     headers=admin_headers)
+    await client.put(f"/orders/{orders[0]['_id']}/status", json={"status": "shipped"},
+                     headers=admin_headers)
+
+    totals = (await client.get("/analytics/status", headers=admin_headers)).json()
+    assert totals["orders"] == 3
+    assert totals["revenue"] == 30.0          # la cancelada no suma
+    assert totals["by_status"] == {"pending": 1, "shipped": 1, "cancelled": 1}
+
+    today = orders[0]["created_at"].date().isoformat()
+    daily = (await client.get("/analytics/daily", params={"from": today, "to": today},
+                              headers=admin_headers)).json()
+    assert daily[0]["units"] == 3
+    assert daily[0]["products"]["p1"] == {"units": 3, "revenue": 30.0}
+
+    hourly = (await client.get("/analytics/hourly", params={"day": today}, headers=admin_headers)).json()
+    assert len(hourly) == 24
+    assert sum(h["orders"] for h in hourly) == 3
+
+    top = (await client.get("/analytics/top-products", headers=admin_headers)).json()
+    assert top == [{"product_id": "p1", "name": "Producto Órdenes", "orders": 2, "revenue": 30.0, "units": 3}]
+
+
+@pytest.mark.asyncio
+async def test_my_orders_summary_pages_and_detail(client, auth_headers, admin_headers):
+    from app.services.order_services import order_collection
+
+    me = (await client.get("/auth/me", headers=auth_headers)).json()
+    await order_collection.delete_many({"user_id": me["id"]})
+    orders = await _seed_orders(me["id"], 3)
+
+    first = await client.get("/orders/my-orders", params={"limit": 2}, headers=auth_headers)
+    page = first.json()
+    assert [o["_id"] for o in page["items"]] == [orders[2]["_id"], orders[1]["_id"]]
+    assert "items" not in page["items"][0]
+    assert page["items"][0]["items_count"] == 1
+    assert page["items"][0]["total"] == 30.0
+
+    second = await client.get("/orders/my-orders", params={"limit": 2, "cursor": page["next_cursor"]},
+                              headers=auth_headers)
+    assert [o["_id"] for o in second.json()["items"]] == [orders[0]["_id"]]
+    assert second.json()["next_cursor"] is None
+
+    detail = await client.get(f"/orders/{orders[0]['_id']}", headers=auth_headers)
+    assert detail.json()["items"][0]["quantity"] == 1
+
+    # las órdenes de otro usuario no existen para este cliente, el admin sí las ve
+    other = await _seed_orders("otro-usuario", 1)
+    assert (await client.get(f"/orders/{other[0]['_id']}", headers=auth_headers)).status_code == 404
+    assert (await client.get(f"/orders/{other[0]['_id']}", headers=admin_headers)).status_code == 200
+    assert (await client.get("/orders/no-es-un-id", headers=auth_headers)).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_reorder_fills_cart_and_reports_unavailable(client, auth_headers, admin_headers, monkeypatch):
+    from app.services import cart_service
+    from app.services.order_services import order_collection
+
+    ids = []
+    for name, price, stock in [("Reorden A", 10.0, 5), ("Reorden B", 7.0, 1), ("Reorden C", 3.0, 0)]:
+        created = await client.post("/products/", json={
+            "name": name, "description": "Test", "price": price, "category": "test", "stock": stock
+        }, headers=admin_headers)
+        ids.append(created.json()["id"])
+
+    me = (await client.get("/auth/me", headers=auth_headers)).json()
+    past = await order_collection.insert_one({
+        "user_id": me["id"],
+        "items": [
+            {"product_id": ids[0], "name": "Reorden A", "price": 9.0, "quantity": 2, "image": None},
+            {"product_id": ids[1], "name": "Reorden B", "price": 7.0, "quantity": 3, "image": None},
+            {"product_id": ids[2], "name": "Reorden C", "price": 3.0, "quantity": 1, "image": None},
+        ],
+        "total": 42.0,
+        "status": "delivered",
+        "created_at": datetime.utcnow(),
+    })
+    await client.delete("/cart/clear", headers=auth_headers)
+
+    # los productos se leen una sola vez: el lote del carrito reutiliza esa lectura
+    async def no_second_read(*args, **kwargs):
+        raise AssertionError("batch_cart_service volvió a leer los productos")
+    monkeypatch.setattr(cart_service, "fetch_products", no_second_read)
+
+    response = await client.post(f"/orders/{past.inserted_id}/reorder", headers=auth_headers)
+    body = response.json()
+    assert body["mode"] == "cart"
+    assert {i["product_id"]: i["quantity"] for i in body["cart"]["items"]} == {ids[0]: 2, ids[1]: 1}
+    assert body["adjusted"] == [{"product_id": ids[1], "requested": 3, "available": 1}]
+    assert body["price_changed"] == [{"product_id": ids[0], "old_price": 9.0, "price": 10.0}]
+    assert [u["product_id"] for u in body["unavailable"]] == [ids[2]]
+
+    # órdenes ajenas no se pueden repetir
+    other = await _seed_orders("otro-usuario", 1)
+    assert (await client.post(f"/orders/{other[0]['_id']}/reorder", headers=auth_headers)).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_runs_once_and_replays(client):
+    import asyncio
+    from fastapi import HTTPException
+    from app.services.idempotency import run_idempotent, idempotency_collection
+
+    await idempotency_collection.delete_many({})
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"order": len(calls)}
+
+    # duplicados simultáneos esperan a la primera ejecución
+    first, second = await asyncio.gather(
+        run_idempotent("k1", "orders.create", "u1", {"a": 1}, handler),
+        run_idempotent("k1", "orders.create", "u1", {"a": 1}, handler),
+    )
+    assert first == ({"order": 1}, False)
+    assert second == ({"order": 1}, True)
+
+    # un reintento posterior se responde desde la colección
+    assert await run_idempotent("k1", "orders.create", "u1", {"a": 1}, handler) == ({"order": 1}, True)
+    assert len(calls) == 1
+
+    # la misma clave con otro cuerpo es un error del cliente
+    with pytest.raises(HTTPException) as exc:
+        await run_idempotent("k1", "orders.create", "u1", {"a": 2}, handler)
+    assert exc.value.status_code == 422
+
+    # si la primera ejecución falla la clave se libera
+    async def failing():
+        raise HTTPException(status_code=400, detail="El carrito está vacío")
+
+    with pytest.raises(HTTPException):
+        await run_idempotent("k2", "orders.create", "u1", {}, failing)
+    assert await run_idempotent("k2", "orders.create", "u1", {}, handler) == ({"order": 2}, False)
+
+
+async def _create_product(client, admin_headers, name, stock, price=10.0):
+    created = await client.post("/products/", json={
+        "name": name, "description": "Test", "price": price, "category": "test", "stock": stock
+    }, headers=admin_headers)
+    return created.json()["id"]
+
+
+async def _product(product_id):
+    from bson import ObjectId
+    from app.services.stock_service import product_collection
+    return await product_collection.find_one({"_id": ObjectId(product_id)})
+
+
+@pytest.mark.asyncio
+async def test_reserve_stock_is_all_or_nothing(client, admin_headers, bulk_write):
+    from fastapi import HTTPException
+    from app.services.stock_service import reserve_stock, release_stock
+
+    a = await _create_product(client, admin_headers, "Reserva A", 5)
+    b = await _create_product(client, admin_headers, "Reserva B", 1)
+
+    with pytest.raises(HTTPException) as exc:
+        await reserve_stock({a: 2, b: 3})
+    assert exc.value.status_code == 400
+    assert "Reserva B" in exc.value.detail
+    assert (await _product(a))["stock"] == 5
+    assert (await _product(a)).get("stock_holds") == []
+    assert (await _product(b))["stock"] == 1
+
+    reservation = await reserve_stock({a: 2, b: 1})
+    assert (await _product(a))["stock"] == 3
+    assert (await _product(b))["stock_holds"] == [reservation]
+
+    await release_stock(reservation, {a: 2, b: 1})
+    assert (await _product(a))["stock"] == 5
+    assert (await _product(b))["stock"] == 1
+    assert (await _product(b))["stock_holds"] == []
+
+
+@pytest.mark.asyncio
+async def test_create_order_reserves_stock_and_clears_holds(client, auth_headers, admin_headers, bulk_write):
+    a = await _create_product(client, admin_headers, "Orden A", 4, price=5.0)
+
+    response = await client.post("/orders/", json={"items": [{"product_id": a, "quantity": 3}]}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["total"] == 15.0
+    product = await _product(a)
+    assert product["stock"] == 1
+    assert product["stock_holds"] == []
+
+    response = await client.post("/orders/", json={"items": [{"product_id": a, "quantity": 2}]}, headers=auth_headers)
+    assert response.status_code == 400
+    assert (await _product(a))["stock"] == 1
+
+
+@pytest.mark.asyncio
+async def test_create_order_from_cart_empties_cart(client, auth_headers, admin_headers, bulk_write):
+    a = await _create_product(client, admin_headers, "Carrito Orden", 3)
+    await client.delete("/cart/clear", headers=auth_headers)
+    await client.post("/cart/add", json={"product_id": a, "quantity": 2}, headers=auth_headers)
+
+    response = await client.post("/orders/from-cart", headers=auth_headers)
+    assert response.status_code == 200
+    assert [(i["product_id"], i["quantity"]) for i in response.json()["items"]] == [(a, 2)]
+    assert (await _product(a))["stock"] == 1
+    assert (await client.get("/cart/", headers=auth_headers)).json()["items"] == []
+
+    assert (await client.post("/orders/from-cart", headers=auth_headers)).status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_failed_order_insert_returns_reserved_stock(client, auth_headers, admin_headers, bulk_write, monkeypatch):
+    from pymongo.errors import PyMongoError
+    from app.models.order_model import OrderCreate
+    from app.services import order_services
+
+    a = await _create_product(client, admin_headers, "Rollback A", 4)
+    b = await _create_product(client, admin_headers, "Rollback B", 2)
+
+    async def failing_insert(*args, **kwargs):
+        raise PyMongoError("insert falló")
+
+    monkeypatch.setattr(order_services.order_collection, "insert_one", failing_insert)
+    with pytest.raises(PyMongoError):
+        await order_services.create_order_service("rollback-user", OrderCreate(items=[
+            {"product_id": a, "quantity": 3}, {"product_id": b, "quantity": 2},
+        ]))
+
+    for pid, stock in [(a, 4), (b, 2)]:
+        product = await _product(pid)
+        assert product["stock"] == stock
+        assert product["stock_holds"] == []
+
+
+@pytest.mark.asyncio
+async def test_idempotency_lock_is_renewed_while_handler_runs(client, monkeypatch):
+    import asyncio
+    from app.services import idempotency
+
+    await idempotency.idempotency_collection.delete_many({})
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_LOCK_SECONDS", 0.3)
+    seen = []
+
+    async def slow_handler():
+        doc_id = "orders.create:u1:lento"
+        first = (await idempotency.idempotency_collection.find_one({"_id": doc_id}))["locked_until"]
+        await asyncio.sleep(0.5)
+        seen.append((await idempotency.idempotency_collection.find_one({"_id": doc_id}))["locked_until"] > first)
+        return {"ok": True}
+
+    assert await idempotency.run_idempotent("lento", "orders.create", "u1", {}, slow_handler) == ({"ok": True}, False)
+    assert seen == [True]
+
+
+@pytest.mark.asyncio
+async def test_from_cart_with_idempotency_key_creates_one_order(client, auth_headers, admin_headers, bulk_write):
+    from app.services.order_services import order_collection
+
+    product_id = await _create_product(client, admin_headers, "Idempotente", 5)
+    await client.delete("/cart/clear", headers=auth_headers)
+    await client.post("/cart/add", json={"product_id": product_id, "quantity": 2}, headers=auth_headers)
+    me = (await client.get("/auth/me", headers=auth_headers)).json()
+    before = await order_collection.count_documents({"user_id": me["id"]})
+
+    headers = {**auth_headers, "Idempotency-Key": "checkout-1"}
+    first = await client.post("/orders/from-cart", headers=headers)
+    retry = await client.post("/orders/from-cart", headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json()["_id"] == first.json()["_id"]
+    assert await order_collection.count_documents({"user_id": me["id"]}) == before + 1
+    assert (await _product(product_id))["stock"] == 3
+
+    # sin clave el carrito ya vacío falla como siempre
+    assert (await client.post("/orders/from-cart", headers=auth_headers)).status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_payment_intent_with_idempotency_key_calls_stripe_once(client, auth_headers, monkeypatch):
+    from types import SimpleNamespace
+    from app.routes import payment_routes
+
+    calls = []
+
+    def fake_create(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(client_secret="secret_1", id=f"pi_{len(calls)}")
+
+    monkeypatch.setattr(payment_routes.stripe.PaymentIntent, "create", fake_create)
+    me = (await client.get("/auth/me", headers=auth_headers)).json()
+    order = (await _seed_orders(me["id"], 1))[0]
+
+    headers = {**auth_headers, "Idempotency-Key": "pago-1"}
+    body = {"order_id": order["_id"]}
+    first = await client.post("/payments/create-payment-intent", json=body, headers=headers)
+    retry = await client.post("/payments/create-payment-intent", json=body, headers=headers)
+
+    assert first.json() == retry.json() == {"client_secret": "secret_1", "payment_intent_id": "pi_1", "amount": 10.0}
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert len(calls) == 1
+    assert calls[0]["idempotency_key"] == f"pi:{me['id']}:pago-1"
+
+    other = await client.post("/payments/create-payment-intent", json={"order_id": "000000000000000000000000"},
+                              headers=headers)
+    assert other.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_reorder_as_order_places_revalidated_order(client, auth_headers, admin_headers, bulk_write):
+    from app.services.order_services import order_collection
+
+    a = await _create_product(client, admin_headers, "Repetir A", 5, price=10.0)
+    b = await _create_product(client, admin_headers, "Repetir B", 1, price=4.0)
+    me = (await client.get("/auth/me", headers=auth_headers)).json()
+    past = await order_collection.insert_one({
+        "user_id": me["id"],
+        "items": [
+            {"product_id": a, "name": "Repetir A", "price": 8.0, "quantity": 2, "image": None},
+            {"product_id": b, "name": "Repetir B", "price": 4.0, "quantity": 3, "image": None},
+        ],
+        "total": 28.0,
+        "status": "delivered",
+        "created_at": datetime.utcnow(),
+    })
+
+    headers = {**auth_headers, "Idempotency-Key": "repetir-1"}
+    response = await client.post(f"/orders/{past.inserted_id}/reorder", params={"mode": "order"}, headers=headers)
+    body = response.json()
+    assert response.status_code == 200
+    assert {i["product_id"]: i["quantity"] for i in body["order"]["items"]} == {a: 2, b: 1}
+    assert body["order"]["total"] == 24.0
+    assert body["adjusted"] == [{"product_id": b, "requested": 3, "available": 1}]
+    assert body["price_changed"] == [{"product_id": a, "old_price": 8.0, "price": 10.0}]
+    assert (await _product(a))["stock"] == 3
+    assert (await _product(b))["stock"] == 0
+
+    retry = await client.post(f"/orders/{past.inserted_id}/reorder", params={"mode": "order"}, headers=headers)
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json()["order"]["_id"] == body["order"]["_id"]
+    assert (await _product(a))["stock"] == 3
+
+
+@pytest.mark.asyncio
+async def test_rebuild_sales_rollups_swaps_in_fresh_collections(client):
+    from app.services.analytics_service import (
+        rebuild_sales_rollups, record_order, sales_rollup_collection, sales_product_collection
+    )
+    from app.services.order_services import order_collection
+
+    await order_collection.delete_many({})
+    await sales_product_collection.insert_one({"_id": "basura", "units": 99})
+    order = {
+        "user_id": "user-rebuild",
+        "items": [
+            {"product_id": "p2", "name": "Producto Doble", "price": 5.0, "quantity": 1, "image": None},
+            {"product_id": "p2", "name": "Producto Doble", "price": 5.0, "quantity": 2, "image": None},
+        ],
+        "total": 15.0,
+        "status": "pending",
+        "created_at": datetime.utcnow() - timedelta(seconds=1),
+    }
+    await order_collection.insert_one(order)
+
+    assert await rebuild_sales_rollups() == {"orders": 1}
+    products = await sales_product_collection.find().to_list(None)
+    # el producto aparece en dos líneas pero es una sola orden
+    assert products == [{"_id": "p2", "name": "Producto Doble", "orders": 1, "units": 3, "revenue": 15.0}]
+    assert (await sales_rollup_collection.find_one({"_id": "total"}))["orders"] == 1
+    assert "units" in await sales_product_collection.index_information()
+
+    # las escrituras en vivo siguen llegando a la colección renombrada
+    await record_order({**order, "_id": "live"})
+    assert (await sales_product_collection.find_one({"_id": "p2"}))["orders"] == 2
+
+
+@pytest.mark.asyncio
+async def test_non_positive_quantities_never_add_stock(client, auth_headers, admin_headers, bulk_write):
+    from fastapi import HTTPException
+    from app.services.order_services import _place_order
+    from app.services.stock_service import reserve_stock
+
+    product_id = await _create_product(client, admin_headers, "Cantidad Negativa", 5)
+
+    for quantity in (-3, 0):
+        response = await client.post("/orders/", json={"items": [{"product_id": product_id, "quantity": quantity}]},
+                                     headers=auth_headers)
+        assert response.status_code == 422
+
+    # los caminos internos (reorder, carrito) también quedan cubiertos
+    with pytest.raises(HTTPException) as exc:
+        await _place_order("user-negativo", [{"product_id": product_id, "quantity": -3}])
+    assert exc.value.status_code == 400
+    with pytest.raises(HTTPException):
+        await reserve_stock({product_id: -3})
+
+    assert (await _product(product_id))["stock"] == 5
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_is_not_rerun_when_response_save_fails(client, monkeypatch):
+    from datetime import datetime, timedelta
+    from fastapi import HTTPException
+    from pymongo.errors import PyMongoError
+    from app.services import idempotency
+
+    collection = idempotency.idempotency_collection
+    await collection.delete_many({})
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_POLL_INTERVAL", 0.01)
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        return {"order": len(calls)}
+
+    original_update = collection.update_one
+
+    async def failing_update(*args, **kwargs):
+        raise PyMongoError("primario no disponible")
+
+    monkeypatch.setattr(collection, "update_one", failing_update)
+    # la orden se creó: el cliente recibe la respuesta aunque no se pudo guardar
+    assert await idempotency.run_idempotent("k-save", "orders.create", "u1", {}, handler) == ({"order": 1}, False)
+    monkeypatch.setattr(collection, "update_one", original_update)
+
+    doc_id = "orders.create:u1:k-save"
+    assert (await collection.find_one({"_id": doc_id}))["status"] == idempotency.IN_PROGRESS
+
+    # vencido el lock, un reintento no vuelve a crear la orden
+    await collection.update_one({"_id": doc_id}, {"$set": {"locked_until": datetime.utcnow() - timedelta(seconds=1)}})
+    with pytest.raises(HTTPException) as exc:
+        await idempotency.run_idempotent("k-save", "orders.create", "u1", {}, handler)
+    assert exc.value.status_code == 409
+    assert len(calls) == 1
@@ -1,6 +1,13 @@
 import pytest
 
 
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    """Almacenamiento local en tmp_path; al terminar se restaura el anterior."""
+    import app.services.image_storage as image_storage
+    monkeypatch.setattr(image_storage, "_storage", image_storage.LocalStorage(root=tmp_path, base_url="/media"))
+
+
 @pytest.mark.asyncio
 async def test_get_products_public(client):
     response = await client.get("/products/")
@@ -48,4 +55,193 @@ async def test_get_product_by_id(client, admin_headers):
     product_id = created.json()["id"]
     response = await client.get(f"/products/{product_id}")
     assert response.status_code == 200
-    assert response.json()["id"] == product_id
\ No newline at end of file
+    assert response.json()["id"] == product_id
+
+@pytest.mark.asyncio
+async def test_get_products_paginated(client, admin_headers):
+    for i in range(3):
+        await client.post("/products/", json={
+            "name": f"Producto Página {i}",
+            "description": "Test",
+            "price": 10.0 + i,
+            "category": "paginacion",
+            "stock": 5
+        }, headers=admin_headers)
+
+    first = await client.get("/products/", params={
+        "category": "paginacion", "limit": 2, "fields": "name,price"
+    })
+    assert first.status_code == 200
+    page = first.json()
+    assert len(page["items"]) == 2
+    assert "description" not in page["items"][0]
+    assert page["next_cursor"]
+
+    second = await client.get("/products/", params={
+        "category": "paginacion", "limit": 2, "cursor": page["next_cursor"]
+    })
+    rest = second.json()
+    assert len(rest["items"]) == 1
+    assert rest["next_cursor"] is None
+    seen = {p["id"] for p in page["items"]}
+    assert rest["items"][0]["id"] not in seen
+
+
+@pytest.mark.asyncio
+async def test_search_products_accents_and_prefix(client, admin_headers):
+    await client.post("/products/", json={
+        "name": "Cámara Réflex Búsqueda",
+        "description": "Sensor completo",
+        "price": 800.0,
+        "category": "cameras",
+        "stock": 3
+    }, headers=admin_headers)
+
+    response = await client.get("/products/", params={"search": "camara reflex"})
+    assert response.status_code == 200
+    assert [p["name"] for p in response.json()] == ["Cámara Réflex Búsqueda"]
+
+    typeahead = await client.get("/products/", params={"search": "busq"})
+    assert "Cámara Réflex Búsqueda" in [p["name"] for p in typeahead.json()]
+
+
+@pytest.mark.asyncio
+async def test_search_pages_follow_relevance_with_filters(client, admin_headers):
+    for i in range(6):
+        await client.post("/products/", json={
+            "name": f"Zorzal Otro {i}", "description": "Test", "price": 5.0, "category": "audio", "stock": 1
+        }, headers=admin_headers)
+    for i in range(2):
+        await client.post("/products/", json={
+            "name": f"Zorzal Elegido {i}", "description": "Test", "price": 5.0, "category": "cameras", "stock": 1
+        }, headers=admin_headers)
+
+    params = {"search": "zorzal", "category": "cameras", "limit": 1}
+    first = (await client.get("/products/", params=params)).json()
+    assert len(first["items"]) == 1
+    assert first["next_cursor"]
+
+    second = (await client.get("/products/", params={**params, "cursor": first["next_cursor"]})).json()
+    assert len(second["items"]) == 1
+    assert second["next_cursor"] is None
+    names = {first["items"][0]["name"], second["items"][0]["name"]}
+    assert names == {"Zorzal Elegido 0", "Zorzal Elegido 1"}
+
+    # un cursor cuyo producto ya no está en el ranking actual no se reinterpreta
+    from app.utils.pagination import encode_cursor
+    stale = encode_cursor({"_id": "000000000000000000000000", "rank": 0}, "rank")
+    response = await client.get("/products/", params={**params, "cursor": stale})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_patch_product_deleted_before_reread_returns_404(client, admin_headers, monkeypatch):
+    from app.routes import product_routes
+
+    created = await client.post("/products/", json={
+        "name": "Producto Fugaz", "description": "Test", "price": 3.0, "category": "test", "stock": 1
+    }, headers=admin_headers)
+    product_id = created.json()["id"]
+
+    async def gone(*args, **kwargs):
+        return None
+    monkeypatch.setattr(product_routes, "get_product_by_id_service", gone)
+
+    response = await client.patch(f"/products/{product_id}", json={"name": "Renombrado"}, headers=admin_headers)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_upload_multiple_images_local_storage(client, admin_headers, tmp_path, local_storage):
+    created = await client.post("/products/", json={
+        "name": "Producto Galería",
+        "description": "Test",
+        "price": 20.0,
+        "category": "test",
+        "stock": 5
+    }, headers=admin_headers)
+    product_id = created.json()["id"]
+
+    response = await client.post(f"/products/{product_id}/upload-images", files=[
+        ("files", ("uno.png", b"\x89PNG fake 1", "image/png")),
+        ("files", ("dos.jpg", b"\xff\xd8 fake 2", "image/jpeg")),
+    ], headers=admin_headers)
+    assert response.status_code == 200
+    urls = response.json()["image_urls"]
+    assert len(urls) == 2
+    assert response.json()["total_imagenes"] == 2
+    stored = sorted(p.read_bytes() for p in (tmp_path / "techstore" / "products").iterdir())
+    assert stored == [b"\x89PNG fake 1", b"\xff\xd8 fake 2"]
+
+    deleted = await client.delete(f"/products/{product_id}/delete-image",
+                                  params={"image_url": urls[0]}, headers=admin_headers)
+    assert deleted.status_code == 200
+    assert deleted.json()["total_imagenes"] == 1
+
+    # el mismo contenido en otro producto reutiliza la URL sin volver a subirlo
+    other = await client.post("/products/", json={
+        "name": "Producto Galería 2",
+        "description": "Test",
+        "price": 25.0,
+        "category": "test",
+        "stock": 5
+    }, headers=admin_headers)
+    repeated = await client.post(f"/products/{other.json()['id']}/upload-images", files=[
+        ("files", ("copia.jpg", b"\xff\xd8 fake 2", "image/jpeg")),
+    ], headers=admin_headers)
+    assert repeated.json()["image_urls"] == [urls[1]]
+    assert len(list((tmp_path / "techstore" / "products").iterdir())) == 1
+
+    # sigue en uso por el otro producto: no se borra del almacenamiento
+    await client.delete(f"/products/{product_id}/delete-image",
+                        params={"image_url": urls[1]}, headers=admin_headers)
+    assert len(list((tmp_path / "techstore" / "products").iterdir())) == 1
+
+
+@pytest.mark.asyncio
+async def test_delete_product_releases_its_images(client, admin_headers, tmp_path, local_storage):
+    from app.services.blob_store import blob_collection
+
+    ids = []
+    for name in ["Producto Borrable 1", "Producto Borrable 2"]:
+        created = await client.post("/products/", json={
+            "name": name, "description": "Test", "price": 9.0, "category": "test", "stock": 1
+        }, headers=admin_headers)
+        ids.append(created.json()["id"])
+        uploaded = await client.post(f"/products/{ids[-1]}/upload-images", files=[
+            ("files", ("compartida.png", b"\x89PNG compartida", "image/png")),
+        ], headers=admin_headers)
+    url = uploaded.json()["image_urls"][0]
+    folder = tmp_path / "techstore" / "products"
+    assert (await blob_collection.find_one({"url": url}))["refs"] == 2
+
+    assert (await client.delete(f"/products/{ids[0]}", headers=admin_headers)).status_code == 200
+    assert (await blob_collection.find_one({"url": url}))["refs"] == 1
+    assert len(list(folder.iterdir())) == 1
+
+    assert (await client.delete(f"/products/{ids[1]}", headers=admin_headers)).status_code == 200
+    assert await blob_collection.find_one({"url": url}) is None
+    assert list(folder.iterdir()) == []
+
+    assert (await client.delete(f"/products/{ids[1]}", headers=admin_headers)).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_delete_product_survives_storage_failure(client, admin_headers, local_storage, monkeypatch):
+    import app.services.image_storage as image_storage
+
+    created = await client.post("/products/", json={
+        "name": "Producto Sin Storage", "description": "Test", "price": 9.0, "category": "test", "stock": 1
+    }, headers=admin_headers)
+    product_id = created.json()["id"]
+    await client.post(f"/products/{product_id}/upload-images", files=[
+        ("files", ("caida.png", b"\x89PNG caida", "image/png")),
+    ], headers=admin_headers)
+
+    def failing_delete(folder, url):
+        raise RuntimeError("storage caído")
+    monkeypatch.setattr(image_storage._storage, "delete", failing_delete)
+
+    response = await client.delete(f"/products/{product_id}", headers=admin_headers)
+    assert response.status_code == 200
+    assert (await client.get(f"/products/{product_id}")).status_code == 404
@@ -0,0 +1,74 @@
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_review_aggregates_on_create_and_delete(client, auth_headers, admin_headers):
+    product = await client.post("/products/", json={
+        "name": "Producto Reviews",
+        "description": "Test",
+        "price": 30.0,
+        "category": "test",
+        "stock": 5
+    }, headers=admin_headers)
+    product_id = product.json()["id"]
+
+    first = await client.post(f"/reviews/{product_id}", json={
+        "rating": 5, "comment": "Excelente producto"
+    }, headers=auth_headers)
+    assert first.status_code == 200
+    await client.post(f"/reviews/{product_id}", json={
+        "rating": 4, "comment": "Muy bueno"
+    }, headers=admin_headers)
+
+    detail = (await client.get(f"/products/{product_id}")).json()
+    assert detail["rating"] == 4.5
+    assert detail["rating_count"] == 2
+    assert detail["rating_histogram"] == {"4": 1, "5": 1}
+
+    deleted = await client.delete(f"/reviews/{first.json()['id']}", headers=auth_headers)
+    assert deleted.status_code == 200
+
+    detail = (await client.get(f"/products/{product_id}")).json()
+    assert detail["rating"] == 4.0
+    assert detail["rating_count"] == 1
+    assert detail["rating_histogram"]["5"] == 0
+
+
+@pytest.mark.asyncio
+async def test_reviews_page_summary_and_etag(client, auth_headers, admin_headers):
+    product = await client.post("/products/", json={
+        "name": "Producto ETag",
+        "description": "Test",
+        "price": 15.0,
+        "category": "test",
+        "stock": 5
+    }, headers=admin_headers)
+    product_id = product.json()["id"]
+    await client.post(f"/reviews/{product_id}", json={
+        "rating": 3, "comment": "Regular nomás"
+    }, headers=auth_headers)
+
+    response = await client.get(f"/reviews/{product_id}", params={"limit": 10})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["summary"]["count"] == 1
+    assert body["summary"]["histogram"]["3"] == 1
+    assert len(body["items"]) == 1
+
+    etag = response.headers["etag"]
+    cached = await client.get(f"/reviews/{product_id}", params={"limit": 10},
+                              headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    listed = await client.get(f"/reviews/{product_id}", params={"limit": 10},
+                              headers={"If-None-Match": f'"otro", {etag}'})
+    assert listed.status_code == 304
+    star = await client.get(f"/reviews/{product_id}", params={"limit": 10}, headers={"If-None-Match": "*"})
+    assert star.status_code == 304
+
+    await client.post(f"/reviews/{product_id}", json={
+        "rating": 5, "comment": "Me encantó"
+    }, headers=admin_headers)
+    fresh = await client.get(f"/reviews/{product_id}", params={"limit": 10},
+                             headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.json()["summary"]["count"] == 2
@@ -0,0 +1,50 @@
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_settings_etag_and_local_invalidation(client, admin_headers):
+    from app.services.settings_service import settings_collection, settings_cache
+
+    await settings_collection.delete_many({})
+    settings_cache.clear()
+
+    first = await client.get("/settings/store")
+    assert first.status_code == 200
+    assert first.json()["name"] == "TechStore"
+    etag = first.headers["etag"]
+    assert not etag.startswith("W/")
+
+    not_modified = await client.get("/settings/store", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+
+    await client.put("/settings/store", json={"name": "TechStore Perú"}, headers=admin_headers)
+    updated = await client.get("/settings/store", headers={"If-None-Match": etag})
+    assert updated.status_code == 200
+    assert updated.json() == {"name": "TechStore Perú"}
+    assert updated.headers["etag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_settings_cache_sees_writes_from_other_workers(client, monkeypatch):
+    import app.services.settings_service as settings_service
+
+    await settings_service.settings_collection.delete_many({})
+    settings_service.settings_cache.clear()
+
+    before = await client.get("/settings/categories")
+    assert len(before.json()["categories"]) == 6
+
+    # otro worker escribe directo en la base: esta caché no se entera localmente
+    await settings_service.settings_collection.update_one(
+        {"key": "categories"},
+        {"$set": {"categories": []}, "$inc": {"version": 1}},
+        upsert=True
+    )
+    cached = await client.get("/settings/categories")
+    assert len(cached.json()["categories"]) == 6
+
+    # al vencer el intervalo de sondeo se compara el contador de versión
+    monkeypatch.setattr(settings_service, "SETTINGS_VERSION_POLL", 0)
+    after = await client.get("/settings/categories")
+    assert after.json()["categories"] == []
+    assert after.headers["etag"] != before.headers["etag"]
@@ -0,0 +1,62 @@
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_admin_user_listing_filters_and_pages(client, admin_headers):
+    for i, name in enumerate(["Zoë Álvarez", "Zoe Bravo", "Zoé Castro"]):
+        await client.post("/auth/register", json={
+            "name": name,
+            "email": f"Zoe{i}@lista.com" if i == 1 else f"zoe{i}@lista.com",
+            "password": "test1234"
+        })
+
+    # prefijo de nombre sin tildes ni mayúsculas
+    by_name = await client.get("/users/", params={"name": "ZOE"}, headers=admin_headers)
+    assert [u["email"] for u in by_name.json()] == ["zoe0@lista.com", "Zoe1@lista.com", "zoe2@lista.com"]
+    assert "hashed_password" not in by_name.json()[0]
+
+    # la parte local guardada con mayúsculas también coincide
+    first = await client.get("/users/", params={"email": "ZOE", "limit": 2, "count": True},
+                             headers=admin_headers)
+    body = first.json()
+    assert [u["email"] for u in body["items"]] == ["zoe0@lista.com", "Zoe1@lista.com"]
+    assert body["total"] == 3 and body["exact"] is True
+
+    second = await client.get("/users/", params={"email": "zoe", "limit": 2, "cursor": body["next_cursor"]},
+                              headers=admin_headers)
+    assert [u["email"] for u in second.json()["items"]] == ["zoe2@lista.com"]
+    assert second.json()["next_cursor"] is None
+
+    admins = await client.get("/users/", params={"role": "admin"}, headers=admin_headers)
+    assert {u["role"] for u in admins.json()} == {"admin"}
+
+    invalid = await client.get("/users/", params={"role": "root"}, headers=admin_headers)
+    assert invalid.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_backfill_user_keys_makes_legacy_users_searchable(client, admin_headers):
+    from datetime import datetime
+    from app.services.user_service import backfill_user_keys, user_collection
+
+    await user_collection.insert_one({
+        "name": "Úrsula Antigua", "email": "Ursula.Antigua@viejo.com", "role": "customer",
+        "created_at": datetime.utcnow(),
+    })
+    assert (await client.get("/users/", params={"email": "ursula"}, headers=admin_headers)).json() == []
+
+    assert (await backfill_user_keys())["updated"] >= 1
+    found = (await client.get("/users/", params={"email": "ursula"}, headers=admin_headers)).json()
+    assert [u["email"] for u in found] == ["Ursula.Antigua@viejo.com"]
+    by_name = (await client.get("/users/", params={"name": "ursula"}, headers=admin_headers)).json()
+    assert [u["email"] for u in by_name] == ["Ursula.Antigua@viejo.com"]
+
+
+@pytest.mark.asyncio
+async def test_unpaginated_user_listing_is_capped(client, admin_headers, monkeypatch):
+    from app.services import user_service
+
+    monkeypatch.setattr(user_service, "USERS_LIST_CAP", 2)
+    response = await client.get("/users/", headers=admin_headers)
+    assert response.status_code == 200
+    assert len(response.json()) == 2